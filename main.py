@@ -1,6 +1,24 @@
 """Main program."""
 
-from utility.initialize_program import *
-from user_interface.desktop.ui import DesktopApp
 
-DesktopApp().mainloop()
+def main() -> None:
+    """Start the program."""
+    # imported here and not at the top, the render worker processes
+    # import this module again and must not set up the program
+    from utility.initialize_program import initialize_program
+
+    initialize_program()
+
+    from utility.cache_manager import CACHE_MANAGER
+    from user_interface.desktop.ui import DesktopApp
+
+    # keep the cache between launches, only what expired or went over
+    # the size budget is removed, least recently used first
+    CACHE_MANAGER.scan()
+    CACHE_MANAGER.evict()
+
+    DesktopApp().mainloop()
+
+
+if __name__ == "__main__":
+    main()
@@ -36,8 +36,15 @@ class StoryDefaultSettings:
     )
     font: Literal["default", "Futura", "Monosans"] = "default"
     text_color: Literal["white", "yellow", "violet", "blue"] = "yellow"
-    text_style: Literal["1 word", "3 words"] = "3 words"
+    text_style: Literal["1 word", "2 words", "3 words", "4 words", "sentence"] = (
+        "3 words"
+    )
     text_stroke: int = 5
+    render_quality: Literal["final", "draft", "draft first 5s"] = "final"
+    word_timings: Literal["local", "deepgram"] = "local"
+    render_engine: Literal["threaded", "segments", "moviepy"] = "threaded"
+    # 0 for one worker process per core
+    render_workers: int = 0
 
 
 @dataclass
@@ -15,5 +15,9 @@ class StoryWindowValues:
     voice_model: Literal["aura-arcas-en", "aura-luna-en", "aura-asteria-en"]
     text_font: Literal["default", "Futura", "Monosans"]
     text_color: Literal["white", "yellow", "violet", "blue"]
-    text_style: Literal["1 word", "3 words"]
+    text_style: Literal["1 word", "2 words", "3 words", "4 words", "sentence"]
     text_stroke: int
+    render_quality: Literal["final", "draft", "draft first 5s"]
+    word_timings: Literal["local", "deepgram"]
+    render_engine: Literal["threaded", "segments", "moviepy"]
+    render_workers: int
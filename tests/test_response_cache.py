@@ -0,0 +1,112 @@
+"""Tests of the text model response cache."""
+
+import unittest
+from tempfile import TemporaryDirectory
+from unittest.mock import patch
+
+from models.config_data import ApiDefaultSettings, ConfigData, StoryDefaultSettings
+from utility.generate_text import GenerateText
+from utility.response_cache import ResponseCache
+
+# the result passed to the done callback of GenerateText
+Result = tuple[str, bool, str | None, str | None]
+
+
+def make_cache(test: unittest.TestCase) -> ResponseCache:
+    """Make a cache in a temporary folder removed after the test."""
+    directory = TemporaryDirectory()
+    test.addCleanup(directory.cleanup)
+    return ResponseCache(directory=directory.name, max_variants=3)
+
+
+class ResponseCacheTest(unittest.TestCase):
+    """Rotation of the cached variants of a request."""
+
+    def test_fetches_until_max_variants(self):
+        cache = make_cache(self)
+        key = cache.get_key("Openai", "gpt-4o", "prompt", {"stream": False})
+        for text in ["first", "second"]:
+            self.assertIsNone(cache.get(key))
+            cache.add(key, text)
+
+        self.assertIsNone(cache.get(key))
+
+    def test_gives_each_variant_once_then_fetches_again(self):
+        cache = make_cache(self)
+        key = cache.get_key("Openai", "gpt-4o", "prompt", {"stream": False})
+        for text in ["first", "second", "third"]:
+            cache.add(key, text)
+
+        self.assertEqual(
+            [cache.get(key) for _ in range(3)], ["first", "second", "third"]
+        )
+        self.assertIsNone(cache.get(key))
+
+        # the oldest variant is dropped for the new one
+        cache.add(key, "fourth")
+        self.assertEqual(
+            [cache.get(key) for _ in range(3)], ["second", "third", "fourth"]
+        )
+        self.assertIsNone(cache.get(key))
+
+    def test_keys_differ_by_params(self):
+        cache = make_cache(self)
+        self.assertNotEqual(
+            cache.get_key("Openai", "gpt-4o", "prompt", {"stream": False}),
+            cache.get_key("Openai", "gpt-4o", "prompt", {"stream": True}),
+        )
+
+
+class GenerateTextCacheTest(unittest.TestCase):
+    """Cached variants served by GenerateText, unless a new one is forced."""
+
+    def _request(
+        self, cache: ResponseCache, config: ConfigData, force_new: bool = False
+    ) -> Result:
+        results: list[Result] = []
+        with patch("utility.generate_text.RESPONSE_CACHE", cache):
+            GenerateText(
+                idea="a door",
+                config_object=config,
+                done_callback=lambda *result: results.append(result),
+                force_new=force_new,
+            ).request()
+        return results[-1]
+
+    def _make_filled_cache(self, config: ConfigData) -> ResponseCache:
+        cache = make_cache(self)
+        with patch("utility.generate_text.RESPONSE_CACHE", cache):
+            generate_text = GenerateText(
+                idea="a door", config_object=config, done_callback=lambda *_: None
+            )
+            self.assertIsNone(generate_text._get_cached_response())
+
+        for text in ["first", "second", "third"]:
+            cache.add(generate_text._cache_key, text)
+        return cache
+
+    def test_serves_cached_variants(self):
+        config = ConfigData(
+            StoryDefaultSettings(text_model="Gemini"), ApiDefaultSettings()
+        )
+        cache = self._make_filled_cache(config)
+
+        self.assertEqual(self._request(cache, config), ("first", False, None, None))
+        self.assertEqual(self._request(cache, config), ("second", False, None, None))
+
+    def test_force_new_skips_the_cache(self):
+        # no token, a request that reaches the service fails right away
+        config = ConfigData(
+            StoryDefaultSettings(text_model="Gemini"), ApiDefaultSettings()
+        )
+        cache = self._make_filled_cache(config)
+
+        text, failed, title, _message = self._request(cache, config, force_new=True)
+        self.assertEqual((text, failed, title), ("", True, "No gemini token found!"))
+
+        # the forced request did not use up a cached variant
+        self.assertEqual(self._request(cache, config), ("first", False, None, None))
+
+
+if __name__ == "__main__":
+    unittest.main()
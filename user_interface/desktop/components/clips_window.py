@@ -4,8 +4,8 @@ Shows all the available clips from the assets/clips
 or download new clips using yt-dlp.
 """
 
-from os import listdir, remove
-from os.path import isfile, join
+from os import remove
+from os.path import basename, isfile
 from platform import system
 import threading
 from typing import Any, override
@@ -16,17 +16,19 @@ from customtkinter import (
     CTkImage,
     CTkLabel,
     CTkProgressBar,
-    CTkScrollableFrame,
     CTkToplevel,
-    ThemeManager,
     Variable,
 )
 from tkinter import messagebox
 from PIL import Image
 
 from models.config_data import ConfigData
+from user_interface.desktop.components.virtual_list import ListItem, VirtualList
+from utility.library_watcher import LIBRARY_WATCHER
+from utility.media_index import MEDIA_INDEX
+from utility.proxy import PROXY_CACHE
+from utility.thumbnail_cache import THUMBNAIL_CACHE
 from utility.tools import download_youtube_video, human_readable_size, tkinter_font
-from utility.vidgen_api import VidGen
 
 EXAMPLE_YOUTUBE_LINKS = [
     # Note:
@@ -70,7 +72,7 @@ class ClipsWindow(CTkFrame):
         self._left_container: CTkFrame
         self._left_container_inner_left: CTkFrame
         self._left_container_inner_right: CTkFrame
-        self._clip_list_container: CTkScrollableFrame
+        self._clip_list: VirtualList
         self._right_container: CTkFrame
 
         # some values needed
@@ -78,9 +80,11 @@ class ClipsWindow(CTkFrame):
 
         # important variables
         self._config_data: ConfigData = config_data
-        self._clip_list_widgets: list[CTkButton] = []
-        self._previous_selected: CTkButton | None = None
         self._clip_thumbnail_preview: CTkLabel
+        self._clip_metadata_label: CTkLabel
+        self._selected_clip_path: str | None = None
+        self._preview_thumbnail: CTkImage | None = None
+        self._preview_strip: list[CTkImage] = []
         self._progress_variable: Variable = Variable(value=0)
 
         # setup containers
@@ -123,13 +127,16 @@ class ClipsWindow(CTkFrame):
             font=tkinter_font(weight="bold"),
         ).pack(anchor="w", padx=20, pady=(20, 0))
 
-        self._clip_list_container = CTkScrollableFrame(
-            master=self._left_container_inner_left
+        # the thumbnails of the visible rows are made before they are clicked
+        self._clip_list = VirtualList(
+            master=self._left_container_inner_left,
+            command=self._on_clip_clicked,
+            on_visible=THUMBNAIL_CACHE.prefetch,
         )
-        self._clip_list_container.pack(fill="both")
+        self._clip_list.pack(expand=True, fill="both", padx=(8, 0))
 
-        # load clips to ui
-        self._load_clips_to_ui()
+        # load clips to ui, then keep it current with the watcher
+        LIBRARY_WATCHER.subscribe("assets/clips/", self._on_clips_changed)
 
     def _setup_left_container_inner_right_widgets(self):
         """Set up widgets for the lest side of container on inner left.
@@ -153,6 +160,14 @@ class ClipsWindow(CTkFrame):
         )
         self._clip_thumbnail_preview.pack(pady=(0, 8))
 
+        # scrub through the contact sheet of the clip on hover
+        self._clip_thumbnail_preview.bind("<Motion>", self._on_preview_hover)
+        self._clip_thumbnail_preview.bind("<Leave>", self._on_preview_leave)
+
+        # duration, resolution and codec of the selected clip
+        self._clip_metadata_label = CTkLabel(master=center_frame, text="")
+        self._clip_metadata_label.pack(pady=(0, 8))
+
         CTkButton(
             master=center_frame,
             text="delete",
@@ -161,41 +176,37 @@ class ClipsWindow(CTkFrame):
             command=self._on_delete_clip_clicked,
         ).pack(fill="x")
 
-    def _load_clips_to_ui(self):
-        """Load clips as list to UI.
-
-        Notes:
-            Loaded clips are not videos but as text.
+    def _on_clips_changed(self, added: list[str], removed: list[str]):
+        """Apply the clips added or removed on the Tk thread.
 
-            The thumbnails are only shown after clicking them
-            so they are temporarily loaded one by one, and freeing
-            them after not showing.
+        Args:
+            added (list[str]): The paths of the new or changed clips.
+            removed (list[str]): The paths of the removed clips.
 
         """
-        # remove the current clip widgets
-        for clip_widget in self._clip_list_widgets:
-            clip_widget.destroy()
+        self.after(0, self._apply_clip_changes, added, removed)
 
-        # reset variables
-        self._clip_list_widgets = []
-        self._previous_selected = None
+    def _apply_clip_changes(self, added: list[str], removed: list[str]):
+        """Apply the clips added or removed to the list.
 
-        # refresh the clips
-        list_of_clips = listdir("assets/clips/")
+        Notes:
+            Loaded clips are not videos but as text.
 
-        for clip_name in list_of_clips:
-            clip_widget = CTkButton(
-                master=self._clip_list_container,
-                text=clip_name,
-                anchor="w",
-                fg_color="transparent",
-            )
-            clip_widget.pack(padx=(8, 0), anchor="w", fill="x")
-            clip_widget.configure(
-                command=lambda widget=clip_widget: self._on_clip_clicked(widget)
-            )
+            Only the clips that changed are touched on the list,
+            the rest stays as is.
 
-            self._clip_list_widgets.append(clip_widget)
+        """
+        self._clip_list.apply_changes(
+            added=[
+                ListItem(
+                    key=clip_path,
+                    text=basename(clip_path),
+                    sort_key=basename(clip_path).lower(),
+                )
+                for clip_path in added
+            ],
+            removed=removed,
+        )
 
     def _setup_right_container_widgets(self):
         """Set up widgets for the right side of container.
@@ -254,53 +265,158 @@ class ClipsWindow(CTkFrame):
         """Render the component to the main window."""
         super().pack(expand=True, fill="both", side="left", anchor="w")
 
-    def _on_clip_clicked(self, widget: CTkButton):
+    def _on_clip_clicked(self, item: ListItem):
         """Handle when clip was clicked.
 
         Args:
-            widget (customtkinter.CTkButton): The widget button of a clip.
+            item (ListItem): The list item of a clip, keyed by its path.
 
         Warning:
             Add error handling when loading a video
             returns error.
 
         """
-        # don't process on same widget clicked
-        if self._previous_selected == widget:
+        # don't process on same clip clicked
+        if self._selected_clip_path == item.key:
             return
 
-        if self._previous_selected:
-            self._previous_selected.configure(fg_color="transparent", hover=True)
-
         # load image
-        vidgen = VidGen()
-        clip_path = join("assets/clips/", widget.cget("text"))
-        vidgen.load_background_video(clip_path)
-        image_bytes = vidgen.get_render_image()
-        vidgen.close()
-        thumbnail = CTkImage(
-            light_image=image_bytes, dark_image=image_bytes, size=(200, 420)
+        self._selected_clip_path = item.key
+        self._show_clip_preview(self._selected_clip_path)
+
+        # a clip not indexed yet is read by ffmpeg, not on the Tk thread
+        self._clip_metadata_label.configure(text="")
+        threading.Thread(
+            target=self._load_clip_metadata, args=(item.key,), daemon=True
+        ).start()
+
+    def _show_clip_preview(self, clip_path: str):
+        """Show the thumbnail of the selected clip.
+
+        Args:
+            clip_path (str): The path of the clip.
+
+        Notes:
+            Thumbnails not made yet are requested, and this is called
+            again on the Tk thread once ready.
+
+        """
+        # another clip was selected while the thumbnail was being made
+        if clip_path != self._selected_clip_path:
+            return
+
+        thumbnail = THUMBNAIL_CACHE.get_thumbnail(clip_path)
+        if thumbnail is None:
+            self._clip_thumbnail_preview.configure(text="Loading...")
+            THUMBNAIL_CACHE.request(
+                clip_path,
+                on_ready=self._on_thumbnail_ready,
+            )
+            return
+
+        self._preview_thumbnail = CTkImage(
+            light_image=thumbnail, dark_image=thumbnail, size=(200, 420)
         )
-        self._clip_thumbnail_preview.configure(image=thumbnail, text="")
-        widget.configure(
-            fg_color=ThemeManager.theme["CTkButton"]["fg_color"], hover=False
+        self._preview_strip = []
+        self._clip_thumbnail_preview.configure(image=self._preview_thumbnail, text="")
+        self._show_clip_strip(clip_path)
+
+    def _on_thumbnail_ready(self, clip_path: str):
+        """Show the made thumbnail of a clip on the Tk thread."""
+        self.after(0, self._show_clip_preview, clip_path)
+
+    def _on_strip_ready(self, clip_path: str):
+        """Show the made contact sheet of a clip on the Tk thread."""
+        self.after(0, self._show_clip_strip, clip_path)
+
+    def _load_clip_metadata(self, clip_path: str):
+        """Read the metadata of a clip on a thread, shown back on Tk.
+
+        Args:
+            clip_path (str): The path of the clip.
+
+        """
+        # read from the metadata index, not from the opened clip
+        try:
+            metadata = MEDIA_INDEX.get_metadata(clip_path)
+        except OSError:
+            # unreadable or removed in between
+            self.after(0, self._show_clip_metadata, clip_path, "Failed to read clip")
+            return
+
+        self.after(
+            0,
+            self._show_clip_metadata,
+            clip_path,
+            (
+                f"{metadata.duration:.0f}s | {metadata.width}x{metadata.height} | "
+                f"{metadata.fps:g}fps | {metadata.codec}"
+                f"{'' if metadata.has_audio else ' | no audio'}"
+            ),
         )
 
-        self._previous_selected = widget
+    def _show_clip_metadata(self, clip_path: str, text: str):
+        """Show the metadata of a clip if it is still the selected one."""
+        if clip_path == self._selected_clip_path:
+            self._clip_metadata_label.configure(text=text)
+
+    def _show_clip_strip(self, clip_path: str):
+        """Load the contact sheet of the selected clip for hovering.
+
+        Args:
+            clip_path (str): The path of the clip.
+
+        Notes:
+            Only the selected clip has its contact sheet made, this is
+            called again on the Tk thread once ready.
+
+        """
+        if clip_path != self._selected_clip_path:
+            return
+
+        strip = THUMBNAIL_CACHE.get_strip(clip_path)
+        if strip is None:
+            THUMBNAIL_CACHE.request_strip(
+                clip_path,
+                on_ready=self._on_strip_ready,
+            )
+            return
+
+        self._preview_strip = [
+            CTkImage(light_image=frame, dark_image=frame, size=(200, 420))
+            for frame in strip
+        ]
+
+    def _on_preview_hover(self, event: Any):
+        """Show the contact sheet frame under the mouse."""
+        if not self._preview_strip:
+            return
+
+        width = max(1, event.widget.winfo_width())
+        index = min(
+            len(self._preview_strip) - 1,
+            max(0, event.x * len(self._preview_strip) // width),
+        )
+        self._clip_thumbnail_preview.configure(image=self._preview_strip[index])
+
+    def _on_preview_leave(self, _event: Any):
+        """Show the thumbnail again when the mouse leaves."""
+        if self._preview_thumbnail is not None:
+            self._clip_thumbnail_preview.configure(image=self._preview_thumbnail)
 
     def _on_delete_clip_clicked(self):
         """Delete the selected clip.
 
         Notes:
-            the previous selected clip can be the current
-            clip after it was selected.
+            the selected clip is kept by its path, the list
+            rows are reused while scrolling.
 
         """
         # Don't do anything if none is selected
-        if not self._previous_selected:
+        if not self._selected_clip_path:
             return
 
-        clip_path = join("assets/clips/", self._previous_selected.cget("text"))
+        clip_path = self._selected_clip_path
         remove(clip_path)
 
         if not isfile(clip_path):
@@ -317,9 +433,13 @@ class ClipsWindow(CTkFrame):
             light_image=default_image, dark_image=default_image, size=(200, 420)
         )
         self._clip_thumbnail_preview.configure(image=thumbnail, text="Preview")
+        self._clip_metadata_label.configure(text="")
+        self._selected_clip_path = None
+        self._preview_thumbnail = None
+        self._preview_strip = []
 
-        # reload clips to UI
-        self._load_clips_to_ui()
+        # only the deleted clip leaves the list
+        self._clip_list.remove_item(clip_path)
 
     def _on_download_clip_clicked(self):
         """Download clip from youtube link."""
@@ -383,8 +503,11 @@ class ClipsWindow(CTkFrame):
         # update the state of the downloading progress
         def progress_hook(status: dict[str, Any]):
             if status.get("status") == "finished":
-                # reload clips after download
-                self._load_clips_to_ui()
+                # make the render-ready proxy in the background
+                if status.get("filename"):
+                    PROXY_CACHE.request_proxy(status["filename"])
+
+                # the watcher adds the downloaded clip to the list
                 self._progress_variable.set(value=0)
 
                 # enable close button
@@ -1,7 +1,6 @@
 """The sidebar content of story section from the sidebar."""
 
-from os import listdir
-from os.path import isfile, join
+from os.path import basename, join
 from platform import system
 from tkinter import messagebox, filedialog
 from typing import Any, override
@@ -26,11 +25,20 @@ from customtkinter import (
 from moviepy import AudioFileClip
 
 from exceptions.vid_gen_exceptions import NoAudioFileClip, NoVideoFileClip
+from utility.cache_manager import CACHE_MANAGER
 from utility.generate_text import GenerateText
 from utility.generate_voice import GenerateVoice
+from utility.library_watcher import LIBRARY_WATCHER
+from utility.proxy import PROXY_CACHE
 from utility.render_story import RenderStory
-from utility.tools import create_audio_filename, play_voiceover, tkinter_font
-from utility.vidgen_api import VidGen
+from utility.tools import (
+    create_audio_filename,
+    play_voiceover,
+    queue_voiceover_chunk,
+    tkinter_font,
+)
+from utility.voice_chunks import VoiceChunk
+from utility.vidgen_api import DraftSettings, VidGen
 from models.config_data import ConfigData
 from models.story_window_model import StoryWindowValues
 from utility.config_tools import save_api_config
@@ -70,7 +78,10 @@ class StoryWindow(CTkFrame):
         self._clip_path: str | None = None
         self._video_file_clip: VidGen = VidGen()
         self._stroke_label: CTkLabel
+        self._text_font_combobox: CTkComboBox
         self._stroke_save_schedule: str | None = None
+        self._pending_voiceover_chunks: list[str] = []
+        self._voiceover_chunk_schedule: str | None = None
 
         # values get and set
         self._theme_variable: Variable = Variable(value="Horror")
@@ -82,6 +93,10 @@ class StoryWindow(CTkFrame):
         self._text_color_variable: Variable = Variable(value="yellow")
         self._text_style_variable: Variable = Variable(value="3 words")
         self._text_stroke_variable: IntVar = IntVar(value=5)
+        self._render_quality_variable: Variable = Variable(value="final")
+        self._word_timings_variable: Variable = Variable(value="local")
+        self._render_engine_variable: Variable = Variable(value="threaded")
+        self._render_workers_variable: Variable = Variable(value="auto")
 
         # left and right container
         self._left_side_container: CTkFrame
@@ -92,6 +107,8 @@ class StoryWindow(CTkFrame):
 
         # control widgets
         self._generate_idea_button: CTkButton
+        self._voiceover_play_button: CTkButton
+        self._randomize_button: CTkButton
         self._render_progress_variable: Variable = Variable(value=0)
         self._progress_label_indicator: CTkLabel
         self._render_close_button: CTkButton
@@ -231,9 +248,10 @@ class StoryWindow(CTkFrame):
         self._voice_model_variable.set(
             value=self._config_data.story_settings.voice_model
         )
-        CTkButton(
+        self._voiceover_play_button = CTkButton(
             master=voice_model_frame, text="Play", command=self._on_voiceover_play
-        ).pack(anchor="e", padx=16, pady=(8, 16))
+        )
+        self._voiceover_play_button.pack(anchor="e", padx=16, pady=(8, 16))
 
     def _setup_video_options_settings(self):
         """Set up video options widgets."""
@@ -259,12 +277,16 @@ class StoryWindow(CTkFrame):
             text="Randomize position",
             font=tkinter_font(16, "bold"),
         ).pack(side="left", anchor="w", padx=16, pady=(0, 16))
-        CTkButton(
+        self._randomize_button = CTkButton(
             master=randomize_frame, text="randomize", command=self._on_randomize_clip
-        ).pack(anchor="e", padx=16, pady=(0, 16))
+        )
+        self._randomize_button.pack(anchor="e", padx=16, pady=(0, 16))
 
-        # text font
-        font_files = listdir("assets/fonts/")
+        # text font, listed from the watcher index
+        font_files = sorted(
+            basename(font_path)
+            for font_path in LIBRARY_WATCHER.get_files("assets/fonts/")
+        )
         text_font_frame = CTkFrame(master=video_options_frame, fg_color="transparent")
         text_font_frame.pack(fill="x", expand=True)
         CTkLabel(
@@ -272,13 +294,17 @@ class StoryWindow(CTkFrame):
             text="Text font",
             font=tkinter_font(16, "bold"),
         ).pack(side="left", anchor="w", padx=16, pady=(0, 16))
-        CTkComboBox(
+        self._text_font_combobox = CTkComboBox(
             master=text_font_frame,
             values=font_files,
             font=tkinter_font(),
             variable=self._text_font_variable,
             command=lambda _: self._on_choose_font_select,
-        ).pack(anchor="e", padx=16, pady=(0, 16))
+        )
+        self._text_font_combobox.pack(anchor="e", padx=16, pady=(0, 16))
+
+        # fonts added or removed later show up on the combobox
+        LIBRARY_WATCHER.subscribe("assets/fonts/", self._on_fonts_changed)
 
         #   validate font availability
         if self._config_data.story_settings.font not in font_files:
@@ -310,7 +336,7 @@ class StoryWindow(CTkFrame):
         ).pack(side="left", anchor="w", padx=16, pady=(0, 16))
         CTkComboBox(
             master=text_style_frame,
-            values=["1 word", "3 words"],
+            values=["1 word", "2 words", "3 words", "4 words", "sentence"],
             variable=self._text_style_variable,
             command=lambda _: self._save_story_settings_to_config(),
         ).pack(anchor="e", padx=16, pady=(0, 16))
@@ -344,6 +370,91 @@ class StoryWindow(CTkFrame):
             value=self._config_data.story_settings.text_stroke
         )
 
+        # render quality
+        # drafts are quick previews for checking the captions and font
+        render_quality_frame = CTkFrame(
+            master=video_options_frame, fg_color="transparent"
+        )
+        render_quality_frame.pack(fill="x", expand=True)
+        CTkLabel(
+            master=render_quality_frame,
+            text="Render quality",
+            font=tkinter_font(16, "bold"),
+        ).pack(side="left", anchor="w", padx=16, pady=(0, 16))
+        CTkComboBox(
+            master=render_quality_frame,
+            values=["final", "draft", "draft first 5s"],
+            variable=self._render_quality_variable,
+            command=lambda _: self._save_story_settings_to_config(),
+        ).pack(anchor="e", padx=16, pady=(0, 16))
+        self._render_quality_variable.set(
+            value=self._config_data.story_settings.render_quality
+        )
+
+        # word timings
+        # local aligns the known script on the audio, deepgram uploads it
+        word_timings_frame = CTkFrame(
+            master=video_options_frame, fg_color="transparent"
+        )
+        word_timings_frame.pack(fill="x", expand=True)
+        CTkLabel(
+            master=word_timings_frame,
+            text="Word timings",
+            font=tkinter_font(16, "bold"),
+        ).pack(side="left", anchor="w", padx=16, pady=(0, 16))
+        CTkComboBox(
+            master=word_timings_frame,
+            values=["local", "deepgram"],
+            variable=self._word_timings_variable,
+            command=lambda _: self._save_story_settings_to_config(),
+        ).pack(anchor="e", padx=16, pady=(0, 16))
+        self._word_timings_variable.set(
+            value=self._config_data.story_settings.word_timings
+        )
+
+        # render engine
+        # segments renders parts of the video on worker processes, it
+        # needs the proxy of the clip
+        render_engine_frame = CTkFrame(
+            master=video_options_frame, fg_color="transparent"
+        )
+        render_engine_frame.pack(fill="x", expand=True)
+        CTkLabel(
+            master=render_engine_frame,
+            text="Render engine",
+            font=tkinter_font(16, "bold"),
+        ).pack(side="left", anchor="w", padx=16, pady=(0, 16))
+        CTkComboBox(
+            master=render_engine_frame,
+            values=["threaded", "segments", "moviepy"],
+            variable=self._render_engine_variable,
+            command=lambda _: self._save_story_settings_to_config(),
+        ).pack(anchor="e", padx=16, pady=(0, 16))
+        self._render_engine_variable.set(
+            value=self._config_data.story_settings.render_engine
+        )
+
+        # render workers of the segments engine, auto is one per core
+        render_workers_frame = CTkFrame(
+            master=video_options_frame, fg_color="transparent"
+        )
+        render_workers_frame.pack(fill="x", expand=True)
+        CTkLabel(
+            master=render_workers_frame,
+            text="Render workers",
+            font=tkinter_font(16, "bold"),
+        ).pack(side="left", anchor="w", padx=16, pady=(0, 16))
+        CTkComboBox(
+            master=render_workers_frame,
+            values=["auto", "2", "4", "8"],
+            variable=self._render_workers_variable,
+            command=lambda _: self._save_story_settings_to_config(),
+        ).pack(anchor="e", padx=16, pady=(0, 16))
+        render_workers = self._config_data.story_settings.render_workers
+        self._render_workers_variable.set(
+            value=str(render_workers) if render_workers else "auto"
+        )
+
     def _get_idea_entry_value(self):
         """Get the value of entry from idea entry."""
         if self._idea_entry:
@@ -370,8 +481,17 @@ class StoryWindow(CTkFrame):
             text_color=self._text_color_variable.get(),
             text_style=self._text_style_variable.get(),
             text_stroke=self._text_stroke_variable.get(),
+            render_quality=self._render_quality_variable.get(),
+            word_timings=self._word_timings_variable.get(),
+            render_engine=self._render_engine_variable.get(),
+            render_workers=self._get_render_workers_value(),
         )
 
+    def _get_render_workers_value(self) -> int:
+        """Get the render workers, 0 for auto or an invalid value."""
+        value = str(self._render_workers_variable.get())
+        return int(value) if value.isdigit() else 0
+
     def _save_story_settings_to_config(self):
         """Save story settings to `config.json` local file."""
         story_windows_values = self._get_all_values()
@@ -384,6 +504,18 @@ class StoryWindow(CTkFrame):
         self._config_data.story_settings.text_color = story_windows_values.text_color
         self._config_data.story_settings.text_style = story_windows_values.text_style
         self._config_data.story_settings.text_stroke = story_windows_values.text_stroke
+        self._config_data.story_settings.render_quality = (
+            story_windows_values.render_quality
+        )
+        self._config_data.story_settings.word_timings = (
+            story_windows_values.word_timings
+        )
+        self._config_data.story_settings.render_engine = (
+            story_windows_values.render_engine
+        )
+        self._config_data.story_settings.render_workers = (
+            story_windows_values.render_workers
+        )
 
         save_api_config(config_object=self._config_data)
 
@@ -443,6 +575,9 @@ class StoryWindow(CTkFrame):
 
         self._clip_path = clip
         self._video_file_clip.load_background_video(self._clip_path)
+
+        # clips without a proxy yet get one for the next renders
+        PROXY_CACHE.request_proxy(self._clip_path)
         font_path = join("assets/fonts", self._config_data.story_settings.font)
         self._video_file_clip.load_font(font_path)
 
@@ -475,14 +610,82 @@ class StoryWindow(CTkFrame):
         )
 
         # check if audio is already generated
-        is_voice_generated = True
-        if not isfile(filename):
-            # generate an audio
-            generate_voice = GenerateVoice(
-                script=script_context, config_data=self._config_data
+        if CACHE_MANAGER.lookup(filename):
+            self._on_voiceover_generated(filename, True, play_whole=True)
+            return
+
+        # generate an audio, the sentences play as soon as they are made
+        self._pending_voiceover_chunks.clear()
+        self._voiceover_play_button.configure(state="disabled")
+        generate_voice = GenerateVoice(
+            script=script_context, config_data=self._config_data
+        )
+        thread = Thread(
+            target=self._generate_voiceover,
+            args=(generate_voice, filename),
+            daemon=True,
+        )
+        thread.start()
+
+    def _generate_voiceover(self, generate_voice: GenerateVoice, filename: str):
+        """Generate the voiceover on a thread, back to Tk for each sentence."""
+        try:
+            generate_voice.generate(on_chunk_ready=self._on_voiceover_chunk_generated)
+        except Exception as exc:
+            # any error, like a wrong token or a timeout, is shown on Tk
+            message = getattr(exc, "message", None) or str(exc)
+            self.after(0, self._on_voiceover_failed, message)
+            return
+
+        self.after(0, self._on_voiceover_generated, filename, True)
+
+    def _on_voiceover_failed(self, message: str):
+        """Show why the voiceover could not be generated."""
+        self._voiceover_play_button.configure(state="normal")
+        messagebox.showerror(
+            title="Error",
+            message=f"Failed to generate voiceover. Please try again.\n\n{message}",
+        )
+
+    def _on_voiceover_chunk_generated(self, chunk: VoiceChunk):
+        """Play a made sentence of the voiceover on the Tk thread."""
+        self.after(0, self._on_voiceover_chunk_ready, chunk)
+
+    def _on_voiceover_chunk_ready(self, chunk: VoiceChunk):
+        """Play a sentence of the voiceover after the ones before it."""
+        self._pending_voiceover_chunks.append(chunk.filename)
+
+        # a scheduled retry plays it after the waiting ones
+        if self._voiceover_chunk_schedule is None:
+            self._play_pending_voiceover_chunks()
+
+    def _play_pending_voiceover_chunks(self):
+        """Queue the waiting sentences as the player frees up."""
+        self._voiceover_chunk_schedule = None
+        while self._pending_voiceover_chunks and queue_voiceover_chunk(
+            self._pending_voiceover_chunks[0]
+        ):
+            self._pending_voiceover_chunks.pop(0)
+
+        # the player keeps one sentence waiting, try again shortly
+        if self._pending_voiceover_chunks:
+            self._voiceover_chunk_schedule = self.after(
+                100, self._play_pending_voiceover_chunks
             )
-            is_voice_generated = generate_voice.generate()
 
+    def _on_voiceover_generated(
+        self, filename: str, is_voice_generated: bool, play_whole: bool = False
+    ):
+        """Load the generated voiceover.
+
+        Args:
+            filename (str): The voiceover file.
+            is_voice_generated (bool): If the generation succeeded.
+            play_whole (bool): Play the whole file, for a cached voiceover
+                that was not played by sentence.
+
+        """
+        self._voiceover_play_button.configure(state="normal")
         if not is_voice_generated:
             messagebox.showerror(
                 title="Error",
@@ -495,7 +698,8 @@ class StoryWindow(CTkFrame):
         self._video_file_clip.add_solo_voiceover(audio_clip)
 
         # play audio preview
-        play_voiceover(filepath=filename)
+        if play_whole:
+            play_voiceover(filepath=filename)
 
     def _on_render_video(self):
         """Render video from story settings."""
@@ -573,13 +777,25 @@ class StoryWindow(CTkFrame):
             script=script_context,
             voice_model_name=self._config_data.story_settings.voice_model,
         )
-        if not isfile(audio_file):
+        if not CACHE_MANAGER.lookup(audio_file):
             # generate an audio
             generate_voice = GenerateVoice(
                 script=script_context, config_data=self._config_data
             )
-            generate_voice.generate()
-            self._video_file_clip.add_solo_voiceover(AudioFileClip(audio_file))
+            try:
+                generate_voice.generate()
+            except Exception as exc:
+                render_video_window.destroy()
+                messagebox.showerror(
+                    title="Error",
+                    message="Failed to generate voiceover. Please try again.\n\n"
+                    + (getattr(exc, "message", None) or str(exc)),
+                )
+                return
+
+        # the voiceover may be cached from an earlier launch or be the one
+        # of another script played before, always add the one of this script
+        self._video_file_clip.add_solo_voiceover(AudioFileClip(audio_file))
 
         # reset the video object
         self._video_file_clip.reset()
@@ -598,15 +814,19 @@ class StoryWindow(CTkFrame):
         filename = self._video_file_clip.get_video_filepath()
         filepath_label.configure(text=f"Rendering video - {filename[:20]}...")
 
+        # drafts use the same layout at half resolution and lower fps
+        draft = None
+        if self._config_data.story_settings.render_quality == "draft":
+            draft = DraftSettings()
+        elif self._config_data.story_settings.render_quality == "draft first 5s":
+            draft = DraftSettings(end=5)
+
         # render on thread
-        # check if config is 3 word or 1 word
-        if self._config_data.story_settings.text_style == "3 words":
-            thread = Thread(target=render_story.render_three_words)
-        elif self._config_data.story_settings.text_style == "1 word":
-            thread = Thread(target=render_story.render_one_word)
-        # default
-        else:
-            thread = Thread(target=render_story.render_three_words)
+        # with the text style from config, 1 word, N words or sentence
+        thread = Thread(
+            target=render_story.render_captions,
+            args=(self._config_data.story_settings.text_style, draft),
+        )
         thread.start()
 
     # events
@@ -622,6 +842,19 @@ class StoryWindow(CTkFrame):
             ms=300, func=self._save_story_settings_to_config
         )
 
+    def _on_fonts_changed(self, _added: list[str], _removed: list[str]):
+        """Refresh the font choices on the Tk thread."""
+        self.after(0, self._refresh_font_choices)
+
+    def _refresh_font_choices(self):
+        """Update the font choices from the watcher index."""
+        self._text_font_combobox.configure(
+            values=sorted(
+                basename(font_path)
+                for font_path in LIBRARY_WATCHER.get_files("assets/fonts/")
+            )
+        )
+
     def _on_choose_font_select(self):
         """Update font on vidgen object if new font is selected."""
         font_file_path = join("assets/fonts/", self._text_font_variable.get())
@@ -679,21 +912,50 @@ class StoryWindow(CTkFrame):
             )
             return
 
+        # the clip is indexed and the voiceover may be generated, so it
+        # runs on a thread
+        self._randomize_button.configure(state="disabled")
+        thread = Thread(target=self._randomize_clip, args=(script,), daemon=True)
+        thread.start()
+
+    def _randomize_clip(self, script: str):
+        """Randomize the clip position on a thread, back to Tk when done."""
         try:
             self._video_file_clip.randomize_clip_position(
                 script=script, config_data=self._config_data
             )
+            image = self._video_file_clip.get_render_image()
         except NoVideoFileClip:
-            messagebox.showerror(title="Error", message="Please load video first.")
-            return
-        except NoAudioFileClip:
-            messagebox.showerror(
-                title="Error", message="There is a problem loading audio."
+            self.after(
+                0, self._on_randomize_clip_done, None, "Please load video first."
             )
             return
+        except NoAudioFileClip as exc:
+            self.after(0, self._on_randomize_clip_done, None, exc.message)
+            return
+        except OSError as exc:
+            # the clip could not be read
+            self.after(0, self._on_randomize_clip_done, None, str(exc))
+            return
+
+        self.after(0, self._on_randomize_clip_done, image, None)
+
+    def _on_randomize_clip_done(
+        self, image: Image.Image | None, error_message: str | None
+    ):
+        """Show the preview of the randomized clip or the error.
+
+        Args:
+            image (Image.Image | None): The preview frame, `None` on error.
+            error_message (str | None): The error to show.
+
+        """
+        self._randomize_button.configure(state="normal")
+        if image is None:
+            messagebox.showerror(title="Error", message=error_message)
+            return
 
         # load image preview
-        image = self._video_file_clip.get_render_image()
         self._load_preview_image(image=image)
 
     @override
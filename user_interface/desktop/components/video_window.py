@@ -4,8 +4,8 @@ Shows all the generated videos from the assets/videos
 and can delete or upload to social medias.
 """
 
-from os import listdir, remove
-from os.path import getmtime, join as pjoin
+from os import remove, stat
+from os.path import basename
 from platform import system
 from threading import Thread
 from tkinter import messagebox
@@ -17,16 +17,16 @@ from customtkinter import (
     CTkFrame,
     CTkImage,
     CTkLabel,
-    CTkScrollableFrame,
     CTkToplevel,
-    ThemeManager,
 )
 
 from models.config_data import ConfigData
 from models.upload_model import UploadData
+from user_interface.desktop.components.virtual_list import ListItem, VirtualList
+from utility.library_watcher import LIBRARY_WATCHER
 from utility.tools import tkinter_font
+from utility.thumbnail_cache import THUMBNAIL_CACHE
 from utility.upload import upload_to_facebook
-from utility.vidgen_api import VidGen
 
 
 class VideoWindow(CTkFrame):
@@ -59,16 +59,14 @@ class VideoWindow(CTkFrame):
         # containers
         self._left_container: CTkFrame
         self._right_container: CTkFrame
-        self._video_list_container: CTkScrollableFrame
+        self._video_list: VirtualList
         self._right_inner_container: CTkFrame
         self._right_button_list_container: CTkFrame
 
-        # checker variables
-        self._previous_selected: CTkButton | None = None
-
         # important variables
         self._preview_image_label: CTkLabel
-        self._video_widgets: list[CTkButton] = []
+        self._preview_thumbnail: CTkImage | None = None
+        self._preview_strip: list[CTkImage] = []
         self._selected_video_path: str | None = None
         self._upload_window: CTkToplevel | None = None
 
@@ -107,8 +105,6 @@ class VideoWindow(CTkFrame):
     def pack(self, **kwargs: Any):
         """Render the component to the main window."""
         super().pack(**kwargs)
-        # load videos when widget is rendered
-        self._load_videos_to_ui()
 
     def _setup_containers(self):
         """Set up important containers."""
@@ -132,13 +128,17 @@ class VideoWindow(CTkFrame):
         ).pack(anchor="w", padx=20, pady=(20, 0))
 
         # video list
-        self._video_list_container = CTkScrollableFrame(
-            master=self._left_container, fg_color="transparent"
+        # the thumbnails of the visible rows are made before they are clicked
+        self._video_list = VirtualList(
+            master=self._left_container,
+            command=self._on_video_clicked,
+            on_visible=THUMBNAIL_CACHE.prefetch,
+            fg_color="transparent",
         )
-        self._video_list_container.pack(expand=True, fill="both", anchor="w", padx=12)
+        self._video_list.pack(expand=True, fill="both", anchor="w", padx=12)
 
-        # load videos to ui
-        self._load_videos_to_ui()
+        # load videos to ui, then keep it current with the watcher
+        LIBRARY_WATCHER.subscribe("videos/", self._on_videos_changed)
 
     def _setup_right_container_widgets(self):
         """Set up right container widgets."""
@@ -158,6 +158,10 @@ class VideoWindow(CTkFrame):
         )
         self._preview_image_label.pack(side="left", expand=False)
 
+        # scrub through the contact sheet of the video on hover
+        self._preview_image_label.bind("<Motion>", self._on_preview_hover)
+        self._preview_image_label.bind("<Leave>", self._on_preview_leave)
+
         option_frame = CTkFrame(master=inner_container, fg_color="transparent")
         option_frame.pack(side="left", expand=True, fill="x")
 
@@ -221,87 +225,159 @@ class VideoWindow(CTkFrame):
             ),
         ).pack(anchor="e")
 
-    def _load_videos_to_ui(self):
-        """Load videos to ui."""
-        # remove the current video widgets
-        for video_widget in self._video_widgets:
-            video_widget.destroy()
-
-        # refresh the video widgets
-        video_list = listdir("videos/")
-
-        # sort video by modified time
-        video_list.sort(key=lambda video: -getmtime(pjoin("videos/", video)))
-
-        for video in video_list:
-            video_path = pjoin("videos/", video)
-            video_show_name = video[:5] + "..." + video[65:]
-            video_widget = CTkButton(
-                master=self._video_list_container,
-                text=video_show_name,
-                anchor="w",
-                fg_color="transparent",
-            )
-            video_widget.pack(anchor="w", fill="x")
-            video_widget.configure(
-                command=lambda widget=video_widget, original_path=video_path: self._on_video_clicked(
-                    widget, original_path
+    def _on_videos_changed(self, added: list[str], removed: list[str]):
+        """Apply the videos added or removed on the Tk thread.
+
+        Args:
+            added (list[str]): The paths of the new or changed videos.
+            removed (list[str]): The paths of the removed videos.
+
+        """
+        self.after(0, self._apply_video_changes, added, removed)
+
+    def _apply_video_changes(self, added: list[str], removed: list[str]):
+        """Apply the videos added or removed to the list.
+
+        Notes:
+            Only the videos that changed are touched on the list,
+            the rest stays as is.
+
+        """
+        added_items = []
+        for video_path in added:
+            try:
+                modified_time = stat(video_path).st_mtime
+            except FileNotFoundError:
+                # removed again before reaching the Tk thread
+                continue
+
+            # sort video by modified time, newest first
+            video_name = basename(video_path)
+            added_items.append(
+                ListItem(
+                    key=video_path,
+                    text=video_name[:5] + "..." + video_name[65:],
+                    sort_key=-modified_time,
                 )
             )
 
-            # add them to video widgets
-            self._video_widgets.append(video_widget)
+        self._video_list.apply_changes(added=added_items, removed=removed)
 
     # button commands
-    def _on_video_clicked(self, widget: CTkButton, original_path: str):
+    def _on_video_clicked(self, item: ListItem):
         """Handle when video was clicked.
 
         Args:
-            widget (customtkinter.CTkButton): The widget button of a video.
-            original_path (str): The original path of the video
+            item (ListItem): The list item of a video, keyed by its
+                original path.
 
         """
-        # don't process on same widget clicked
-        if self._previous_selected == widget:
+        # don't process on same video clicked
+        if self._selected_video_path == item.key:
             return
 
-        if self._previous_selected:
-            self._previous_selected.configure(fg_color="transparent", hover=True)
+        self._selected_video_path = item.key
 
         # load image
-        vidgen = VidGen()
-        vidgen.load_background_video(original_path)
-        image_bytes = vidgen.get_render_image()
-        vidgen.close()
-        thumbnail = CTkImage(
-            light_image=image_bytes, dark_image=image_bytes, size=(200, 420)
+        self._show_video_preview(item.key)
+
+    def _show_video_preview(self, video_path: str):
+        """Show the thumbnail of the selected video.
+
+        Args:
+            video_path (str): The path of the video.
+
+        Notes:
+            Thumbnails not made yet are requested, and this is called
+            again on the Tk thread once ready.
+
+        """
+        # another video was selected while the thumbnail was being made
+        if video_path != self._selected_video_path:
+            return
+
+        thumbnail = THUMBNAIL_CACHE.get_thumbnail(video_path)
+        if thumbnail is None:
+            self._preview_image_label.configure(text="Loading...")
+            THUMBNAIL_CACHE.request(
+                video_path,
+                on_ready=self._on_thumbnail_ready,
+            )
+            return
+
+        self._preview_thumbnail = CTkImage(
+            light_image=thumbnail, dark_image=thumbnail, size=(200, 420)
         )
-        self._preview_image_label.configure(image=thumbnail, text="")
+        self._preview_strip = []
+        self._preview_image_label.configure(image=self._preview_thumbnail, text="")
+        self._show_video_strip(video_path)
+
+    def _on_thumbnail_ready(self, video_path: str):
+        """Show the made thumbnail of a video on the Tk thread."""
+        self.after(0, self._show_video_preview, video_path)
+
+    def _on_strip_ready(self, video_path: str):
+        """Show the made contact sheet of a video on the Tk thread."""
+        self.after(0, self._show_video_strip, video_path)
 
-        widget.configure(
-            fg_color=ThemeManager.theme["CTkButton"]["fg_color"], hover=False
+    def _show_video_strip(self, video_path: str):
+        """Load the contact sheet of the selected video for hovering.
+
+        Args:
+            video_path (str): The path of the video.
+
+        Notes:
+            Only the selected video has its contact sheet made, this is
+            called again on the Tk thread once ready.
+
+        """
+        if video_path != self._selected_video_path:
+            return
+
+        strip = THUMBNAIL_CACHE.get_strip(video_path)
+        if strip is None:
+            THUMBNAIL_CACHE.request_strip(
+                video_path,
+                on_ready=self._on_strip_ready,
+            )
+            return
+
+        self._preview_strip = [
+            CTkImage(light_image=frame, dark_image=frame, size=(200, 420))
+            for frame in strip
+        ]
+
+    def _on_preview_hover(self, event: Any):
+        """Show the contact sheet frame under the mouse."""
+        if not self._preview_strip:
+            return
+
+        width = max(1, event.widget.winfo_width())
+        index = min(
+            len(self._preview_strip) - 1,
+            max(0, event.x * len(self._preview_strip) // width),
         )
+        self._preview_image_label.configure(image=self._preview_strip[index])
 
-        self._previous_selected = widget
-        self._selected_video_path = original_path
+    def _on_preview_leave(self, _event: Any):
+        """Show the thumbnail again when the mouse leaves."""
+        if self._preview_thumbnail is not None:
+            self._preview_image_label.configure(image=self._preview_thumbnail)
 
     def _on_video_deleted(self):
         """Handle button click for deleting a video."""
         # return if nothing is selected
-        if self._previous_selected is None:
+        if self._selected_video_path is None:
             return
 
-        # previous selected can be registered as current selected
-        self._previous_selected.destroy()
-        self._previous_selected = None
-
-        # delete from local file
-        if self._selected_video_path:
-            remove(self._selected_video_path)
-            self._selected_video_path = None
+        # delete from local file, only its row leaves the list
+        remove(self._selected_video_path)
+        self._video_list.remove_item(self._selected_video_path)
+        self._selected_video_path = None
 
-        # refresh video list
-        self._load_videos_to_ui()
+        # no more scrubbing through the deleted video
+        self._preview_thumbnail = None
+        self._preview_strip = []
 
     def _on_social_upload_clicked(self, platform_type: str):
         """Handle upload to social media.
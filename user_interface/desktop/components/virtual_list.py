@@ -0,0 +1,273 @@
+"""Virtualized list component for large libraries.
+
+Classes:
+    ListItem: A row of the list.
+    VirtualList: A list that only creates widgets for the visible rows.
+
+Notes:
+    - The items are kept in a sorted in-memory index, adding or removing
+      one is a bisect, not a rebuild of the whole list.
+    - The rows are a small pool of buttons reused while scrolling, so a
+      library of thousands of files has the same widgets as one that fits.
+
+"""
+
+from bisect import bisect_left, insort
+from dataclasses import dataclass
+from typing import Any, Callable
+from customtkinter import CTkButton, CTkFrame, CTkScrollbar, ThemeManager
+
+
+@dataclass
+class ListItem:
+    """A row of the list.
+
+    Attributes:
+        key (str): The unique key of the item, like its file path.
+        text (str): The text shown on the row.
+        sort_key (Any): The value the list is sorted by, ties are sorted
+            by `key`.
+
+    """
+
+    key: str
+    text: str
+    sort_key: Any
+
+
+class VirtualList(CTkFrame):
+    """A list that only creates widgets for the visible rows.
+
+    Methods:
+        set_items(items: list[ListItem]): Replace all the items.
+        apply_changes(added: list[ListItem], removed: list[str]): Add and
+            remove many items with a single redraw.
+        add_item(item: ListItem): Add or update an item.
+        remove_item(key: str): Remove an item.
+        get_keys: Get the keys of all the items.
+        select(key: str | None): Highlight the row of an item.
+
+    """
+
+    def __init__(
+        self,
+        master: Any,
+        command: Callable[[ListItem], None],
+        row_height: int = 28,
+        on_visible: Callable[[list[str]], None] | None = None,
+        **kwargs: Any,
+    ):
+        """Initialize VirtualList.
+
+        Args:
+            master (Any): The parent widget.
+            command (Callable[[ListItem], None]): Called with the item of
+                a clicked row.
+            row_height (int): The height of a row.
+            on_visible (Callable[[list[str]], None] | None): Called with the
+                keys of the visible rows after they changed, like to load
+                what the rows show before they are clicked.
+            **kwargs (Any): What CTkFrame needs.
+
+        """
+        super().__init__(master, **kwargs)
+
+        self._command: Callable[[ListItem], None] = command
+        self._row_height: int = row_height
+        self._on_visible: Callable[[list[str]], None] | None = on_visible
+        self._visible_keys: list[str] = []
+
+        # sorted index, `_order` is what bisect works on
+        self._items: dict[str, ListItem] = {}
+        self._order: list[tuple[Any, str]] = []
+
+        self._first_index: int = 0
+        self._selected_key: str | None = None
+        self._rows: list[CTkButton] = []
+
+        self._rows_frame = CTkFrame(master=self, fg_color="transparent")
+        self._rows_frame.pack(expand=True, fill="both", side="left")
+        self._scrollbar = CTkScrollbar(master=self, command=self._on_scrollbar)
+        self._scrollbar.pack(fill="y", side="right")
+
+        # more rows are made only when the list gets taller
+        self._rows_frame.bind("<Configure>", lambda _event: self._redraw())
+        self._bind_scroll(self._rows_frame)
+
+    def set_items(self, items: list[ListItem]):
+        """Replace all the items.
+
+        Args:
+            items (list[ListItem]): The new items.
+
+        """
+        self._items = {item.key: item for item in items}
+        self._order = sorted((item.sort_key, item.key) for item in items)
+        if self._selected_key not in self._items:
+            self._selected_key = None
+        self._redraw()
+
+    def apply_changes(self, added: list[ListItem], removed: list[str]):
+        """Add and remove many items with a single redraw.
+
+        Args:
+            added (list[ListItem]): The new items, an item with the same
+                key as an existing one replaces it.
+            removed (list[str]): The keys of the removed items, unknown
+                keys are ignored.
+
+        """
+        for key in removed:
+            item = self._items.pop(key, None)
+            if item is None:
+                continue
+
+            self._remove_from_order(item)
+            if self._selected_key == key:
+                self._selected_key = None
+
+        for item in added:
+            if item.key in self._items:
+                self._remove_from_order(self._items[item.key])
+
+            self._items[item.key] = item
+            insort(self._order, (item.sort_key, item.key))
+
+        if added or removed:
+            self._redraw()
+
+    def add_item(self, item: ListItem):
+        """Add or update an item.
+
+        Args:
+            item (ListItem): The item, an item with the same key is replaced.
+
+        """
+        self.apply_changes(added=[item], removed=[])
+
+    def remove_item(self, key: str):
+        """Remove an item.
+
+        Args:
+            key (str): The key of the item, unknown keys are ignored.
+
+        """
+        self.apply_changes(added=[], removed=[key])
+
+    def get_keys(self) -> set[str]:
+        """Get the keys of all the items."""
+        return set(self._items)
+
+    def select(self, key: str | None):
+        """Highlight the row of an item.
+
+        Args:
+            key (str | None): The key of the item, `None` for no selection.
+
+        """
+        self._selected_key = key
+        self._redraw()
+
+    def _remove_from_order(self, item: ListItem):
+        """Remove an item from the sorted index."""
+        index = bisect_left(self._order, (item.sort_key, item.key))
+        if index < len(self._order) and self._order[index][1] == item.key:
+            del self._order[index]
+
+    def _get_visible_count(self) -> int:
+        """Get how many rows fit in the list."""
+        # the rows are scaled by customtkinter, the height is in pixels
+        row_pixels = self._row_height * self._get_widget_scaling()
+        return max(1, int(self._rows_frame.winfo_height() / row_pixels) + 1)
+
+    def _bind_scroll(self, widget: Any):
+        """Scroll the list with the mouse wheel over a widget."""
+        widget.bind("<MouseWheel>", self._on_mouse_wheel)
+
+        # linux sends the wheel as buttons 4 and 5
+        widget.bind("<Button-4>", lambda _event: self._scroll(-1))
+        widget.bind("<Button-5>", lambda _event: self._scroll(1))
+
+    def _redraw(self):
+        """Show the visible items on the pool of rows."""
+        visible_count = self._get_visible_count()
+
+        # keep the first row in range after items were removed
+        max_first_index = max(0, len(self._order) - visible_count + 1)
+        self._first_index = min(self._first_index, max_first_index)
+
+        while len(self._rows) < visible_count:
+            row_index = len(self._rows)
+            row = CTkButton(
+                master=self._rows_frame,
+                text="",
+                anchor="w",
+                height=self._row_height,
+                fg_color="transparent",
+                command=lambda row_index=row_index: self._on_row_clicked(row_index),
+            )
+            self._bind_scroll(row)
+            self._rows.append(row)
+
+        visible_keys = []
+        for row_index, row in enumerate(self._rows):
+            index = self._first_index + row_index
+            if row_index >= visible_count or index >= len(self._order):
+                row.place_forget()
+                continue
+
+            key = self._order[index][1]
+            visible_keys.append(key)
+            selected = key == self._selected_key
+            row.configure(
+                text=self._items[key].text,
+                fg_color=(
+                    ThemeManager.theme["CTkButton"]["fg_color"]
+                    if selected
+                    else "transparent"
+                ),
+                hover=not selected,
+            )
+            row.place(x=0, y=row_index * self._row_height, relwidth=1)
+
+        if self._order:
+            self._scrollbar.set(
+                self._first_index / len(self._order),
+                min(1, (self._first_index + visible_count - 1) / len(self._order)),
+            )
+        else:
+            self._scrollbar.set(0, 1)
+
+        if self._on_visible is not None and visible_keys != self._visible_keys:
+            self._on_visible(visible_keys)
+        self._visible_keys = visible_keys
+
+    def _scroll(self, rows: int):
+        """Scroll the list by a number of rows."""
+        self._first_index = max(0, self._first_index + rows)
+        self._redraw()
+
+    def _on_mouse_wheel(self, event: Any):
+        """Scroll on windows and macos wheels."""
+        self._scroll(-1 if event.delta > 0 else 1)
+
+    def _on_scrollbar(self, action: str, value: Any, unit: str = "units"):
+        """Scroll from the scrollbar, like a tkinter yview command."""
+        if action == "moveto":
+            self._first_index = int(float(value) * len(self._order))
+            self._redraw()
+        elif action == "scroll":
+            rows = int(value)
+            if unit == "pages":
+                rows *= self._get_visible_count() - 1
+            self._scroll(rows)
+
+    def _on_row_clicked(self, row_index: int):
+        """Select the item of a clicked row and run the command."""
+        index = self._first_index + row_index
+        if index >= len(self._order):
+            return
+
+        item = self._items[self._order[index][1]]
+        self.select(item.key)
+        self._command(item)
@@ -0,0 +1,251 @@
+"""Long-lived API clients shared by the program.
+
+Every request used to make a new client, so each call paid for a new
+TCP connection and TLS handshake, and `genai.configure` reset the gemini
+clients every time. Here one client per service and token is kept and
+reused with a keep-alive connection pool. The async clients for bulk
+pipelines are kept per event loop, since their pools belong to the loop
+that opened them.
+"""
+
+import asyncio
+import atexit
+from threading import Lock
+from typing import Any, Callable, cast
+from weakref import WeakKeyDictionary
+
+import google.generativeai as genai
+import httpx
+import requests
+from deepgram import DeepgramClient
+from openai import AsyncOpenAI, OpenAI
+
+# connections kept open between requests
+CONNECTION_LIMITS = httpx.Limits(
+    max_connections=20, max_keepalive_connections=10, keepalive_expiry=60
+)
+
+
+class _SharedTransport(httpx.BaseTransport):
+    """A connection pool the per-request clients can not close.
+
+    The deepgram sdk opens an `httpx.Client` per request and closes it
+    after, which would close the transport given to it too. The requests
+    are sent on a pool this transport does not close with them.
+    """
+
+    def __init__(self, limits: httpx.Limits):
+        """Initialize _SharedTransport.
+
+        Args:
+            limits (httpx.Limits): The connections kept open.
+
+        """
+        super().__init__()
+        self._transport: httpx.HTTPTransport = httpx.HTTPTransport(limits=limits)
+
+    def handle_request(self, request: httpx.Request) -> httpx.Response:
+        """Send a request on the shared pool."""
+        return self._transport.handle_request(request)
+
+    def close(self) -> None:
+        """Keep the pool open when a client using it closes."""
+
+    def shutdown(self) -> None:
+        """Close the connections of the pool."""
+        self._transport.close()
+
+
+class _AsyncSharedTransport(httpx.AsyncBaseTransport):
+    """An async connection pool the per-request clients can not close."""
+
+    def __init__(self, limits: httpx.Limits):
+        """Initialize _AsyncSharedTransport.
+
+        Args:
+            limits (httpx.Limits): The connections kept open.
+
+        """
+        super().__init__()
+        self._transport: httpx.AsyncHTTPTransport = httpx.AsyncHTTPTransport(
+            limits=limits
+        )
+
+    async def handle_async_request(self, request: httpx.Request) -> httpx.Response:
+        """Send a request on the shared pool."""
+        return await self._transport.handle_async_request(request)
+
+    async def aclose(self) -> None:
+        """Keep the pool open when a client using it closes."""
+
+    async def shutdown(self) -> None:
+        """Close the connections of the pool."""
+        await self._transport.aclose()
+
+
+class ApiClients:
+    """Registry of the API clients, one per service and token.
+
+    Methods:
+        get_openai(api_key, base_url): Get the openai compatible client.
+        get_async_openai(api_key, base_url): Get it for the running loop.
+        get_gemini_model(api_key, model_name, system_instruction): Get a
+            gemini model, configuring gemini only when the token changed.
+        get_deepgram(api_key): Get the deepgram client.
+        get_deepgram_transport: Get the pool to pass as `transport` to
+            the deepgram requests.
+        get_async_deepgram_transport: Get it for the running loop.
+        get_http_session: Get the session for plain HTTP requests.
+        get_async_http_client: Get it for the running loop.
+        close: Close the connections of the sync clients.
+
+    Notes:
+        The async getters must be called from inside the event loop the
+        client is used in.
+
+    """
+
+    def __init__(self):
+        """Initialize ApiClients."""
+        self._clients: dict[tuple[str, ...], Any] = {}
+        self._async_clients: WeakKeyDictionary[
+            asyncio.AbstractEventLoop, dict[tuple[str, ...], Any]
+        ] = WeakKeyDictionary()
+        self._gemini_api_key: str | None = None
+        self._lock: Lock = Lock()
+
+        atexit.register(self.close)
+
+    def _get[T](self, key: tuple[str, ...], create: Callable[[], T]) -> T:
+        """Get a client, made by `create` the first time."""
+        with self._lock:
+            client = self._clients.get(key)
+            if client is None:
+                client = self._clients[key] = create()
+
+            # a key is always made by the same `create`
+            return cast(T, client)
+
+    def _get_async[T](self, key: tuple[str, ...], create: Callable[[], T]) -> T:
+        """Get a client of the running loop, made by `create` the first time."""
+        loop = asyncio.get_running_loop()
+        with self._lock:
+            clients = self._async_clients.setdefault(loop, {})
+            client = clients.get(key)
+            if client is None:
+                client = clients[key] = create()
+            return cast(T, client)
+
+    def get_openai(self, api_key: str, base_url: str | None = None) -> OpenAI:
+        """Get the openai compatible client.
+
+        Args:
+            api_key (str): The api token.
+            base_url (str | None): The url of a compatible service, like
+                deepinfra, `None` for openai.
+
+        Returns:
+            OpenAI: The shared client, it keeps its own pool of connections.
+
+        """
+        return self._get(
+            ("openai", api_key, base_url or ""),
+            lambda: OpenAI(api_key=api_key, base_url=base_url),
+        )
+
+    def get_async_openai(
+        self, api_key: str, base_url: str | None = None
+    ) -> AsyncOpenAI:
+        """Get the async openai compatible client of the running loop.
+
+        Args:
+            api_key (str): The api token.
+            base_url (str | None): The url of a compatible service, like
+                deepinfra, `None` for openai.
+
+        Returns:
+            AsyncOpenAI: The shared client, it keeps its own pool of connections.
+
+        """
+        return self._get_async(
+            ("openai", api_key, base_url or ""),
+            lambda: AsyncOpenAI(api_key=api_key, base_url=base_url),
+        )
+
+    def get_gemini_model(
+        self, api_key: str, model_name: str, system_instruction: str
+    ) -> genai.GenerativeModel:
+        """Get a gemini model.
+
+        Args:
+            api_key (str): The api token.
+            model_name (str): The gemini model.
+            system_instruction (str): The system prompt.
+
+        Returns:
+            genai.GenerativeModel: The model, its calls share the
+                connection of the configured gemini client.
+
+        """
+        # configuring drops the gemini clients, only done for a new token
+        with self._lock:
+            if self._gemini_api_key != api_key:
+                genai.configure(api_key=api_key)
+                self._gemini_api_key = api_key
+
+        return genai.GenerativeModel(
+            model_name=model_name, system_instruction=system_instruction
+        )
+
+    def get_deepgram(self, api_key: str) -> DeepgramClient:
+        """Get the deepgram client.
+
+        Args:
+            api_key (str): The api token.
+
+        Returns:
+            DeepgramClient: The shared client, pass `get_deepgram_transport`
+                as `transport` to its requests to reuse the connections.
+
+        """
+        return self._get(("deepgram", api_key), lambda: DeepgramClient(api_key=api_key))
+
+    def get_deepgram_transport(self) -> httpx.BaseTransport:
+        """Get the connection pool of the deepgram requests."""
+        return self._get(
+            ("deepgram_transport",),
+            lambda: _SharedTransport(limits=CONNECTION_LIMITS),
+        )
+
+    def get_async_deepgram_transport(self) -> httpx.AsyncBaseTransport:
+        """Get the connection pool of the async deepgram requests."""
+        return self._get_async(
+            ("deepgram_transport",),
+            lambda: _AsyncSharedTransport(limits=CONNECTION_LIMITS),
+        )
+
+    def get_http_session(self) -> requests.Session:
+        """Get the session for plain HTTP requests, like the uploads."""
+        return self._get(("http",), requests.Session)
+
+    def get_async_http_client(self) -> httpx.AsyncClient:
+        """Get the async client for plain HTTP requests of the running loop."""
+        return self._get_async(
+            ("http",), lambda: httpx.AsyncClient(limits=CONNECTION_LIMITS)
+        )
+
+    def close(self) -> None:
+        """Close the connections of the sync clients."""
+        with self._lock:
+            clients = list(self._clients.values())
+            self._clients.clear()
+
+        for client in clients:
+            if isinstance(client, _SharedTransport):
+                client.shutdown()
+            elif isinstance(client, (OpenAI, requests.Session)):
+                client.close()
+
+
+# shared between all requests of the program
+API_CLIENTS = ApiClients()
@@ -0,0 +1,131 @@
+"""Integer premultiplied alpha blending for the render loop.
+
+The captions are static RGBA sprites, so their alpha is prepared once
+per sprite as premultiplied uint16 data. Blending a sprite into a frame
+is then a few in-place NumPy operations on reused scratch buffers,
+without float conversion and without temporary arrays per frame.
+"""
+
+from dataclasses import dataclass
+
+import numpy as np
+from PIL import ImageColor
+
+
+@dataclass
+class PreparedSprite:
+    """A sprite prepared for premultiplied blending.
+
+    Attributes:
+        premultiplied (np.ndarray): The color multiplied by the alpha,
+            shape (height, width, 3) as uint16, range 0 to 255 * 255.
+        inverse_alpha (np.ndarray): `255 - alpha`, shape (height, width, 1)
+            as uint16.
+
+    """
+
+    premultiplied: np.ndarray
+    inverse_alpha: np.ndarray
+
+
+def prepare_sprite(image: np.ndarray, alpha: np.ndarray) -> PreparedSprite:
+    """Prepare an RGBA sprite for premultiplied blending.
+
+    Args:
+        image (np.ndarray): The RGB pixels as uint8.
+        alpha (np.ndarray): The alpha pixels as uint8.
+
+    Returns:
+        PreparedSprite: The prepared sprite.
+
+    """
+    alpha_channel = alpha.astype(np.uint16)[..., None]
+    premultiplied = image.astype(np.uint16) * alpha_channel
+    inverse_alpha = np.uint16(255) - alpha_channel
+
+    return PreparedSprite(premultiplied=premultiplied, inverse_alpha=inverse_alpha)
+
+
+def tint_image(image: np.ndarray, color: str) -> np.ndarray:
+    """Recolor the white parts of an image with a tint color.
+
+    The caption sprites are a white fill with a black stroke, anti-aliased
+    pixels in between are gray. Multiplying by the tint gives the same
+    pixels as rasterizing the word again with the tint as fill color.
+
+    Args:
+        image (np.ndarray): The RGB pixels as uint8.
+        color (str): The tint color name or hex, like "yellow".
+
+    Returns:
+        np.ndarray: The tinted RGB pixels as uint8.
+
+    """
+    tint = np.array(ImageColor.getrgb(color)[:3], dtype=np.uint16)
+    tinted = (image.astype(np.uint16) * tint + 127) // 255
+
+    return tinted.astype(np.uint8)
+
+
+class BlendKernel:
+    """Blend prepared sprites into uint8 frames.
+
+    Owns the scratch buffers, they grow to the biggest sprite blended
+    and are reused for every following blend.
+
+    Methods:
+        blend(destination, premultiplied, inverse_alpha): Blend a sprite
+            into a region of a frame, in place.
+
+    """
+
+    def __init__(self):
+        """Initialize BlendKernel."""
+        self._scratch: np.ndarray = np.empty((0, 0, 3), dtype=np.uint16)
+        self._rounding: np.ndarray = np.empty((0, 0, 3), dtype=np.uint16)
+
+    def _get_scratch(self, height: int, width: int) -> tuple[np.ndarray, np.ndarray]:
+        """Get the scratch buffers as views of the needed size."""
+        scratch_height, scratch_width = self._scratch.shape[:2]
+        if height > scratch_height or width > scratch_width:
+            shape = (max(height, scratch_height), max(width, scratch_width), 3)
+            self._scratch = np.empty(shape, dtype=np.uint16)
+            self._rounding = np.empty(shape, dtype=np.uint16)
+
+        return self._scratch[:height, :width], self._rounding[:height, :width]
+
+    def blend(
+        self,
+        destination: np.ndarray,
+        premultiplied: np.ndarray,
+        inverse_alpha: np.ndarray,
+    ) -> None:
+        """Blend a sprite into a region of a frame, in place.
+
+        Computes `(destination * (255 - alpha) + color * alpha) / 255`
+        with rounding, all in uint16. The biggest value is
+        `255 * 255 + 255`, it never overflows.
+
+        Args:
+            destination (np.ndarray): The uint8 region of the frame,
+                shape (height, width, 3). It can be a view.
+            premultiplied (np.ndarray): The premultiplied color of the sprite,
+                the same height and width as the destination.
+            inverse_alpha (np.ndarray): The inverse alpha of the sprite,
+                the same height and width as the destination.
+
+        """
+        height, width = destination.shape[:2]
+        scratch, rounding = self._get_scratch(height, width)
+
+        np.multiply(destination, inverse_alpha, out=scratch)
+        np.add(scratch, premultiplied, out=scratch)
+
+        # exact division by 255 with rounding:
+        # (x + 128 + ((x + 128) >> 8)) >> 8
+        np.add(scratch, 128, out=scratch)
+        np.right_shift(scratch, 8, out=rounding)
+        np.add(scratch, rounding, out=scratch)
+        np.right_shift(scratch, 8, out=scratch)
+
+        np.copyto(destination, scratch, casting="unsafe")
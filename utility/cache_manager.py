@@ -0,0 +1,515 @@
+"""Keep the files under `cache/` within a size budget.
+
+The cache used to be wiped at every launch, throwing away paid voiceovers
+and every other content addressed file. Here the files are kept between
+launches and tracked in a manifest with their size and last access.
+When the cache goes over its budget the least recently used files are
+removed first, and some kinds of files also expire after a while.
+"""
+
+import atexit
+import json
+from contextlib import contextmanager
+from dataclasses import asdict, dataclass, field
+from os import O_CREAT, O_EXCL, O_WRONLY, close, open as open_descriptor
+from os import remove, walk
+from os.path import abspath, getmtime, getsize, isfile, join, relpath, sep
+from threading import Lock
+from time import sleep, time
+from typing import Iterator
+
+from utility.tools import atomic_write
+
+
+@dataclass
+class CacheEntry:
+    """A file in the cache.
+
+    Attributes:
+        path (str): The path relative to the cache folder.
+        category (str): The kind of file, like "audio" or "thumbnails".
+        size (int): The size in bytes.
+        created (float): The time it was stored, in seconds since epoch.
+        last_access (float): The last time it was stored or looked up.
+        hits (int): How many times it was looked up.
+
+    """
+
+    path: str
+    category: str
+    size: int
+    created: float
+    last_access: float
+    hits: int = 0
+
+
+@dataclass
+class CacheStatistics:
+    """The hit and miss counts of the cache since launch.
+
+    Attributes:
+        hits (int): Lookups of files that were in the cache.
+        misses (int): Lookups of files that were not.
+        evictions (int): Files removed to stay within the budget or TTL.
+        entries (int): Files in the cache.
+        total_bytes (int): Size of the files in the cache.
+        categories (dict[str, tuple[int, int]]): Hits and misses per category.
+
+    """
+
+    hits: int = 0
+    misses: int = 0
+    evictions: int = 0
+    entries: int = 0
+    total_bytes: int = 0
+    categories: dict[str, tuple[int, int]] = field(default_factory=dict)
+
+    def get_hit_rate(self) -> float:
+        """Get the hits over all the lookups."""
+        lookups = self.hits + self.misses
+        return self.hits / lookups if lookups else 0
+
+
+class CacheManager:
+    """Track, budget and evict the files of the cache folder.
+
+    Methods:
+        scan: Sync the manifest with the files on disk.
+        lookup(path): Check if a file is cached and count the hit or miss.
+        store(path): Track a file that was just written to the cache.
+        forget(path): Stop tracking a file that was removed.
+        evict: Remove expired files, then the least recently used ones
+            until the cache is within its budget.
+        get_statistics: Get the hit and miss counts of the cache.
+        flush: Write the manifest to disk.
+
+    Notes:
+        The render workers and other instances of the program share the
+        manifest, so it is written under a lock file and merged with what
+        the others wrote since it was loaded.
+
+    """
+
+    # files that are read right after a lookup are not evicted for a while
+    _MIN_IDLE_SECONDS: float = 60
+
+    # the manifest is written at most this often, and on exit
+    _SAVE_INTERVAL_SECONDS: float = 10
+
+    # how long to wait for the manifest lock of another process
+    _LOCK_TIMEOUT_SECONDS: float = 5
+
+    # a lock file older than this was left by a process that crashed
+    _STALE_LOCK_SECONDS: float = 30
+
+    def __init__(
+        self,
+        directory: str = "cache/",
+        max_bytes: int = 5 * 1024**3,
+        ttl_seconds: dict[str, float] | None = None,
+    ):
+        """Initialize CacheManager.
+
+        Args:
+            directory (str): The cache folder.
+            max_bytes (int): The size budget of the cache.
+            ttl_seconds (dict[str, float] | None): How long the files of a
+                category are kept since their last access, the categories
+                not listed are only evicted by the size budget.
+
+        """
+        self._directory: str = directory
+        self._manifest_path: str = join(directory, "manifest.json")
+        self._manifest_lock_path: str = self._manifest_path + ".lock"
+        self._max_bytes: int = max_bytes
+        self._ttl_seconds: dict[str, float] = (
+            ttl_seconds
+            if ttl_seconds is not None
+            else {
+                # background parts and thumbnails are cheap to make again
+                "extracts": 24 * 60 * 60,
+                "segments": 60 * 60,
+                "thumbnails": 30 * 24 * 60 * 60,
+            }
+        )
+
+        self._entries: dict[str, CacheEntry] = {}
+        # dropped since the last flush, so the merge does not bring them back
+        self._removed: set[str] = set()
+        self._total_bytes: int = 0
+        self._statistics: CacheStatistics = CacheStatistics()
+        self._category_counts: dict[str, list[int]] = {}
+        self._lock: Lock = Lock()
+        self._dirty: bool = False
+        self._last_save: float = 0
+        self._loaded: bool = False
+
+        atexit.register(self.flush)
+
+    def _get_key(self, path: str) -> str | None:
+        """Get the path relative to the cache folder, `None` if outside."""
+        key = relpath(abspath(path), abspath(self._directory))
+        if key.startswith(".."):
+            return None
+        return key.replace(sep, "/")
+
+    def _get_category(self, key: str) -> str:
+        """Get the category from the sub folder or the filename prefix."""
+        if "/" in key:
+            return key.split("/", 1)[0]
+        return key.split("_", 1)[0].split(".", 1)[0]
+
+    def _is_tracked(self, key: str) -> bool:
+        """Check if a file is managed, databases and temporary files are not."""
+        name = key.rsplit("/", 1)[-1]
+        return not (
+            key.startswith("manifest.json")
+            or name.endswith((".sqlite3", ".sqlite3-journal"))
+            or ".tmp" in name
+        )
+
+    def _load(self) -> None:
+        """Load the manifest on first use, with the lock held."""
+        if self._loaded:
+            return
+        self._loaded = True
+
+        self._entries = self._read_manifest()
+        self._total_bytes = sum(entry.size for entry in self._entries.values())
+
+    def _read_manifest(self) -> dict[str, CacheEntry]:
+        """Read the entries of the manifest on disk."""
+        if not isfile(self._manifest_path):
+            return {}
+
+        try:
+            with open(self._manifest_path, "r", encoding="utf-8") as file:
+                entries = [CacheEntry(**entry) for entry in json.load(file)]
+        except (OSError, ValueError, TypeError):
+            # broken manifest, `scan` finds the files again
+            return {}
+
+        return {entry.path: entry for entry in entries}
+
+    @contextmanager
+    def _lock_manifest(self) -> Iterator[bool]:
+        """Hold the lock file of the manifest, shared between processes.
+
+        Yields:
+            bool: If the lock was taken, `False` when another process held
+                it for too long.
+
+        """
+        deadline = time() + self._LOCK_TIMEOUT_SECONDS
+        while True:
+            try:
+                descriptor = open_descriptor(
+                    self._manifest_lock_path, O_CREAT | O_EXCL | O_WRONLY
+                )
+                break
+            except FileExistsError:
+                try:
+                    if time() - getmtime(self._manifest_lock_path) > (
+                        self._STALE_LOCK_SECONDS
+                    ):
+                        remove(self._manifest_lock_path)
+                        continue
+                except OSError:
+                    # released in between
+                    continue
+
+                if time() > deadline:
+                    yield False
+                    return
+                sleep(0.05)
+            except OSError:
+                yield False
+                return
+
+        try:
+            yield True
+        finally:
+            close(descriptor)
+            try:
+                remove(self._manifest_lock_path)
+            except OSError:
+                pass
+
+    def _merge(self, entries: dict[str, CacheEntry]) -> None:
+        """Merge the entries another process wrote, with the lock held."""
+        for key, entry in entries.items():
+            if key in self._removed:
+                continue
+
+            current = self._entries.get(key)
+            if current is None:
+                # stored by another process
+                self._entries[key] = entry
+            elif entry.last_access > current.last_access:
+                current.last_access = entry.last_access
+                current.hits = max(current.hits, entry.hits)
+
+        # dropped by another process, like by its eviction
+        for key in [key for key in self._entries if key not in entries]:
+            if not isfile(join(self._directory, key)):
+                del self._entries[key]
+
+        self._total_bytes = sum(entry.size for entry in self._entries.values())
+
+    def scan(self) -> None:
+        """Sync the manifest with the files on disk.
+
+        Files not in the manifest are added as just accessed, entries of
+        files that are gone are dropped.
+        """
+        now = time()
+        found: dict[str, int] = {}
+        for root, _, filenames in walk(self._directory):
+            for filename in filenames:
+                path = join(root, filename)
+                key = self._get_key(path)
+                if key is None or not self._is_tracked(key):
+                    continue
+                try:
+                    found[key] = getsize(path)
+                except OSError:
+                    continue
+
+        with self._lock:
+            self._load()
+            for key in list(self._entries):
+                if key not in found:
+                    self._total_bytes -= self._entries.pop(key).size
+                    self._removed.add(key)
+
+            for key, size in found.items():
+                entry = self._entries.get(key)
+                if entry is None:
+                    self._entries[key] = CacheEntry(
+                        path=key,
+                        category=self._get_category(key),
+                        size=size,
+                        created=now,
+                        last_access=now,
+                    )
+                    self._total_bytes += size
+                elif entry.size != size:
+                    self._total_bytes += size - entry.size
+                    entry.size = size
+
+            self._dirty = True
+
+    def lookup(self, path: str) -> bool:
+        """Check if a file is cached and count the hit or miss.
+
+        Args:
+            path (str): The path of the file.
+
+        Returns:
+            bool: If the file exists.
+
+        """
+        exists = isfile(path)
+        key = self._get_key(path)
+        if key is None or not self._is_tracked(key):
+            return exists
+
+        category = self._get_category(key)
+        with self._lock:
+            self._load()
+            counts = self._category_counts.setdefault(category, [0, 0])
+            if not exists:
+                self._statistics.misses += 1
+                counts[1] += 1
+                if key in self._entries:
+                    self._total_bytes -= self._entries.pop(key).size
+                    self._removed.add(key)
+                    self._dirty = True
+                return False
+
+            self._statistics.hits += 1
+            counts[0] += 1
+
+            entry = self._entries.get(key)
+            if entry is None:
+                # written before it was tracked, like by an older version
+                entry = self._track(key, category)
+            if entry is not None:
+                entry.last_access = time()
+                entry.hits += 1
+                self._dirty = True
+
+        self._save_if_due()
+        return True
+
+    def store(self, path: str) -> None:
+        """Track a file that was just written to the cache.
+
+        Args:
+            path (str): The path of the file.
+
+        """
+        key = self._get_key(path)
+        if key is None or not self._is_tracked(key):
+            return
+
+        with self._lock:
+            self._load()
+            previous = self._entries.pop(key, None)
+            if previous is not None:
+                self._total_bytes -= previous.size
+            self._removed.discard(key)
+            self._track(key, self._get_category(key))
+            over_budget = self._total_bytes > self._max_bytes
+
+        if over_budget:
+            self.evict()
+        self._save_if_due()
+
+    def _track(self, key: str, category: str) -> CacheEntry | None:
+        """Add an entry for a file on disk, with the lock held."""
+        self._removed.discard(key)
+        try:
+            size = getsize(join(self._directory, key))
+        except OSError:
+            return None
+
+        now = time()
+        entry = CacheEntry(
+            path=key, category=category, size=size, created=now, last_access=now
+        )
+        self._entries[key] = entry
+        self._total_bytes += size
+        self._dirty = True
+        return entry
+
+    def forget(self, path: str) -> None:
+        """Stop tracking a file that was removed.
+
+        Args:
+            path (str): The path of the file.
+
+        """
+        key = self._get_key(path)
+        with self._lock:
+            self._load()
+            entry = self._entries.pop(key, None) if key is not None else None
+            if entry is not None:
+                self._total_bytes -= entry.size
+                self._removed.add(entry.path)
+                self._dirty = True
+
+    def evict(self) -> int:
+        """Remove expired files, then the least recently used ones.
+
+        Returns:
+            int: The number of files removed.
+
+        Notes:
+            Files looked up or stored in the last minute are kept, they
+            may still be read by whoever looked them up.
+
+        """
+        now = time()
+        with self._lock:
+            self._load()
+            idle_entries = sorted(
+                (
+                    entry
+                    for entry in self._entries.values()
+                    if now - entry.last_access > self._MIN_IDLE_SECONDS
+                ),
+                key=lambda entry: entry.last_access,
+            )
+
+            # expired first, then the oldest until within the budget
+            victims = [
+                entry
+                for entry in idle_entries
+                if now - entry.last_access
+                > self._ttl_seconds.get(entry.category, float("inf"))
+            ]
+            remaining_bytes = self._total_bytes - sum(entry.size for entry in victims)
+            for entry in idle_entries:
+                if remaining_bytes <= self._max_bytes:
+                    break
+                if entry not in victims:
+                    victims.append(entry)
+                    remaining_bytes -= entry.size
+
+            removed = 0
+            for entry in victims:
+                try:
+                    remove(join(self._directory, entry.path))
+                except FileNotFoundError:
+                    pass
+                except OSError:
+                    # still open somewhere, like on windows
+                    continue
+
+                del self._entries[entry.path]
+                self._total_bytes -= entry.size
+                self._removed.add(entry.path)
+                removed += 1
+
+            self._statistics.evictions += removed
+            self._dirty = self._dirty or removed > 0
+
+        return removed
+
+    def get_statistics(self) -> CacheStatistics:
+        """Get the hit and miss counts of the cache since launch."""
+        with self._lock:
+            self._load()
+            return CacheStatistics(
+                hits=self._statistics.hits,
+                misses=self._statistics.misses,
+                evictions=self._statistics.evictions,
+                entries=len(self._entries),
+                total_bytes=self._total_bytes,
+                categories={
+                    category: (counts[0], counts[1])
+                    for category, counts in self._category_counts.items()
+                },
+            )
+
+    def _save_if_due(self) -> None:
+        """Write the manifest if it changed and was not written lately."""
+        if self._dirty and time() - self._last_save > self._SAVE_INTERVAL_SECONDS:
+            self.flush()
+
+    def flush(self) -> None:
+        """Write the manifest to disk if it changed.
+
+        Notes:
+            What other processes wrote since is merged in first, if their
+            lock is held for too long it is tried again on the next save.
+
+        """
+        with self._lock:
+            if not self._dirty:
+                return
+
+            with self._lock_manifest() as is_locked:
+                if not is_locked:
+                    return
+
+                self._merge(self._read_manifest())
+
+                try:
+                    with atomic_write(self._manifest_path) as temporary_path:
+                        with open(temporary_path, "w", encoding="utf-8") as file:
+                            json.dump(
+                                [asdict(entry) for entry in self._entries.values()],
+                                file,
+                            )
+                except OSError:
+                    return
+
+            self._removed.clear()
+            self._dirty = False
+            self._last_save = time()
+
+
+# shared between all caches of the program
+CACHE_MANAGER = CacheManager()
@@ -0,0 +1,568 @@
+"""Caption layout of the story video.
+
+The layout turns the transcript words into a compact caption plan,
+one row per caption event inside a NumPy structured array. The plan is
+saved as a `.npy` file under `cache/layouts/` and keyed by the
+transcript and the style settings, so re-rendering the same text with
+the same style skips the layout.
+"""
+
+import json
+from dataclasses import dataclass
+from functools import cache
+from math import ceil
+from os import makedirs
+from os.path import isfile, join
+from typing import Any, Literal
+
+import numpy as np
+from PIL import ImageFont
+from PIL.ImageFont import FreeTypeFont
+
+from utility.cache_manager import CACHE_MANAGER
+from utility.caption_track import CaptionTrack
+from utility.sprite_cache import SpriteCache
+from utility.tools import atomic_write, create_hash_content
+
+# the style of a caption event
+# base: white word, the highlights tint it with the text color
+# text color: word drawn with the text color
+# highlight: tint of the event on `parent` with the text color
+STYLE_BASE = 0
+STYLE_TEXT_COLOR = 1
+STYLE_HIGHLIGHT = 2
+
+# bump when the layout changes, so the cached plans are laid out again
+LAYOUT_VERSION = 3
+
+# the number of words of a caption for each text style
+# None chunks the words by sentence
+TEXT_STYLE_WORD_COUNTS: dict[str, int | None] = {
+    "2 words": 2,
+    "3 words": 3,
+    "4 words": 4,
+    "sentence": None,
+}
+SENTENCE_ENDINGS = (".", "!", "?")
+
+# padding is set for something like a margin for the whole video screen
+CAPTION_PADDING = 100
+CAPTION_LINE_SPACING = 30
+
+# longer captions, like a long sentence, are split into more captions
+# so they do not run off the bottom of the video
+CAPTION_MAX_LINES = 3
+
+CAPTION_PLAN_DTYPE = np.dtype(
+    [
+        ("word_id", np.int32),
+        ("x", np.int32),
+        ("y", np.int32),
+        ("start", np.float64),
+        ("end", np.float64),
+        ("style", np.uint8),
+        ("parent", np.int32),
+    ]
+)
+
+
+class FontMetrics:
+    """Advance and bbox metrics table of a font.
+
+    Each word is measured once with Pillow, the next lookups are
+    dictionary reads.
+
+    Methods:
+        get_advance(word): Get the advance width of a word.
+        get_height(word): Get the bbox height of a word.
+        get_size(word, stroke_width): Get the size of the sprite of a word.
+
+    """
+
+    def __init__(self, font_object: FreeTypeFont):
+        """Initialize FontMetrics.
+
+        Args:
+            font_object (FreeTypeFont): The loaded font.
+
+        """
+        self._font_object: FreeTypeFont = font_object
+        self._advances: dict[str, float] = {}
+        self._heights: dict[str, int] = {}
+        self._sizes: dict[tuple[str, int], tuple[int, int]] = {}
+
+    def get_advance(self, word: str) -> float:
+        """Get the advance width of a word."""
+        advance = self._advances.get(word)
+        if advance is None:
+            advance = self._font_object.getlength(word)
+            self._advances[word] = advance
+        return advance
+
+    def get_height(self, word: str) -> int:
+        """Get the bbox height of a word."""
+        height = self._heights.get(word)
+        if height is None:
+            bbox = self._font_object.getbbox(word)
+            height = ceil(bbox[3] - bbox[1])
+            self._heights[word] = height
+        return height
+
+    def get_size(self, word: str, stroke_width: int) -> tuple[int, int]:
+        """Get the size of the sprite of a word with its stroke.
+
+        It is the box a `TextClip` label of the word is drawn in, without
+        rasterizing it.
+        """
+        size = self._sizes.get((word, stroke_width))
+        if size is None:
+            left, top, right, bottom = self._font_object.getbbox(
+                word, stroke_width=stroke_width, anchor="lm"
+            )
+            size = (ceil(right - left), ceil(bottom - top))
+            self._sizes[(word, stroke_width)] = size
+        return size
+
+
+@cache
+def get_font_metrics(font: str, font_size: int) -> FontMetrics:
+    """Get the metrics table of a font, created once per font and size.
+
+    Args:
+        font (str): The font path.
+        font_size (int): The font size.
+
+    Returns:
+        FontMetrics: The metrics table of the font.
+
+    """
+    return FontMetrics(ImageFont.truetype(font=font, size=font_size))
+
+
+@dataclass
+class CaptionPlan:
+    """The caption events of a video, ready to be drawn.
+
+    Attributes:
+        words (list[str]): The unique words, the rows point to them
+            with `word_id`.
+        rows (np.ndarray): One row per caption event with the
+            `CAPTION_PLAN_DTYPE` fields. Positions are the top left pixel
+            of the word, `parent` is the highlighted row or -1.
+
+    Methods:
+        create_caption_track(...): Create the caption track of the plan.
+        save(filepath): Save the plan as `.npy` with a `.json` of the words.
+        load(filepath): Load a saved plan.
+
+    """
+
+    words: list[str]
+    rows: np.ndarray
+
+    def create_caption_track(
+        self,
+        size: tuple[int, int],
+        fps: float,
+        sprite_cache: SpriteCache,
+        font: str,
+        font_size: int,
+        text_stroke: int,
+        text_color: str,
+    ) -> CaptionTrack:
+        """Create the caption track of the plan.
+
+        Args:
+            size (tuple[int, int]): The width and height of the video.
+            fps (float): The frames per second of the video.
+            sprite_cache (SpriteCache): Where the word sprites come from.
+            font (str): The font path.
+            font_size (int): The font size.
+            text_stroke (int): The stroke width of the words.
+            text_color (str): The color of the colored and highlighted words.
+
+        Returns:
+            CaptionTrack: The caption track with all caption events.
+
+        """
+        caption_track = CaptionTrack(size=size, fps=fps)
+
+        # the row index of the plan to the event index of the track
+        event_indexes: dict[int, int] = {}
+        for row_index, row in enumerate(self.rows):
+            style = int(row["style"])
+            if style == STYLE_HIGHLIGHT:
+                caption_track.add_highlight(
+                    event_index=event_indexes[int(row["parent"])],
+                    start=float(row["start"]),
+                    end=float(row["end"]),
+                    color=text_color,
+                )
+                continue
+
+            sprite = sprite_cache.get(
+                word=self.words[row["word_id"]],
+                color="white" if style == STYLE_BASE else text_color,
+                font=font,
+                font_size=font_size,
+                stroke_width=text_stroke,
+                stroke_color="black",
+            )
+            event_indexes[row_index] = caption_track.add(
+                sprite=sprite,
+                start=float(row["start"]),
+                end=float(row["end"]),
+                position=(int(row["x"]), int(row["y"])),
+            )
+
+        return caption_track
+
+    def save(self, filepath: str) -> None:
+        """Save the plan as `.npy` with a `.json` of the words next to it.
+
+        Args:
+            filepath (str): The `.npy` filepath.
+
+        """
+        words_filepath = filepath.removesuffix(".npy") + ".json"
+
+        # the rows are moved last, a plan is only found with its words
+        with atomic_write(filepath) as temporary_filepath:
+            with open(temporary_filepath, "wb") as file:
+                np.save(file, self.rows)
+            with atomic_write(words_filepath) as temporary_words_filepath:
+                with open(temporary_words_filepath, "w", encoding="utf-8") as file:
+                    json.dump(self.words, file)
+
+    @classmethod
+    def load(cls, filepath: str) -> "CaptionPlan | None":
+        """Load a saved plan.
+
+        Args:
+            filepath (str): The `.npy` filepath.
+
+        Returns:
+            CaptionPlan | None: The plan, or None if not saved or broken.
+
+        """
+        words_filepath = filepath.removesuffix(".npy") + ".json"
+        if not isfile(filepath) or not isfile(words_filepath):
+            return None
+
+        try:
+            rows = np.load(filepath)
+            with open(words_filepath, "r", encoding="utf-8") as file:
+                words = json.load(file)
+        except (OSError, ValueError):
+            return None
+
+        if rows.dtype != CAPTION_PLAN_DTYPE:
+            return None
+
+        return cls(words=words, rows=rows)
+
+
+class CaptionLayout:
+    """Lay out the transcript words into a caption plan.
+
+    Args:
+        word_data (list[Any]): The words of the transcript with their
+            `word`, `punctuated_word`, `start` and `end`.
+        video_size (tuple[int, int]): The width and height of the video.
+        center_position (tuple[float, float]): The x and y center of the captions.
+        font (str): The font path.
+        font_size (int): The font size.
+        text_stroke (int): The stroke width of the words.
+
+    Methods:
+        layout(text_style): Get the caption plan, from cache if saved.
+        layout_words(words_per_caption): Lay out the words on N words style format.
+        layout_one_word(): Lay out the words on one word style format.
+
+    """
+
+    def __init__(
+        self,
+        word_data: list[Any],
+        video_size: tuple[int, int],
+        center_position: tuple[float, float],
+        font: str,
+        font_size: int,
+        text_stroke: int,
+    ):
+        """Initialize CaptionLayout."""
+        self._word_data: list[Any] = word_data
+        self._video_width, self._video_height = video_size
+        self._x_center, self._y_center = center_position
+        self._font: str = font
+        self._font_size: int = font_size
+        self._text_stroke: int = text_stroke
+        # the words are measured without rasterizing their sprites
+        self._font_metrics: FontMetrics = get_font_metrics(font, font_size)
+
+        # word id of each unique word of the plan
+        self._word_ids: dict[str, int] = {}
+
+    def _get_cache_filepath(self, text_style: str) -> str:
+        """Get the cache filepath of the plan.
+
+        The key is the hash of the transcript words and every setting
+        that changes the layout. The text color is not part of it, it is
+        applied when drawing.
+        """
+        key_data = {
+            "layout_version": LAYOUT_VERSION,
+            "words": [
+                [w["word"], w.get("punctuated_word"), w["start"], w["end"]]
+                for w in self._word_data
+            ],
+            "text_style": text_style,
+            "video_size": [self._video_width, self._video_height],
+            "center_position": [self._x_center, self._y_center],
+            "font": self._font,
+            "font_size": self._font_size,
+            "text_stroke": self._text_stroke,
+        }
+        key_hash = create_hash_content(json.dumps(key_data, sort_keys=True))
+
+        return join("cache/layouts/", f"layout_{key_hash}.npy")
+
+    def layout(
+        self,
+        text_style: Literal["1 word", "2 words", "3 words", "4 words", "sentence"],
+    ) -> CaptionPlan:
+        """Get the caption plan, from cache if saved.
+
+        Args:
+            text_style (Literal["1 word", "2 words", "3 words", "4 words", "sentence"]):
+                The text style format.
+
+        Returns:
+            CaptionPlan: The caption plan.
+
+        """
+        filepath = self._get_cache_filepath(text_style)
+        caption_plan = (
+            CaptionPlan.load(filepath) if CACHE_MANAGER.lookup(filepath) else None
+        )
+        if caption_plan is not None:
+            return caption_plan
+
+        if text_style == "1 word":
+            caption_plan = self.layout_one_word()
+        else:
+            caption_plan = self.layout_words(TEXT_STYLE_WORD_COUNTS[text_style])
+
+        makedirs("cache/layouts/", exist_ok=True)
+        caption_plan.save(filepath)
+        CACHE_MANAGER.store(filepath)
+        CACHE_MANAGER.store(filepath.replace(".npy", ".json"))
+
+        return caption_plan
+
+    def _get_word_id(self, word: str) -> int:
+        """Get the word id of a word, adding it if new."""
+        return self._word_ids.setdefault(word, len(self._word_ids))
+
+    def _get_word_size(self, word: str) -> tuple[int, int]:
+        """Get the size of the word sprite from the font metrics."""
+        return self._font_metrics.get_size(word, self._text_stroke)
+
+    def _create_plan(
+        self, rows: list[tuple[int, int, int, float, float, int, int]]
+    ) -> CaptionPlan:
+        """Create the plan from the rows."""
+        return CaptionPlan(
+            words=list(self._word_ids),
+            rows=np.array(rows, dtype=CAPTION_PLAN_DTYPE),
+        )
+
+    def _chunk_words(self, words_per_caption: int | None) -> list[list[Any]]:
+        """Chunk the words into captions.
+
+        Args:
+            words_per_caption (int | None): The number of words of a caption,
+                `None` to chunk them by sentence.
+
+        Returns:
+            list[list[Any]]: The word data of each caption.
+
+        """
+        if words_per_caption is not None:
+            return [
+                self._word_data[i : i + words_per_caption]
+                for i in range(0, len(self._word_data), words_per_caption)
+            ]
+
+        # a sentence ends on a punctuated word
+        chunks = [[]]
+        for wd in self._word_data:
+            chunks[-1].append(wd)
+            if wd.get("punctuated_word", wd["word"]).endswith(SENTENCE_ENDINGS):
+                chunks.append([])
+
+        return [chunk for chunk in chunks if chunk]
+
+    def _wrap_lines(self, words: list[str]) -> list[list[str]]:
+        """Greedily wrap the words into lines that fit inside the padding."""
+        metrics = self._font_metrics
+        space_size = metrics.get_advance(" ")
+        maximum_width = self._video_width - CAPTION_PADDING
+
+        lines: list[list[str]] = []
+        line_width = 0
+        for word in words:
+            word_width = metrics.get_advance(word)
+            if lines and line_width + space_size + word_width <= maximum_width:
+                lines[-1].append(word)
+                line_width += space_size + word_width
+                continue
+
+            # a word wider than the video still gets its own line
+            lines.append([word])
+            line_width = word_width
+
+        return lines
+
+    def layout_words(self, words_per_caption: int | None) -> CaptionPlan:
+        """Lay out the words on N words style format.
+
+        The words of a caption are greedily wrapped into lines that fit
+        inside the padding, a caption with more than `CAPTION_MAX_LINES`
+        lines is split into more captions. The first line is centered
+        vertically on the video and the next lines go below it. The spoken
+        word is highlighted.
+
+        Args:
+            words_per_caption (int | None): The number of words of a caption,
+                `None` to chunk them by sentence.
+
+        Returns:
+            CaptionPlan: The caption plan.
+
+        """
+        rows = []
+        for chunked_words_data in self._chunk_words(words_per_caption):
+            chunked_words = [
+                w.get("punctuated_word", w["word"]) for w in chunked_words_data
+            ]
+            wrapped_lines = self._wrap_lines(chunked_words)
+
+            first_word_index = 0
+            for first_line_index in range(0, len(wrapped_lines), CAPTION_MAX_LINES):
+                lines = wrapped_lines[
+                    first_line_index : first_line_index + CAPTION_MAX_LINES
+                ]
+                word_count = sum(len(line) for line in lines)
+                self._layout_caption(
+                    chunked_words_data[
+                        first_word_index : first_word_index + word_count
+                    ],
+                    lines,
+                    rows,
+                )
+                first_word_index += word_count
+
+        return self._create_plan(rows)
+
+    def _layout_caption(
+        self,
+        chunked_words_data: list[Any],
+        lines: list[list[str]],
+        rows: list[tuple[int, int, int, float, float, int, int]],
+    ) -> None:
+        """Lay out the wrapped lines of a caption into rows.
+
+        Args:
+            chunked_words_data (list[Any]): The word data of the caption.
+            lines (list[list[str]]): The words of the caption by line.
+            rows (list[tuple[int, int, int, float, float, int, int]]): Where
+                the rows of the caption are added.
+
+        """
+        metrics = self._font_metrics
+        space_size = metrics.get_advance(" ")
+
+        # the top of each line, the first line is centered
+        # per word on the video so it is None
+        line_tops: list[float | None] = [None]
+        top: float = 0
+        for line_index in range(1, len(lines)):
+            line_height = max(metrics.get_height(w) for w in lines[line_index])
+            if line_index == 1:
+                top = self._y_center + ((line_height + CAPTION_LINE_SPACING) // 2)
+            else:
+                previous_line_height = max(
+                    metrics.get_height(w) for w in lines[line_index - 1]
+                )
+                top += previous_line_height + CAPTION_LINE_SPACING
+            line_tops.append(top)
+
+        word_index = 0
+        for line, line_top in zip(lines, line_tops):
+            # center the line horizontally
+            line_width = sum(metrics.get_advance(w) for w in line)
+            line_width += space_size * (len(line) - 1)
+            starting_x_position = self._x_center - (line_width // 2)
+
+            for word in line:
+                if line_top is None:
+                    _, word_height = self._get_word_size(word)
+                    x, y = (
+                        starting_x_position,
+                        (self._video_height - word_height) / 2,
+                    )
+                else:
+                    x, y = starting_x_position, line_top
+
+                # base word, shown for the overall duration of the caption
+                word_id = self._get_word_id(word)
+                base_row_index = len(rows)
+                rows.append(
+                    (
+                        word_id,
+                        int(x),
+                        int(y),
+                        chunked_words_data[0]["start"],
+                        chunked_words_data[-1]["end"],
+                        STYLE_BASE,
+                        -1,
+                    )
+                )
+
+                # highlight the word while the speaker is speaking it
+                rows.append(
+                    (
+                        word_id,
+                        int(x),
+                        int(y),
+                        chunked_words_data[word_index]["start"],
+                        chunked_words_data[word_index]["end"],
+                        STYLE_HIGHLIGHT,
+                        base_row_index,
+                    )
+                )
+
+                # update the starting x position for the next word plus space size
+                starting_x_position += metrics.get_advance(word) + space_size
+                word_index += 1
+
+    def layout_one_word(self) -> CaptionPlan:
+        """Lay out the words on one word style format."""
+        rows = []
+        for wd in self._word_data:
+            # centered on the video
+            word_width, word_height = self._get_word_size(wd["word"])
+            rows.append(
+                (
+                    self._get_word_id(wd["word"]),
+                    int((self._video_width - word_width) / 2),
+                    int((self._video_height - word_height) / 2),
+                    wd["start"],
+                    wd["end"],
+                    STYLE_TEXT_COLOR,
+                    -1,
+                )
+            )
+
+        return self._create_plan(rows)
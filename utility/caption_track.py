@@ -0,0 +1,509 @@
+"""Caption track for drawing all captions on a single layer."""
+
+from bisect import bisect_right
+from dataclasses import dataclass
+from math import ceil
+
+import numpy as np
+from moviepy import VideoClip
+
+from utility.blend import BlendKernel
+from utility.sprite_cache import WordSprite
+
+
+@dataclass
+class CaptionEvent:
+    """A caption sprite shown on the track between start and end.
+
+    Attributes:
+        sprite (WordSprite): The rendered caption.
+        start (float): The time in seconds the caption appears.
+        end (float): The time in seconds the caption disappears.
+        position (tuple[float | str, float | str]): The top left position
+            of the caption, same format as `clip.with_position`.
+
+    """
+
+    sprite: WordSprite
+    start: float
+    end: float
+    position: tuple[float | str, float | str]
+
+
+@dataclass
+class HighlightEvent:
+    """A tint over a caption event, for the karaoke highlight.
+
+    Attributes:
+        event_index (int): The index of the highlighted caption event.
+        start (float): The time in seconds the highlight starts.
+        end (float): The time in seconds the highlight ends.
+        color (str): The tint color of the highlight.
+
+    """
+
+    event_index: int
+    start: float
+    end: float
+    color: str
+
+
+@dataclass
+class _OverlayEntry:
+    """A sprite of the overlay, already clipped and placed on the frame."""
+
+    destination: tuple[slice, slice]
+    premultiplied: np.ndarray
+    inverse_alpha: np.ndarray
+
+
+class CaptionTrack:
+    """A single layer that holds every caption of the video.
+
+    Instead of giving hundreds of TextClips to the CompositeVideoClip,
+    which checks every clip on every frame, the captions are stored as
+    events inside a sorted interval index. Looking up the active captions
+    of a frame is a binary search on the index.
+
+    The captions are blended directly into the background frame, only
+    inside the bounding boxes of the active sprites. The rest of the
+    decoded frame is left untouched.
+
+    Highlights do not need a second set of sprites, a highlighted caption
+    is drawn again with its base sprite recolored through a tint.
+
+    The caption timings are snapped to the frame grid, so the active
+    captions only change on a few frames per second. The prepared overlay
+    of the previous frame is reused while the active captions are the same.
+
+    Attributes:
+        size (tuple[int, int]): The width and height of the video.
+        fps (float): The frames per second of the video, for the frame grid.
+        events (list[CaptionEvent]): All caption events in insertion order,
+            the later events are drawn on top of the earlier ones.
+        highlights (list[HighlightEvent]): All highlights of the caption events.
+        end (float): The time in seconds the last caption disappears.
+
+    Methods:
+        add(sprite, start, end, position): Add a caption event on the track.
+        add_highlight(event_index, start, end, color): Highlight a caption event.
+        get_slice(start, end): Get a track with only the captions playing
+            between start and end.
+        get_scaled(scale): Get a copy of the track for a resized video.
+        active_events(t): Get the events that are playing at time `t`.
+        composite(frame, t): Blend the active captions into a frame.
+        composite_in_place(frame, t): Blend the active captions directly
+            into a writable frame.
+        apply_to(clip): Get a clip with the captions drawn on top.
+
+    """
+
+    def __init__(self, size: tuple[int, int], fps: float = 30):
+        """Initialize CaptionTrack.
+
+        Args:
+            size (tuple[int, int]): The width and height of the video.
+            fps (float): The frames per second of the video.
+
+        """
+        self.size: tuple[int, int] = size
+        self.fps: float = fps
+        self.events: list[CaptionEvent] = []
+        self.highlights: list[HighlightEvent] = []
+        self.end: float = 0
+
+        # interval index
+        # boundaries are all the sorted start and end frames, each segment
+        # between two boundaries has a fixed set of active events, each
+        # with their highlight color if highlighted
+        self._boundaries: list[int] = []
+        self._segments: list[tuple[tuple[int, str | None], ...]] = []
+        self._is_index_dirty: bool = False
+
+        # the output frame and the blending scratch, reused on every frame
+        self._frame_buffer: np.ndarray | None = None
+        self._blend_kernel: BlendKernel = BlendKernel()
+
+        # overlay of the previous frame, keyed by segment and frame shape
+        self._overlay_key: tuple[int, tuple[int, ...]] | None = None
+        self._overlay: list[_OverlayEntry] = []
+
+    def add(
+        self,
+        sprite: WordSprite,
+        start: float,
+        end: float,
+        position: tuple[float | str, float | str] = ("center", "center"),
+    ) -> int:
+        """Add a caption event on the track.
+
+        Args:
+            sprite (WordSprite): The rendered caption.
+            start (float): The time in seconds the caption appears.
+            end (float): The time in seconds the caption disappears.
+            position (tuple[float | str, float | str]): The position of the caption.
+
+        Returns:
+            int: The index of the caption event, used for highlights.
+
+        Notes:
+            The start and end are snapped up to the frame grid. A frame at
+            time `t` shows the caption when `start <= t < end`, so the
+            caption stays on the exact same frames as before snapping.
+
+        """
+        start = self._snap_to_frame(start)
+        end = self._snap_to_frame(end)
+        self.events.append(
+            CaptionEvent(sprite=sprite, start=start, end=end, position=position)
+        )
+        self._is_index_dirty = True
+
+        # the track lasts until the last caption disappears
+        self.end = max(end, self.end)
+
+        return len(self.events) - 1
+
+    def add_highlight(
+        self, event_index: int, start: float, end: float, color: str
+    ) -> None:
+        """Highlight a caption event with a tint color.
+
+        While highlighted, the sprite of the caption is recolored with the
+        tint and drawn on top of the base colors. The timings are snapped like `add`.
+
+        Args:
+            event_index (int): The index of the caption event from `add`.
+            start (float): The time in seconds the highlight starts.
+            end (float): The time in seconds the highlight ends.
+            color (str): The tint color of the highlight, like "yellow".
+
+        """
+        self.highlights.append(
+            HighlightEvent(
+                event_index=event_index,
+                start=self._snap_to_frame(start),
+                end=self._snap_to_frame(end),
+                color=color,
+            )
+        )
+        self._is_index_dirty = True
+
+    def get_slice(self, start: float, end: float) -> "CaptionTrack":
+        """Get a track with only the captions playing between start and end.
+
+        The times are kept as they are, so the slice draws the same
+        captions as this track for any time between start and end.
+
+        Args:
+            start (float): The start of the slice in seconds.
+            end (float): The end of the slice in seconds.
+
+        Returns:
+            CaptionTrack: The new track, sharing the sprites of this track.
+
+        """
+        caption_track = CaptionTrack(size=self.size, fps=self.fps)
+
+        # the old event indexes are mapped to the new ones for highlights
+        event_indexes: dict[int, int] = {}
+        for index, event in enumerate(self.events):
+            if event.start < end and event.end > start:
+                event_indexes[index] = caption_track.add(
+                    sprite=event.sprite,
+                    start=event.start,
+                    end=event.end,
+                    position=event.position,
+                )
+
+        for highlight in self.highlights:
+            if highlight.event_index in event_indexes:
+                caption_track.add_highlight(
+                    event_index=event_indexes[highlight.event_index],
+                    start=highlight.start,
+                    end=highlight.end,
+                    color=highlight.color,
+                )
+
+        return caption_track
+
+    def get_scaled(self, scale: float) -> "CaptionTrack":
+        """Get a copy of the track for a video resized by a scale.
+
+        The sprites are resized and the positions are scaled, centered
+        positions stay centered. The timings are kept on the same grid.
+
+        Args:
+            scale (float): The scale of the video, like 0.5 for half size.
+
+        Returns:
+            CaptionTrack: The scaled track.
+
+        """
+        width, height = self.size
+        caption_track = CaptionTrack(
+            size=(round(width * scale), round(height * scale)), fps=self.fps
+        )
+
+        # the same sprite is used by many events, resize each one once
+        scaled_sprites: dict[int, WordSprite] = {}
+        for event in self.events:
+            sprite = scaled_sprites.get(id(event.sprite))
+            if sprite is None:
+                sprite = event.sprite.get_scaled(scale)
+                scaled_sprites[id(event.sprite)] = sprite
+
+            x, y = event.position
+            caption_track.add(
+                sprite=sprite,
+                start=event.start,
+                end=event.end,
+                position=(
+                    x if isinstance(x, str) else x * scale,
+                    y if isinstance(y, str) else y * scale,
+                ),
+            )
+
+        for highlight in self.highlights:
+            caption_track.add_highlight(
+                event_index=highlight.event_index,
+                start=highlight.start,
+                end=highlight.end,
+                color=highlight.color,
+            )
+
+        return caption_track
+
+    def _snap_to_frame(self, t: float) -> float:
+        """Snap a time up to the next frame of the frame grid."""
+        # tolerate the float error of times that are already on the grid
+        return ceil(t * self.fps - 1e-9) / self.fps
+
+    def _get_frame_number(self, t: float) -> int:
+        """Get the frame number of a time snapped on the frame grid."""
+        return round(t * self.fps)
+
+    def _build_index(self) -> None:
+        """Build the sorted interval index of the events.
+
+        Sweeps over the sorted boundaries once, keeping the set of events
+        that are active between the current and the next boundary.
+        """
+        # events are keyed as ("event", index) or ("highlight", index)
+        starting: dict[int, list[tuple[str, int]]] = {}
+        ending: dict[int, list[tuple[str, int]]] = {}
+        timed_items = [
+            (("event", index), event.start, event.end)
+            for index, event in enumerate(self.events)
+        ] + [
+            (("highlight", index), highlight.start, highlight.end)
+            for index, highlight in enumerate(self.highlights)
+        ]
+        for key, start, end in timed_items:
+            start_frame = self._get_frame_number(start)
+            end_frame = self._get_frame_number(end)
+            # empty events are never playing
+            if end_frame <= start_frame:
+                continue
+            starting.setdefault(start_frame, []).append(key)
+            ending.setdefault(end_frame, []).append(key)
+
+        self._boundaries = sorted(set(starting) | set(ending))
+        self._segments = []
+
+        active: set[tuple[str, int]] = set()
+        for boundary in self._boundaries[:-1]:
+            active.difference_update(ending.get(boundary, []))
+            active.update(starting.get(boundary, []))
+
+            # the latest highlight of an event wins
+            colors: dict[int, str] = {}
+            for kind, index in sorted(active):
+                if kind == "highlight":
+                    highlight = self.highlights[index]
+                    colors[highlight.event_index] = highlight.color
+
+            # keep the insertion order for the layering
+            self._segments.append(
+                tuple(
+                    (index, colors.get(index))
+                    for kind, index in sorted(active)
+                    if kind == "event"
+                )
+            )
+
+        self._is_index_dirty = False
+        self._overlay_key = None
+
+    def _find_segment(self, t: float) -> int:
+        """Find the segment of the interval index playing at time `t`.
+
+        Returns:
+            int: The segment index, -1 if no segment is playing.
+
+        """
+        if self._is_index_dirty:
+            self._build_index()
+
+        # frames between the grid points belong to the previous frame
+        frame_position = t * self.fps + 1e-9
+
+        # most frames are in the same segment as the previous frame
+        if self._overlay_key is not None:
+            segment_index = self._overlay_key[0]
+            if (
+                segment_index >= 0
+                and self._boundaries[segment_index]
+                <= frame_position
+                < self._boundaries[segment_index + 1]
+            ):
+                return segment_index
+
+        segment_index = bisect_right(self._boundaries, frame_position) - 1
+        if segment_index >= len(self._segments):
+            return -1
+        return segment_index
+
+    def active_events(self, t: float) -> list[CaptionEvent]:
+        """Get the events that are playing at time `t`.
+
+        Args:
+            t (float): The time in seconds.
+
+        Returns:
+            list[CaptionEvent]: The active events, bottom to top.
+
+        """
+        segment_index = self._find_segment(t)
+        if segment_index < 0:
+            return []
+
+        return [self.events[index] for index, _ in self._segments[segment_index]]
+
+    def _resolve_position(
+        self, event: CaptionEvent, frame_width: int, frame_height: int
+    ) -> tuple[int, int]:
+        """Resolve the event position into pixels like moviepy does."""
+        sprite_width, sprite_height = event.sprite.size
+        x, y = event.position
+
+        if x == "center":
+            x = (frame_width - sprite_width) / 2
+        if y == "center":
+            y = (frame_height - sprite_height) / 2
+
+        return int(x), int(y)
+
+    def _prepare_overlay(
+        self, segment_index: int, frame_width: int, frame_height: int
+    ) -> list[_OverlayEntry]:
+        """Prepare the sprites of a segment, clipped and placed on the frame."""
+        if segment_index < 0:
+            return []
+
+        overlay = []
+        for index, highlight_color in self._segments[segment_index]:
+            event = self.events[index]
+            x, y = self._resolve_position(event, frame_width, frame_height)
+            sprite_width, sprite_height = event.sprite.size
+
+            # clip the bounding box of the sprite to the frame
+            left, top = max(x, 0), max(y, 0)
+            right = min(x + sprite_width, frame_width)
+            bottom = min(y + sprite_height, frame_height)
+            if left >= right or top >= bottom:
+                continue
+
+            # highlighted captions are the base sprite with its tinted
+            # copy on top, same as the base and highlight clips before
+            prepared_sprites = [event.sprite.prepared]
+            if highlight_color is not None:
+                prepared_sprites.append(event.sprite.get_tinted(highlight_color))
+
+            sprite_area = (slice(top - y, bottom - y), slice(left - x, right - x))
+            for prepared in prepared_sprites:
+                overlay.append(
+                    _OverlayEntry(
+                        destination=(slice(top, bottom), slice(left, right)),
+                        premultiplied=prepared.premultiplied[sprite_area],
+                        inverse_alpha=prepared.inverse_alpha[sprite_area],
+                    )
+                )
+
+        return overlay
+
+    def composite(self, frame: np.ndarray, t: float) -> np.ndarray:
+        """Blend the active captions of time `t` into a frame.
+
+        Args:
+            frame (np.ndarray): The background frame, it is not modified.
+            t (float): The time in seconds.
+
+        Returns:
+            np.ndarray: The output frame with the captions, or the frame
+                itself if no caption is playing.
+
+        Notes:
+            The output frame is a buffer reused on every call, it is only
+            valid until the next call. The writer of moviepy encodes each
+            frame before asking for the next one.
+
+        """
+        if not self._get_overlay(t, frame.shape):
+            return frame
+
+        if self._frame_buffer is None or self._frame_buffer.shape != frame.shape:
+            self._frame_buffer = np.empty(frame.shape, dtype=np.uint8)
+        output = self._frame_buffer
+        np.copyto(output, frame, casting="unsafe")
+        self.composite_in_place(output, t)
+
+        return output
+
+    def composite_in_place(self, frame: np.ndarray, t: float) -> None:
+        """Blend the active captions of time `t` directly into a frame.
+
+        Args:
+            frame (np.ndarray): The writable uint8 frame, it is modified.
+            t (float): The time in seconds.
+
+        """
+        # only the bounding boxes are blended
+        for entry in self._get_overlay(t, frame.shape):
+            self._blend_kernel.blend(
+                destination=frame[entry.destination],
+                premultiplied=entry.premultiplied,
+                inverse_alpha=entry.inverse_alpha,
+            )
+
+    def _get_overlay(
+        self, t: float, frame_shape: tuple[int, ...]
+    ) -> list[_OverlayEntry]:
+        """Get the overlay of time `t`, prepared again only when it changed."""
+        # reuse the overlay of the previous frame if the active captions
+        # did not change
+        segment_index = self._find_segment(t)
+        overlay_key = (segment_index, frame_shape)
+        if overlay_key != self._overlay_key:
+            frame_height, frame_width = frame_shape[:2]
+            self._overlay = self._prepare_overlay(
+                segment_index, frame_width, frame_height
+            )
+            self._overlay_key = overlay_key
+
+        return self._overlay
+
+    def apply_to(self, clip: VideoClip) -> VideoClip:
+        """Get a clip with the captions drawn on top.
+
+        Args:
+            clip (VideoClip): The background clip.
+
+        Returns:
+            VideoClip: The background clip with the captions.
+
+        """
+        return clip.transform(
+            lambda get_frame, t: self.composite(get_frame(t), t),
+            apply_to=[],
+        )
@@ -36,6 +36,10 @@ def save_api_config(config_object: ConfigData) -> None:
                 "text_color": config_object.story_settings.text_color,
                 "text_style": config_object.story_settings.text_style,
                 "text_stroke": config_object.story_settings.text_stroke,
+                "render_quality": config_object.story_settings.render_quality,
+                "word_timings": config_object.story_settings.word_timings,
+                "render_engine": config_object.story_settings.render_engine,
+                "render_workers": config_object.story_settings.render_workers,
             }
         },
     }
@@ -70,6 +74,19 @@ def load_config_object() -> ConfigData:
         text_color=config_data["default_settings"]["story"]["text_color"],
         text_style=config_data["default_settings"]["story"]["text_style"],
         text_stroke=config_data["default_settings"]["story"]["text_stroke"],
+        # older config files do not have it yet
+        render_quality=config_data["default_settings"]["story"].get(
+            "render_quality", "final"
+        ),
+        word_timings=config_data["default_settings"]["story"].get(
+            "word_timings", "local"
+        ),
+        render_engine=config_data["default_settings"]["story"].get(
+            "render_engine", "threaded"
+        ),
+        render_workers=config_data["default_settings"]["story"].get(
+            "render_workers", 0
+        ),
     )
 
     # load the api settings
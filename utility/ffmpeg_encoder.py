@@ -0,0 +1,225 @@
+"""Encode raw frames by piping them straight into ffmpeg.
+
+The frames are written to the stdin of an ffmpeg process as rawvideo,
+and the x264 settings are given explicitly. The audio is read by ffmpeg
+from the voiceover file itself, so there is no temporary audio file
+like `write_videofile` makes.
+"""
+
+import subprocess as sp
+from dataclasses import dataclass
+from types import TracebackType
+from typing import Literal
+
+import numpy as np
+from moviepy.config import FFMPEG_BINARY
+
+
+@dataclass
+class EncoderSettings:
+    """The x264 and audio settings of the encoder.
+
+    Attributes:
+        preset (str): The x264 preset, from "ultrafast" to "veryslow".
+        crf (int): The x264 constant rate factor, lower is better quality.
+        tune (str | None): The x264 tune, like "film" or "animation".
+        threads (int | None): The x264 threads, `None` lets x264 decide.
+        audio_codec (str): The audio codec of the output.
+        audio_bitrate (str): The audio bitrate of the output.
+
+    """
+
+    preset: Literal[
+        "ultrafast",
+        "superfast",
+        "veryfast",
+        "faster",
+        "fast",
+        "medium",
+        "slow",
+        "slower",
+        "veryslow",
+    ] = "fast"
+    crf: int = 23
+    tune: str | None = None
+    threads: int | None = None
+    audio_codec: str = "aac"
+    audio_bitrate: str = "192k"
+
+
+class FfmpegPipeEncoder:
+    """Write RGB frames into an ffmpeg process as raw video.
+
+    Methods:
+        write_frame(frame): Write a frame to the encoder.
+        close: Finish the video and wait for ffmpeg to exit.
+
+    Notes:
+        Use it as a context manager, ffmpeg is started on enter and the
+        video is finished on exit.
+
+    """
+
+    def __init__(
+        self,
+        filename: str,
+        size: tuple[int, int],
+        fps: float,
+        settings: EncoderSettings,
+        audio_filename: str | None = None,
+        audio_start: float = 0,
+        duration: float | None = None,
+    ):
+        """Initialize FfmpegPipeEncoder.
+
+        Args:
+            filename (str): The output video filename.
+            size (tuple[int, int]): The width and height of the frames.
+            fps (float): The frames per second of the video.
+            settings (EncoderSettings): The encoder settings.
+            audio_filename (str | None): The audio file muxed into the video.
+            audio_start (float): The time in seconds the audio is read from.
+            duration (float | None): The duration of the output, the audio
+                is cut to it.
+
+        """
+        self._filename: str = filename
+        self._size: tuple[int, int] = size
+        self._fps: float = fps
+        self._settings: EncoderSettings = settings
+        self._audio_filename: str | None = audio_filename
+        self._audio_start: float = audio_start
+        self._duration: float | None = duration
+        self._process: sp.Popen[bytes] | None = None
+
+    def _get_command(self) -> list[str]:
+        """Get the ffmpeg command line."""
+        width, height = self._size
+        command = [
+            FFMPEG_BINARY,
+            "-y",
+            "-loglevel",
+            "error",
+            "-f",
+            "rawvideo",
+            "-pix_fmt",
+            "rgb24",
+            "-s",
+            f"{width}x{height}",
+            "-r",
+            f"{self._fps}",
+            "-i",
+            "-",
+        ]
+        if self._audio_filename is not None:
+            if self._audio_start:
+                command.extend(["-ss", f"{self._audio_start}"])
+            command.extend(["-i", self._audio_filename])
+
+        command.extend(
+            [
+                "-c:v",
+                "libx264",
+                "-preset",
+                self._settings.preset,
+                "-crf",
+                str(self._settings.crf),
+                "-pix_fmt",
+                "yuv420p",
+            ]
+        )
+        if self._settings.tune is not None:
+            command.extend(["-tune", self._settings.tune])
+        if self._settings.threads is not None:
+            command.extend(["-threads", str(self._settings.threads)])
+
+        if self._audio_filename is not None:
+            command.extend(
+                [
+                    "-c:a",
+                    self._settings.audio_codec,
+                    "-b:a",
+                    self._settings.audio_bitrate,
+                ]
+            )
+
+        if self._duration is not None:
+            command.extend(["-t", f"{self._duration}"])
+
+        command.extend(["-movflags", "+faststart", self._filename])
+        return command
+
+    def __enter__(self) -> "FfmpegPipeEncoder":
+        """Start the ffmpeg process."""
+        self._process = sp.Popen(
+            self._get_command(),
+            stdin=sp.PIPE,
+            stdout=sp.DEVNULL,
+            stderr=sp.PIPE,
+        )
+        return self
+
+    def write_frame(self, frame: np.ndarray) -> None:
+        """Write a frame to the encoder.
+
+        Args:
+            frame (np.ndarray): The RGB frame as uint8,
+                shape (height, width, 3).
+
+        Raises:
+            IOError: If ffmpeg stopped, with the error of ffmpeg.
+
+        """
+        if self._process is None or self._process.stdin is None:
+            raise IOError("The encoder is not started.")
+
+        try:
+            # the buffer is given as is, without a copy to bytes
+            self._process.stdin.write(np.ascontiguousarray(frame).data)
+        except (BrokenPipeError, OSError) as error:
+            raise IOError(f"ffmpeg stopped encoding: {self._read_error()}") from error
+
+    def _read_error(self) -> str:
+        """Read the error output of ffmpeg after it stopped."""
+        if self._process is None or self._process.stderr is None:
+            return ""
+
+        self._process.wait()
+        return self._process.stderr.read().decode(errors="replace").strip()
+
+    def close(self) -> None:
+        """Finish the video and wait for ffmpeg to exit.
+
+        Raises:
+            IOError: If ffmpeg exited with an error.
+
+        """
+        if self._process is None:
+            return
+
+        process = self._process
+        self._process = None
+
+        # closes stdin so ffmpeg finishes the video, the error output
+        # is only a few lines with `-loglevel error`
+        _, error_output = process.communicate()
+        if process.returncode != 0:
+            raise IOError(
+                f"ffmpeg failed to encode {self._filename}: "
+                f"{error_output.decode(errors='replace').strip()}"
+            )
+
+    def __exit__(
+        self,
+        exc_type: type[BaseException] | None,
+        exc_value: BaseException | None,
+        traceback: TracebackType | None,
+    ) -> None:
+        """Finish the video, or stop ffmpeg if rendering failed."""
+        if exc_type is not None and self._process is not None:
+            self._process.kill()
+            self._process.wait()
+            self._process = None
+            return
+
+        self.close()
@@ -1,11 +1,20 @@
 """Generate text module."""
 
-from typing import Callable, Literal
-import google.generativeai as genai
-from openai import AuthenticationError, OpenAI
+from typing import Any, Callable, Literal
+from openai import AuthenticationError
 
 from models.config_data import ConfigData
 from models.prompt import GeneratePrompt
+from utility.api_clients import API_CLIENTS
+from utility.response_cache import RESPONSE_CACHE
+
+DEEPINFRA_BASE_URL = "https://api.deepinfra.com/v1/openai"
+
+# the user message sent after the prompt
+USER_MESSAGE = "What happened?"
+
+# the request parameters passed to the text models, part of the cache key
+REQUEST_PARAMS: dict[str, Any] = {"stream": False}
 
 
 class GenerateText:
@@ -19,8 +28,19 @@ class GenerateText:
         idea: str,
         config_object: ConfigData,
         done_callback: Callable[[str, bool, str | None, str | None], None],
+        force_new: bool = False,
     ):
-        """Initialize GenerateText."""
+        """Initialize GenerateText.
+
+        Args:
+            idea (str): The idea of the script.
+            config_object (ConfigData): The config object used from the system.
+            done_callback (Callable[[str, bool, str | None, str | None], None]):
+                Called with the text, if it failed, the error title and message.
+            force_new (bool): Always request a new response, even when
+                cached variants of the same request are available.
+
+        """
         self._idea: str = idea
         self._config_object: ConfigData = config_object
         self._theme: Literal["Horror", "Facts"] = (
@@ -35,6 +55,8 @@ class GenerateText:
         self._first_message: str = (
             "What happened?" if self._theme == "Horror" else "Tell me about it."
         )
+        self._force_new: bool = force_new
+        self._cache_key: str = ""
 
     def _on_gemini_service(self):
         """Request on API using Gemini service.
@@ -58,16 +80,16 @@ class GenerateText:
             )
             return
 
-        # intiate and configure gemini
-        genai.configure(api_key=self._config_object.api_settings.gemini_token)
-        model = genai.GenerativeModel(
+        # gemini is only configured again when the token changed
+        model = API_CLIENTS.get_gemini_model(
+            api_key=self._config_object.api_settings.gemini_token,
             model_name=self._config_object.api_settings.gemini_text_model,
             system_instruction=self._prompt,
         )
 
-        response = model.generate_content(contents="What happened?")
+        response = model.generate_content(contents=USER_MESSAGE)
 
-        self._done_callback(response.text, False, None, None)
+        self._on_response(response.text)
 
     def _on_deepinfra_service(self):
         """Request on API using Deepinfra service.
@@ -91,11 +113,11 @@ class GenerateText:
             )
             return
 
-        # initiate and configue deepinfra
+        # shared deepinfra client, its connections are kept alive
         # Note: Openai client can be use for deepinfra
-        openai = OpenAI(
+        openai = API_CLIENTS.get_openai(
             api_key=self._config_object.api_settings.deepinfra_token,
-            base_url="https://api.deepinfra.com/v1/openai",
+            base_url=DEEPINFRA_BASE_URL,
         )
 
         try:
@@ -103,7 +125,7 @@ class GenerateText:
                 model=self._config_object.api_settings.deepinfra_text_model,
                 messages=[
                     {"role": "system", "content": self._prompt},
-                    {"role": "user", "content": "What happened?"},
+                    {"role": "user", "content": USER_MESSAGE},
                 ],
                 stream=False,
             )
@@ -121,7 +143,7 @@ class GenerateText:
         if response is None:
             response = ""
 
-        self._done_callback(response, False, None, None)
+        self._on_response(response)
 
     def _on_openai_service(self):
         """Request and API using openai service.
@@ -145,15 +167,17 @@ class GenerateText:
             )
             return
 
-        # initiate and configue openai
-        openai = OpenAI(api_key=self._config_object.api_settings.openai_token)
+        # shared openai client, its connections are kept alive
+        openai = API_CLIENTS.get_openai(
+            api_key=self._config_object.api_settings.openai_token
+        )
 
         try:
             chat_completion = openai.chat.completions.create(
                 model=self._config_object.api_settings.openai_text_model,
                 messages=[
                     {"role": "system", "content": self._prompt},
-                    {"role": "user", "content": "What happened?"},
+                    {"role": "user", "content": USER_MESSAGE},
                 ],
                 stream=False,
             )
@@ -171,6 +195,32 @@ class GenerateText:
         if response is None:
             response = ""
 
+        self._on_response(response)
+
+    def _get_model_name(self, service: str) -> str:
+        """Get the model of a text model service from the settings."""
+        return {
+            "Gemini": self._config_object.api_settings.gemini_text_model,
+            "DeepInfra": self._config_object.api_settings.deepinfra_text_model,
+            "Openai": self._config_object.api_settings.openai_text_model,
+        }.get(service, "")
+
+    def _get_cached_response(self) -> str | None:
+        """Get a cached variant of the request, unless a new one is forced."""
+        chosen_service = self._config_object.story_settings.text_model
+        self._cache_key = RESPONSE_CACHE.get_key(
+            provider=chosen_service,
+            model=self._get_model_name(chosen_service),
+            prompt=f"{self._prompt}\n{USER_MESSAGE}",
+            params=REQUEST_PARAMS,
+        )
+        if self._force_new:
+            return None
+        return RESPONSE_CACHE.get(self._cache_key)
+
+    def _on_response(self, response: str):
+        """Keep the response as a variant of the request and return it."""
+        RESPONSE_CACHE.add(self._cache_key, response)
         self._done_callback(response, False, None, None)
 
     def _on_no_service(self):
@@ -190,6 +240,12 @@ class GenerateText:
             str: The generated text.
 
         """
+        # regenerating the same request cycles through cached variants
+        cached_response = self._get_cached_response()
+        if cached_response is not None:
+            self._done_callback(cached_response, False, None, None)
+            return
+
         chosen_service = self._config_object.story_settings.text_model
 
         if chosen_service == "Gemini":
@@ -204,3 +260,76 @@ class GenerateText:
         # if some models are not yet implemented
         else:
             self._on_no_service()
+
+    async def request_async(self):
+        """Request to their respective API without blocking the event loop.
+
+        Same as `request`, for pipelines that generate many scripts at the
+        same time on one event loop. The async clients are shared, so the
+        requests reuse their connections.
+
+        """
+        cached_response = self._get_cached_response()
+        if cached_response is not None:
+            self._done_callback(cached_response, False, None, None)
+            return
+
+        chosen_service = self._config_object.story_settings.text_model
+        api_settings = self._config_object.api_settings
+
+        # handle error for no token, like the blocking request
+        api_key = {
+            "Gemini": api_settings.gemini_token,
+            "DeepInfra": api_settings.deepinfra_token,
+            "Openai": api_settings.openai_token,
+        }.get(chosen_service)
+        if api_key is None:
+            self._on_no_service()
+            return
+
+        if api_key == "":
+            service_name = chosen_service.lower()
+            self._done_callback(
+                "",
+                True,
+                f"No {service_name} token found!",
+                f"Please input your {service_name} token first.",
+            )
+            return
+
+        if chosen_service == "Gemini":
+            model = API_CLIENTS.get_gemini_model(
+                api_key=api_settings.gemini_token,
+                model_name=api_settings.gemini_text_model,
+                system_instruction=self._prompt,
+            )
+            response = await model.generate_content_async(contents=USER_MESSAGE)
+            self._on_response(response.text)
+            return
+
+        if chosen_service == "DeepInfra":
+            base_url = DEEPINFRA_BASE_URL
+        else:
+            base_url = None
+
+        openai = API_CLIENTS.get_async_openai(api_key=api_key, base_url=base_url)
+        try:
+            chat_completion = await openai.chat.completions.create(
+                model=self._get_model_name(chosen_service),
+                messages=[
+                    {"role": "system", "content": self._prompt},
+                    {"role": "user", "content": USER_MESSAGE},
+                ],
+                stream=False,
+            )
+        except AuthenticationError:
+            self._done_callback(
+                "",
+                True,
+                "The api token is invalid.",
+                f"Please input your valid {chosen_service.lower()} token.",
+            )
+            return
+
+        response = chat_completion.choices[0].message.content
+        self._on_response(response or "")
@@ -1,22 +1,49 @@
 """Voice generation module."""
 
+import asyncio
+import hashlib
 import json
-from tkinter import messagebox
-from typing import Any
+import wave
+from concurrent.futures import Future, ThreadPoolExecutor
+from os import makedirs
+from os.path import join
+from typing import Any, Callable, cast
 from deepgram import (
+    AsyncListenRESTClient,
+    AsyncSpeakRESTClient,
     DeepgramApiError,
-    DeepgramApiKeyError,
     DeepgramClient,
-    DeepgramUnknownApiError,
     FileSource,
+    ListenRESTClient,
     PrerecordedOptions,
     SpeakOptions,
+    SpeakRESTClient,
 )
 
 from models.config_data import ConfigData
 
 
-from utility.tools import create_audio_filename
+from utility.api_clients import API_CLIENTS
+from utility.cache_manager import CACHE_MANAGER
+from utility.tools import atomic_write, create_audio_filename
+from utility.voice_chunks import (
+    CHUNK_DIRECTORY,
+    CHUNK_SAMPLE_RATE,
+    VoiceChunk,
+    create_chunk_filename,
+    get_chunk_duration,
+    load_boundaries,
+    load_words,
+    split_sentences,
+    stitch_chunks,
+)
+from utility.word_aligner import align_samples, align_words, read_samples, split_script
+
+# word timings of the transcribed voiceovers, by audio content
+TRANSCRIPT_DIRECTORY = "cache/transcripts/"
+
+# sentences requested at the same time
+TTS_WORKERS = 4
 
 
 class GenerateVoice:
@@ -45,52 +72,360 @@ class GenerateVoice:
         with open(filepath, "rb") as file:
             buffer_data = file.read()
 
-        # initialize deepgram
-        deepgram = DeepgramClient(api_key=self._config_data.api_settings.deepgram_token)
+        return self._request_transcript(buffer_data)
+
+    def get_word_timings(self) -> list[dict[str, Any]]:
+        """Get the words of the voiceover with their timings.
+
+        Returns:
+            list[dict[str, Any]]: The words with their `word`,
+                `punctuated_word`, `start` and `end`, like the words of
+                the transcript.
+
+        Notes:
+            By default the known script is aligned on the audio locally.
+            With the deepgram setting, the transcript is cached by the
+            hash of the audio content, so re-rendering the same voiceover
+            with another style does not upload it again. Only the timing
+            arrays are kept, not the whole transcript response.
+
+        """
+        filepath = create_audio_filename(
+            script=self._script,
+            voice_model_name=self._config_data.story_settings.voice_model,
+        )
+        if self._config_data.story_settings.word_timings == "local":
+            # aligned on the chunks while the voiceover was made
+            words = load_words(filepath)
+            if words is not None:
+                return words
+
+            # the sentence boundaries of the chunks are exact, each
+            # sentence is aligned on its own part of the audio
+            return align_words(self._script, filepath, load_boundaries(filepath))
+
+        with open(filepath, "rb") as file:
+            buffer_data = file.read()
+
+        audio_hash = hashlib.sha256(buffer_data).hexdigest()
+        timings_path = join(TRANSCRIPT_DIRECTORY, f"transcript_{audio_hash}.json")
+        if CACHE_MANAGER.lookup(timings_path):
+            try:
+                with open(timings_path, "r", encoding="utf-8") as file:
+                    timings = json.load(file)
+                return [
+                    {
+                        "word": word,
+                        "punctuated_word": punctuated_word,
+                        "start": start,
+                        "end": end,
+                    }
+                    for word, punctuated_word, start, end in zip(
+                        timings["word"],
+                        timings["punctuated_word"],
+                        timings["start"],
+                        timings["end"],
+                    )
+                ]
+            except (OSError, ValueError, KeyError):
+                # broken file, it is transcribed and saved again
+                pass
+
+        transcript_data = self._request_transcript(buffer_data)
+        words = transcript_data["results"]["channels"][0]["alternatives"][0]["words"]
+
+        # one array per field instead of the whole response
+        timings = {
+            "word": [word["word"] for word in words],
+            "punctuated_word": [
+                word.get("punctuated_word", word["word"]) for word in words
+            ],
+            "start": [word["start"] for word in words],
+            "end": [word["end"] for word in words],
+        }
+
+        makedirs(TRANSCRIPT_DIRECTORY, exist_ok=True)
+        with atomic_write(timings_path) as temporary_path:
+            with open(temporary_path, "w", encoding="utf-8") as file:
+                json.dump(timings, file)
+        CACHE_MANAGER.store(timings_path)
+
+        return [
+            {
+                "word": word["word"],
+                "punctuated_word": word.get("punctuated_word", word["word"]),
+                "start": word["start"],
+                "end": word["end"],
+            }
+            for word in words
+        ]
+
+    def _request_transcript(self, buffer_data: bytes) -> Any:
+        """Upload the audio to deepgram and get the transcript."""
+        # shared deepgram client, the upload reuses the open connections
+        deepgram = API_CLIENTS.get_deepgram(
+            self._config_data.api_settings.deepgram_token
+        )
+        payload: FileSource = {"buffer": buffer_data}
+        options = PrerecordedOptions(model="nova-2", smart_format=True)
+
+        # request to sdk api, `v` is typed as any of the listen clients
+        # and the sdk passes `transport` on to the httpx client of the request
+        listen = cast(ListenRESTClient, deepgram.listen.rest.v("1"))
+        response = listen.transcribe_file(
+            payload, options, transport=API_CLIENTS.get_deepgram_transport()
+        )
+
+        return json.loads(response.to_json(indent=4))
+
+    async def transcript_async(self) -> Any:
+        """Transcript the audio without blocking the event loop.
+
+        Same as `transcript`, for pipelines that make many videos at the
+        same time on one event loop.
+
+        """
+        filepath = create_audio_filename(
+            script=self._script,
+            voice_model_name=self._config_data.story_settings.voice_model,
+        )
+        with open(filepath, "rb") as file:
+            buffer_data = file.read()
+
+        deepgram = API_CLIENTS.get_deepgram(
+            self._config_data.api_settings.deepgram_token
+        )
         payload: FileSource = {"buffer": buffer_data}
         options = PrerecordedOptions(model="nova-2", smart_format=True)
 
-        # request to sdk api
-        response = deepgram.listen.rest.v("1").transcribe_file(payload, options)
+        listen = cast(AsyncListenRESTClient, deepgram.listen.asyncrest.v("1"))
+        response = await listen.transcribe_file(
+            payload, options, transport=API_CLIENTS.get_async_deepgram_transport()
+        )
 
         return json.loads(response.to_json(indent=4))
 
-    def generate(self) -> bool:
+    def generate(
+        self, on_chunk_ready: Callable[[VoiceChunk], None] | None = None
+    ) -> None:
         """Generate the voiceover.
 
-        Returns:
-            bool: The status if API request succeeded.
+        Args:
+            on_chunk_ready (Callable[[VoiceChunk], None] | None): Called
+                with each sentence chunk in order as soon as it and the
+                ones before it are written, so a preview can start playing
+                before the last sentence is made. With the local word
+                timings, the chunk has the timings of its words.
+
+        Raises:
+            DeepgramApiError: If a text to speech request failed.
+            DeepgramApiKeyError: If the deepgram token is wrong.
+            httpx.HTTPError: If a request could not connect or timed out.
+            IOError: If the sentences could not be stitched.
 
         Notes:
-            Currently, I will be using the one time request instead of
-            chunking the voiceover by sentence to make the process more
-            faster. Chunking and merging voiceover by sentence will make
-            the voice realisting and easy to understand.
+            The script is split into sentences that are requested at the
+            same time and cached on their own, so a longer script is not
+            slower to wait for and editing one sentence costs one short
+            request. The sentences are stitched into the voiceover with
+            sample-accurate offsets. The audio of each sentence is streamed
+            into its cache file as it arrives. With the local word
+            timings, each sentence is aligned as it lands while the next
+            ones are still requested, and the words are saved next to
+            the voiceover for the render.
+
+            It may run on a thread, so the errors are raised for the caller
+            to show instead of shown here.
 
         """
-        # preparing options and filename
-        speak_options = {"text": self._script}
+        voice_model = self._config_data.story_settings.voice_model
         filename = create_audio_filename(
-            script=self._script,
-            voice_model_name=self._config_data.story_settings.voice_model,
+            script=self._script, voice_model_name=voice_model
+        )
+        sentences = split_sentences(self._script)
+
+        # shared deepgram client, the sentences reuse the open connections
+        deepgram = API_CLIENTS.get_deepgram(
+            self._config_data.api_settings.deepgram_token
+        )
+
+        local_timings = self._config_data.story_settings.word_timings == "local"
+        words: list[dict[str, Any]] = []
+        offset = 0.0
+
+        # request the sentences that are not cached yet, a repeated
+        # sentence is the same chunk and is only requested once
+        makedirs(CHUNK_DIRECTORY, exist_ok=True)
+        with ThreadPoolExecutor(max_workers=TTS_WORKERS) as executor:
+            futures: dict[str, Future[str]] = {}
+            for sentence in sentences:
+                if sentence not in futures:
+                    futures[sentence] = executor.submit(
+                        self._generate_chunk, deepgram, sentence, voice_model
+                    )
+            try:
+                chunk_filenames = []
+                for index, sentence in enumerate(sentences):
+                    chunk_filename = futures[sentence].result()
+                    chunk_filenames.append(chunk_filename)
+
+                    # the sentence starts where the ones before it end
+                    chunk_words = []
+                    if local_timings:
+                        chunk_words = align_samples(
+                            split_script(sentence),
+                            read_samples(chunk_filename),
+                            offset=offset,
+                        )
+                        words += chunk_words
+                        offset += get_chunk_duration(chunk_filename)
+
+                    if on_chunk_ready is not None:
+                        on_chunk_ready(
+                            VoiceChunk(
+                                index=index,
+                                text=sentence,
+                                filename=chunk_filename,
+                                words=chunk_words,
+                            )
+                        )
+            except BaseException:
+                # the sentences not started yet are not requested
+                for future in futures.values():
+                    future.cancel()
+                raise
+
+        stitch_chunks(
+            sentences, chunk_filenames, filename, words if local_timings else None
         )
 
-        # Initialize deepgram
-        deepgram = DeepgramClient(api_key=self._config_data.api_settings.deepgram_token)
+        # the voiceover is paid, it is kept between launches
+        CACHE_MANAGER.store(filename)
 
-        # choose model
-        options = SpeakOptions(model=self._config_data.story_settings.voice_model)
+    def _generate_chunk(
+        self, deepgram: DeepgramClient, sentence: str, voice_model: str
+    ) -> str:
+        """Get the chunk of a sentence, requested if not cached, on a worker."""
+        chunk_filename = create_chunk_filename(sentence, voice_model)
+        if CACHE_MANAGER.lookup(chunk_filename):
+            return chunk_filename
 
-        # WARNING AND TODO: catch more error for deepgram error
+        # raw PCM, so the chunks are stitched without encoder padding
+        options = SpeakOptions(
+            model=voice_model,
+            encoding="linear16",
+            container="none",
+            sample_rate=CHUNK_SAMPLE_RATE,
+        )
 
-        # request to the deepgram api sdk
+        # the audio is written as it arrives instead of buffered whole
+        speak = cast(SpeakRESTClient, deepgram.speak.rest.v("1"))
+        response = speak.stream_raw(
+            {"text": sentence}, options, transport=API_CLIENTS.get_deepgram_transport()
+        )
         try:
-            deepgram.speak.rest.v("1").save(filename, speak_options, options)
-        except (DeepgramApiError, DeepgramApiKeyError, DeepgramUnknownApiError) as exc:
-            if isinstance(exc, DeepgramApiKeyError):
-                messagebox.showerror(title="Error", message=str(exc))
-            else:
-                messagebox.showerror(title="Error", message=exc.message)
-            return False
-
-        return True
+            if response.status_code != 200:
+                response.read()
+                raise DeepgramApiError(
+                    response.text, str(response.status_code), response.text
+                )
+
+            with atomic_write(chunk_filename) as temporary_filename:
+                with wave.open(temporary_filename, "wb") as file:
+                    file.setnchannels(1)
+                    file.setsampwidth(2)
+                    file.setframerate(CHUNK_SAMPLE_RATE)
+                    for data in response.iter_bytes():
+                        file.writeframes(data)
+        finally:
+            response.close()
+
+        CACHE_MANAGER.store(chunk_filename)
+        return chunk_filename
+
+    async def generate_async(self) -> str:
+        """Generate the voiceover without blocking the event loop.
+
+        Same as `generate`, for pipelines that make many videos at the
+        same time on one event loop. The sentences share the async
+        connection pool instead of a thread each.
+
+        Returns:
+            str: The voiceover file.
+
+        Raises:
+            DeepgramApiError: If deepgram refused a sentence.
+            IOError: If ffmpeg failed to stitch the sentences.
+
+        """
+        voice_model = self._config_data.story_settings.voice_model
+        filename = create_audio_filename(
+            script=self._script, voice_model_name=voice_model
+        )
+        sentences = split_sentences(self._script)
+        deepgram = API_CLIENTS.get_deepgram(
+            self._config_data.api_settings.deepgram_token
+        )
+
+        # as many sentences at a time as the blocking generate
+        makedirs(CHUNK_DIRECTORY, exist_ok=True)
+        semaphore = asyncio.Semaphore(TTS_WORKERS)
+
+        async def generate_chunk(sentence: str) -> str:
+            async with semaphore:
+                return await self._generate_chunk_async(deepgram, sentence, voice_model)
+
+        # a repeated sentence is the same chunk and is only requested once
+        unique_sentences = list(dict.fromkeys(sentences))
+        unique_filenames = await asyncio.gather(
+            *(generate_chunk(sentence) for sentence in unique_sentences)
+        )
+        chunk_by_sentence = dict(zip(unique_sentences, unique_filenames))
+        chunk_filenames = [chunk_by_sentence[sentence] for sentence in sentences]
+
+        # stitching waits on ffmpeg, it runs off the event loop
+        await asyncio.to_thread(stitch_chunks, sentences, chunk_filenames, filename)
+
+        CACHE_MANAGER.store(filename)
+        return filename
+
+    async def _generate_chunk_async(
+        self, deepgram: DeepgramClient, sentence: str, voice_model: str
+    ) -> str:
+        """Get the chunk of a sentence, requested if not cached."""
+        chunk_filename = create_chunk_filename(sentence, voice_model)
+        if CACHE_MANAGER.lookup(chunk_filename):
+            return chunk_filename
+
+        options = SpeakOptions(
+            model=voice_model,
+            encoding="linear16",
+            container="none",
+            sample_rate=CHUNK_SAMPLE_RATE,
+        )
+
+        speak = cast(AsyncSpeakRESTClient, deepgram.speak.asyncrest.v("1"))
+        response = await speak.stream_raw(
+            {"text": sentence},
+            options,
+            transport=API_CLIENTS.get_async_deepgram_transport(),
+        )
+        try:
+            if response.status_code != 200:
+                await response.aread()
+                raise DeepgramApiError(
+                    response.text, str(response.status_code), response.text
+                )
+
+            with atomic_write(chunk_filename) as temporary_filename:
+                with wave.open(temporary_filename, "wb") as file:
+                    file.setnchannels(1)
+                    file.setsampwidth(2)
+                    file.setframerate(CHUNK_SAMPLE_RATE)
+                    async for data in response.aiter_bytes():
+                        file.writeframes(data)
+        finally:
+            await response.aclose()
+
+        CACHE_MANAGER.store(chunk_filename)
+        return chunk_filename
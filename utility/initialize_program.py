@@ -4,11 +4,11 @@ All things that will be done on beginning of the startup
 will be put here.
 """
 
-from os import environ, mkdir, listdir, remove
-from os.path import isdir, join
-
+from os import environ, mkdir
+from os.path import isdir
 
 # ======= HANDLE ENVIRONMENT ==========
+# set on import, before pygame and grpc are imported
 # hide pygame shameless advertisement
 environ["PYGAME_HIDE_SUPPORT_PROMPT"] = "hide"
 
@@ -18,21 +18,29 @@ environ["PYGAME_HIDE_SUPPORT_PROMPT"] = "hide"
 environ["GRPC_VERBOSITY"] = "ERROR"
 environ["GLOG_minloglevel"] = "2"
 
-# ======= HANDLE CACHE =========
-# create cache folder
-if not isdir("cache"):
-    mkdir("cache")
 
-# delete all files in cache
-# TODO: Have some proper cache handling
-cache_files = listdir("cache/")
-for cache_file in cache_files:
-    cache_file_path = join("cache", cache_file)
-    remove(cache_file_path)
+def initialize_program() -> None:
+    """Create the folders and start the audio of the program.
+
+    Notes:
+        Only the main process calls this, the render worker processes
+        import the utilities without setting up the program.
+
+    """
+    # ======= HANDLE CACHE =========
+    # create cache folder
+    if not isdir("cache"):
+        mkdir("cache")
+
+    # create important folders
+    if not isdir("videos"):
+        mkdir("videos")
+
+    if not isdir("assets/clips"):
+        mkdir("assets/clips")
 
-# create important folders
-if not isdir("videos"):
-    mkdir("videos")
+    # ======= HANDLE AUDIO =========
+    # initialize mixer for method play_voiceover
+    from pygame import mixer
 
-if not isdir("assets/clips"):
-    mkdir("assets/clips")
+    mixer.init()
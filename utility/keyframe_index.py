@@ -0,0 +1,230 @@
+"""Keyframe index of the background clips.
+
+Seeking into a clip decodes from the keyframe before the seek point, on
+clips with keyframes far apart that is seconds of decoded frames thrown
+away. The keyframe times of each clip are read once and kept as JSON
+under `cache/keyframes/`, keyed by the path, size and modified time of
+the clip, so the start of a background can be picked on a keyframe.
+"""
+
+import json
+import re
+import subprocess as sp
+from os import makedirs, stat
+from os.path import abspath, join
+from shutil import which
+from threading import Lock
+
+from moviepy.config import FFMPEG_BINARY
+
+from utility.cache_manager import CACHE_MANAGER
+from utility.tools import atomic_write, create_hash_content
+
+# ffprobe is not shipped with the ffmpeg binary of imageio
+FFPROBE_BINARY: str | None = which("ffprobe")
+
+
+class KeyframeIndex:
+    """Read and keep the keyframe times of clips.
+
+    Methods:
+        get_keyframes(filepath): Get the keyframe times of a clip.
+        extract_segment(filepath, start, duration): Copy a part of a clip
+            that starts on a keyframe into its own file.
+
+    """
+
+    def __init__(self, directory: str = "cache/keyframes/"):
+        """Initialize KeyframeIndex.
+
+        Args:
+            directory (str): The folder of the keyframe files.
+
+        """
+        self._directory: str = directory
+        self._keyframes: dict[str, list[float]] = {}
+        self._lock: Lock = Lock()
+
+    def _get_key(self, filepath: str) -> str:
+        """Get the key of a clip from its path, size and modified time."""
+        file_stat = stat(filepath)
+        return create_hash_content(
+            json.dumps(
+                {
+                    "path": abspath(filepath),
+                    "size": file_stat.st_size,
+                    "mtime": file_stat.st_mtime_ns,
+                },
+                sort_keys=True,
+            )
+        )
+
+    def get_keyframes(self, filepath: str) -> list[float]:
+        """Get the keyframe times of a clip.
+
+        Args:
+            filepath (str): The path of the clip.
+
+        Returns:
+            list[float]: The sorted keyframe times in seconds.
+
+        Notes:
+            The clip is only read the first time, after that the times
+            come from memory or from the keyframe file.
+
+        """
+        key = self._get_key(filepath)
+        with self._lock:
+            keyframes = self._keyframes.get(key)
+            if keyframes is not None:
+                return keyframes
+
+        index_path = join(self._directory, f"keyframes_{key}.json")
+        if CACHE_MANAGER.lookup(index_path):
+            with open(index_path, "r", encoding="utf-8") as file:
+                keyframes = json.load(file)
+        else:
+            keyframes = self._read_keyframes(filepath)
+
+            makedirs(self._directory, exist_ok=True)
+            with atomic_write(index_path) as temporary_path:
+                with open(temporary_path, "w", encoding="utf-8") as file:
+                    json.dump(keyframes, file)
+            CACHE_MANAGER.store(index_path)
+
+        with self._lock:
+            self._keyframes[key] = keyframes
+        return keyframes
+
+    def _read_keyframes(self, filepath: str) -> list[float]:
+        """Read the keyframe times with ffprobe, or ffmpeg without it.
+
+        Raises:
+            IOError: If the clip could not be read.
+
+        """
+        if FFPROBE_BINARY is not None:
+            # only the packet flags are read, nothing is decoded
+            command = [
+                FFPROBE_BINARY,
+                "-loglevel",
+                "error",
+                "-select_streams",
+                "v:0",
+                "-show_entries",
+                "packet=pts_time,flags",
+                "-of",
+                "csv=p=0",
+                filepath,
+            ]
+            process = sp.run(command, stdout=sp.PIPE, stderr=sp.PIPE)
+            times = [
+                float(pts_time)
+                for pts_time, flags in (
+                    line.split(",", 1)
+                    for line in process.stdout.decode().splitlines()
+                    if "," in line
+                )
+                if "K" in flags and pts_time not in ("", "N/A")
+            ]
+        else:
+            # only the keyframes are decoded, showinfo prints their time
+            command = [
+                FFMPEG_BINARY,
+                "-hide_banner",
+                "-nostats",
+                "-skip_frame",
+                "nokey",
+                "-i",
+                filepath,
+                "-map",
+                "0:v:0",
+                "-vf",
+                "showinfo",
+                "-f",
+                "null",
+                "-",
+            ]
+            process = sp.run(command, stdout=sp.DEVNULL, stderr=sp.PIPE)
+            times = [
+                float(pts_time)
+                for pts_time in re.findall(
+                    r"pts_time:(-?[0-9.]+)", process.stderr.decode(errors="replace")
+                )
+            ]
+
+        if process.returncode != 0:
+            raise IOError(
+                f"Failed to read the keyframes of {filepath}: "
+                f"{process.stderr.decode(errors='replace').strip()}"
+            )
+
+        return sorted(set(times))
+
+    def extract_segment(
+        self,
+        filepath: str,
+        start: float,
+        duration: float,
+        directory: str = "cache/extracts/",
+    ) -> str:
+        """Copy a part of a clip that starts on a keyframe into its own file.
+
+        The video stream is copied as is, nothing is decoded or encoded,
+        so `start` should be a keyframe time from `get_keyframes`.
+
+        Args:
+            filepath (str): The path of the clip.
+            start (float): The keyframe time in seconds the part starts.
+            duration (float): The duration of the part in seconds.
+            directory (str): The folder of the extracted parts.
+
+        Returns:
+            str: The path of the extracted part.
+
+        Raises:
+            IOError: If ffmpeg failed to copy the part.
+
+        """
+        key = create_hash_content(f"{self._get_key(filepath)}-{start}-{duration}")
+        extract_path = join(directory, f"extract_{key}.mp4")
+        if CACHE_MANAGER.lookup(extract_path):
+            return extract_path
+
+        makedirs(directory, exist_ok=True)
+        with atomic_write(extract_path) as temporary_path:
+            command = [
+                FFMPEG_BINARY,
+                "-y",
+                "-loglevel",
+                "error",
+                "-ss",
+                f"{start}",
+                "-i",
+                filepath,
+                "-t",
+                f"{duration}",
+                "-map",
+                "0:v:0",
+                "-c:v",
+                "copy",
+                "-an",
+                "-avoid_negative_ts",
+                "make_zero",
+                "-movflags",
+                "+faststart",
+                temporary_path,
+            ]
+            process = sp.run(command, stdout=sp.DEVNULL, stderr=sp.PIPE)
+            if process.returncode != 0:
+                raise IOError(
+                    f"ffmpeg failed to extract {filepath} at {start}: "
+                    f"{process.stderr.decode(errors='replace').strip()}"
+                )
+
+        CACHE_MANAGER.store(extract_path)
+        return extract_path
+
+
+# shared between the renders and the proxy worker
+KEYFRAME_INDEX = KeyframeIndex()
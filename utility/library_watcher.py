@@ -0,0 +1,245 @@
+"""Watch the library folders and keep their file indexes current.
+
+The windows used to list their folders again on every `pack()` and
+after every delete and download. Here the folders are listed once, then
+a watcher thread keeps an in-memory index of each one current and sends
+what was added or removed to the windows. On Linux the thread sleeps on
+inotify until something changes, elsewhere it polls the folders.
+"""
+
+import ctypes
+import ctypes.util
+import struct
+from os import close, read, scandir
+from os.path import isdir, join
+from platform import system
+from select import select
+from threading import Event, Lock, Thread
+from time import sleep
+from typing import Callable
+
+# added or changed paths, removed paths
+LibraryCallback = Callable[[list[str], list[str]], None]
+
+# inotify events that change the listing of a folder
+_IN_CLOSE_WRITE = 0x00000008
+_IN_MOVED_FROM = 0x00000040
+_IN_MOVED_TO = 0x00000080
+_IN_CREATE = 0x00000100
+_IN_DELETE = 0x00000200
+_IN_WATCH_MASK = (
+    _IN_CLOSE_WRITE | _IN_MOVED_FROM | _IN_MOVED_TO | _IN_CREATE | _IN_DELETE
+)
+_IN_EVENT_HEADER = struct.Struct("iIII")
+
+# files still being downloaded or written
+_IGNORED_SUFFIXES = (".part", ".ytdl", ".tmp")
+
+
+class LibraryWatcher:
+    """Keep the file indexes of the library folders current.
+
+    Methods:
+        subscribe(directory, callback): Get the files of a folder now and
+            their changes later.
+        get_files(directory): Get the files of a folder from the index.
+        start: Start the watcher thread.
+        stop: Stop the watcher thread.
+
+    """
+
+    def __init__(
+        self,
+        directories: tuple[str, ...] = ("videos/", "assets/clips/", "assets/fonts/"),
+        poll_seconds: float = 1.0,
+        debounce_seconds: float = 0.2,
+    ):
+        """Initialize LibraryWatcher.
+
+        Args:
+            directories (tuple[str, ...]): The folders to watch.
+            poll_seconds (float): How often the folders are listed when
+                inotify is not available.
+            debounce_seconds (float): How long to wait for more events
+                before listing a changed folder, a download or a render
+                sends many of them.
+
+        """
+        self._directories: tuple[str, ...] = directories
+        self._poll_seconds: float = poll_seconds
+        self._debounce_seconds: float = debounce_seconds
+
+        # folder: {path: modified time}
+        self._indexes: dict[str, dict[str, int]] = {
+            directory: {} for directory in directories
+        }
+        self._callbacks: dict[str, list[LibraryCallback]] = {
+            directory: [] for directory in directories
+        }
+        self._lock: Lock = Lock()
+        self._stop_event: Event = Event()
+        self._thread: Thread | None = None
+
+    def subscribe(self, directory: str, callback: LibraryCallback) -> None:
+        """Get the files of a folder now and their changes later.
+
+        Args:
+            directory (str): One of the watched folders.
+            callback (LibraryCallback): Called once right away with all the
+                files as added, then with each change from the watcher
+                thread, use `after` to get back on the Tk thread.
+
+        Raises:
+            KeyError: If the folder is not watched.
+
+        """
+        self.start()
+        with self._lock:
+            self._callbacks[directory].append(callback)
+            files = list(self._indexes[directory])
+        callback(files, [])
+
+    def get_files(self, directory: str) -> list[str]:
+        """Get the files of a folder from the index.
+
+        Args:
+            directory (str): One of the watched folders.
+
+        Returns:
+            list[str]: The paths of the files.
+
+        """
+        self.start()
+        with self._lock:
+            return list(self._indexes[directory])
+
+    def start(self) -> None:
+        """Start the watcher thread, the folders are listed first."""
+        with self._lock:
+            if self._thread is not None:
+                return
+
+            for directory in self._directories:
+                self._indexes[directory] = self._list_files(directory)
+
+            self._thread = Thread(target=self._run, daemon=True)
+            self._thread.start()
+
+    def stop(self) -> None:
+        """Stop the watcher thread."""
+        self._stop_event.set()
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+
+    def _list_files(self, directory: str) -> dict[str, int]:
+        """List the files of a folder with their modified time."""
+        if not isdir(directory):
+            return {}
+
+        files = {}
+        for entry in scandir(directory):
+            if entry.name.startswith(".") or entry.name.endswith(_IGNORED_SUFFIXES):
+                continue
+            try:
+                if entry.is_file():
+                    files[join(directory, entry.name)] = entry.stat().st_mtime_ns
+            except FileNotFoundError:
+                # removed while listing
+                continue
+        return files
+
+    def _rescan(self, directory: str) -> None:
+        """List a folder again and send what changed to the subscribers."""
+        files = self._list_files(directory)
+
+        with self._lock:
+            previous_files = self._indexes[directory]
+            self._indexes[directory] = files
+            callbacks = list(self._callbacks[directory])
+
+        # a changed modified time is sent as added, the windows replace it
+        added = [
+            path for path, mtime in files.items() if previous_files.get(path) != mtime
+        ]
+        removed = [path for path in previous_files if path not in files]
+        if not added and not removed:
+            return
+
+        for callback in callbacks:
+            callback(added, removed)
+
+    def _run(self) -> None:
+        """Watch with inotify on Linux, poll anywhere else."""
+        if system() == "Linux" and self._run_inotify():
+            return
+        self._run_polling()
+
+    def _run_polling(self) -> None:
+        """List every folder again on an interval."""
+        while not self._stop_event.wait(self._poll_seconds):
+            for directory in self._directories:
+                self._rescan(directory)
+
+    def _run_inotify(self) -> bool:
+        """Sleep on inotify and list the folders that changed.
+
+        Returns:
+            bool: `False` if inotify could not be used, to poll instead.
+
+        """
+        try:
+            libc = ctypes.CDLL(ctypes.util.find_library("c"), use_errno=True)
+            file_descriptor = libc.inotify_init()
+        except (OSError, AttributeError):
+            return False
+        if file_descriptor < 0:
+            return False
+
+        try:
+            watched: dict[int, str] = {}
+            for directory in self._directories:
+                watch_descriptor = libc.inotify_add_watch(
+                    file_descriptor, directory.encode(), _IN_WATCH_MASK
+                )
+                if watch_descriptor < 0:
+                    # the folder does not exist yet, only polling sees it later
+                    return False
+                watched[watch_descriptor] = directory
+
+            while not self._stop_event.is_set():
+                ready, _, _ = select([file_descriptor], [], [], self._poll_seconds)
+                if not ready:
+                    continue
+
+                # wait for the rest of the burst, then list each folder once
+                sleep(self._debounce_seconds)
+                changed = set()
+                while select([file_descriptor], [], [], 0)[0]:
+                    changed |= self._read_events(file_descriptor, watched)
+
+                for directory in changed:
+                    self._rescan(directory)
+        finally:
+            close(file_descriptor)
+
+        return True
+
+    def _read_events(self, file_descriptor: int, watched: dict[int, str]) -> set[str]:
+        """Read the pending inotify events and get the folders they are in."""
+        buffer = read(file_descriptor, 64 * 1024)
+
+        changed = set()
+        offset = 0
+        while offset + _IN_EVENT_HEADER.size <= len(buffer):
+            watch_descriptor, _, _, name_length = _IN_EVENT_HEADER.unpack_from(
+                buffer, offset
+            )
+            if watch_descriptor in watched:
+                changed.add(watched[watch_descriptor])
+            offset += _IN_EVENT_HEADER.size + name_length
+        return changed
+
+
+# shared between all windows of the program
+LIBRARY_WATCHER = LibraryWatcher()
@@ -0,0 +1,242 @@
+"""Metadata index of the background clips.
+
+Opening a `VideoFileClip` starts an ffmpeg reader only to learn the
+duration and size of a clip. The metadata of each clip is read once and
+kept in a SQLite database under `cache/`, keyed by the path, size and
+modified time of the clip, so an edited clip is read again.
+"""
+
+import re
+import sqlite3
+import subprocess as sp
+from dataclasses import astuple, dataclass, fields
+from os import makedirs, stat
+from os.path import abspath, dirname
+from threading import Lock
+from typing import Any, cast
+
+from moviepy.config import FFMPEG_BINARY
+from moviepy.video.io.ffmpeg_reader import FFmpegInfosParser
+
+from utility.keyframe_index import KEYFRAME_INDEX
+
+
+@dataclass
+class MediaMetadata:
+    """The metadata of a clip.
+
+    Attributes:
+        path (str): The absolute path of the clip.
+        size (int): The file size in bytes.
+        mtime (int): The modified time in nanoseconds.
+        duration (float): The duration in seconds.
+        fps (float): The frames per second of the video stream.
+        width (int): The width of the video stream.
+        height (int): The height of the video stream.
+        codec (str): The codec of the video stream, like "h264".
+        has_audio (bool): If the clip has an audio stream.
+        keyframe_count (int | None): The keyframes of the video stream,
+            `None` until counted by `get_keyframe_count`.
+
+    """
+
+    path: str
+    size: int
+    mtime: int
+    duration: float
+    fps: float
+    width: int
+    height: int
+    codec: str
+    has_audio: bool
+    keyframe_count: int | None = None
+
+
+class MediaIndex:
+    """Read and keep the metadata of clips.
+
+    Methods:
+        get_metadata(filepath): Get the metadata of a clip.
+        get_keyframe_count(filepath): Get the keyframes of a clip, counted
+            on first use.
+
+    """
+
+    # bumped when the table changes, the old one is dropped and read again
+    _SCHEMA_VERSION: int = 2
+
+    def __init__(self, database: str = "cache/media_index.sqlite3"):
+        """Initialize MediaIndex.
+
+        Args:
+            database (str): The SQLite database file.
+
+        """
+        self._database: str = database
+        self._connection: sqlite3.Connection | None = None
+
+        # the connection is shared between the threads of the app
+        self._lock: Lock = Lock()
+
+    def _connect(self) -> sqlite3.Connection:
+        """Open the database on first use and create the table."""
+        if self._connection is None:
+            makedirs(dirname(self._database) or ".", exist_ok=True)
+            self._connection = sqlite3.connect(self._database, check_same_thread=False)
+            version = self._connection.execute("PRAGMA user_version").fetchone()[0]
+            if version != self._SCHEMA_VERSION:
+                self._connection.execute("DROP TABLE IF EXISTS media")
+                self._connection.execute(
+                    f"PRAGMA user_version = {self._SCHEMA_VERSION}"
+                )
+            self._connection.execute("""
+                CREATE TABLE IF NOT EXISTS media (
+                    path TEXT PRIMARY KEY,
+                    size INTEGER NOT NULL,
+                    mtime INTEGER NOT NULL,
+                    duration REAL NOT NULL,
+                    fps REAL NOT NULL,
+                    width INTEGER NOT NULL,
+                    height INTEGER NOT NULL,
+                    codec TEXT NOT NULL,
+                    has_audio INTEGER NOT NULL,
+                    keyframe_count INTEGER
+                )
+                """)
+            self._connection.commit()
+        return self._connection
+
+    def get_metadata(self, filepath: str) -> MediaMetadata:
+        """Get the metadata of a clip.
+
+        Args:
+            filepath (str): The path of the clip.
+
+        Returns:
+            MediaMetadata: The metadata of the clip.
+
+        Raises:
+            IOError: If the clip could not be read.
+
+        Notes:
+            The clip is only read when it is not in the index yet,
+            or when its size or modified time changed. The keyframes are
+            not counted here, it scans the whole clip.
+
+        """
+        path = abspath(filepath)
+        file_stat = stat(path)
+
+        with self._lock:
+            row = (
+                self._connect()
+                .execute(
+                    "SELECT * FROM media WHERE path = ? AND size = ? AND mtime = ?",
+                    (path, file_stat.st_size, file_stat.st_mtime_ns),
+                )
+                .fetchone()
+            )
+        if row is not None:
+            return self._from_row(row)
+
+        metadata = self._read_metadata(path, file_stat.st_size, file_stat.st_mtime_ns)
+
+        columns = ", ".join(field.name for field in fields(MediaMetadata))
+        placeholders = ", ".join("?" for _ in fields(MediaMetadata))
+        with self._lock:
+            connection = self._connect()
+            connection.execute(
+                f"INSERT OR REPLACE INTO media ({columns}) VALUES ({placeholders})",
+                astuple(metadata),
+            )
+            connection.commit()
+
+        return metadata
+
+    @staticmethod
+    def _from_row(row: tuple[Any, ...]) -> MediaMetadata:
+        """Get the metadata of a row of the media table, in column order."""
+        path, size, mtime, duration, fps, width, height, codec, has_audio, count = row
+        return MediaMetadata(
+            path=str(path),
+            size=int(size),
+            mtime=int(mtime),
+            duration=float(duration),
+            fps=float(fps),
+            width=int(width),
+            height=int(height),
+            codec=str(codec),
+            # sqlite has no booleans, they are kept as 0 and 1
+            has_audio=bool(has_audio),
+            keyframe_count=None if count is None else int(count),
+        )
+
+    def _read_metadata(self, path: str, size: int, mtime: int) -> MediaMetadata:
+        """Read the metadata of a clip with ffmpeg.
+
+        The output is parsed the same way `VideoFileClip` does, so the
+        duration and fps match the ones of the loaded clip.
+        """
+        process = sp.run(
+            [FFMPEG_BINARY, "-hide_banner", "-i", path],
+            stdin=sp.DEVNULL,
+            stdout=sp.DEVNULL,
+            stderr=sp.PIPE,
+        )
+        infos = process.stderr.decode("utf8", errors="ignore")
+
+        try:
+            # the values are typed as any of the parsed value types
+            parsed = cast(dict[str, Any], FFmpegInfosParser(infos, path).parse())
+        except Exception as error:
+            raise IOError(f"Failed to read the metadata of {path}: {error}") from error
+
+        if not parsed.get("video_found"):
+            raise IOError(f"No video stream in {path}")
+
+        codec = re.search(r"Video: (\w+)", infos)
+        width, height = parsed["video_size"]
+        return MediaMetadata(
+            path=path,
+            size=size,
+            mtime=mtime,
+            duration=float(parsed["duration"]),
+            fps=float(parsed["video_fps"]),
+            width=int(width),
+            height=int(height),
+            codec=codec.group(1) if codec else "",
+            has_audio=bool(parsed["audio_found"]),
+        )
+
+    def get_keyframe_count(self, filepath: str) -> int:
+        """Get the keyframes of a clip, counted on first use.
+
+        Args:
+            filepath (str): The path of the clip.
+
+        Returns:
+            int: The keyframes of the video stream.
+
+        Raises:
+            IOError: If the clip could not be read.
+
+        """
+        metadata = self.get_metadata(filepath)
+        if metadata.keyframe_count is not None:
+            return metadata.keyframe_count
+
+        keyframe_count = len(KEYFRAME_INDEX.get_keyframes(metadata.path))
+        with self._lock:
+            connection = self._connect()
+            connection.execute(
+                "UPDATE media SET keyframe_count = ? "
+                "WHERE path = ? AND size = ? AND mtime = ?",
+                (keyframe_count, metadata.path, metadata.size, metadata.mtime),
+            )
+            connection.commit()
+
+        return keyframe_count
+
+
+# shared between all windows of the program
+MEDIA_INDEX = MediaIndex()
@@ -0,0 +1,189 @@
+"""Render-ready proxies of the background clips.
+
+The downloaded clips are 1080p60 landscape streams with keyframes far
+apart, every render decodes them at full rate and every seek decodes
+from a far keyframe. Each clip is transcoded once in the background
+into a proxy: vertical 1080x1920, 30fps, a keyframe every half second
+and no audio. The proxies are kept under `cache/proxies/`, keyed by the
+path, size and modified time of the clip, so an edited clip gets a new
+proxy.
+"""
+
+import json
+import subprocess as sp
+from concurrent.futures import Future
+from os import makedirs, stat
+from os.path import abspath, isfile, join
+from queue import Queue
+from threading import Lock, Thread
+
+from moviepy.config import FFMPEG_BINARY
+
+from utility.cache_manager import CACHE_MANAGER
+from utility.keyframe_index import KEYFRAME_INDEX
+from utility.tools import atomic_write, create_hash_content
+
+
+class ProxyCache:
+    """Transcode clips into proxies on a background worker.
+
+    Methods:
+        get_proxy(filepath): Get the proxy of a clip if it is ready.
+        request_proxy(filepath): Transcode the proxy of a clip in the
+            background if it is not made yet.
+
+    """
+
+    def __init__(
+        self,
+        directory: str = "cache/proxies/",
+        size: tuple[int, int] = (1080, 1920),
+        fps: int = 30,
+        keyframe_interval: int = 15,
+    ):
+        """Initialize ProxyCache.
+
+        Args:
+            directory (str): The folder of the proxies.
+            size (tuple[int, int]): The width and height of the proxies,
+                the clips are scaled to cover it and cropped at the center.
+            fps (int): The frames per second of the proxies.
+            keyframe_interval (int): The frames between two keyframes.
+
+        """
+        self._directory: str = directory
+        self._size: tuple[int, int] = size
+        self._fps: int = fps
+        self._keyframe_interval: int = keyframe_interval
+
+        # one transcode at a time on a daemon thread, the app stays usable
+        # while it runs and closing the app does not wait for it
+        self._queue: Queue[tuple[str, str, Future[str | None]]] = Queue()
+        self._pending: dict[str, Future[str | None]] = {}
+        self._lock: Lock = Lock()
+        self._worker: Thread | None = None
+
+    def _get_proxy_path(self, filepath: str) -> str:
+        """Get the proxy path of a clip from its path, size and modified time."""
+        file_stat = stat(filepath)
+        key = json.dumps(
+            {
+                "path": abspath(filepath),
+                "size": file_stat.st_size,
+                "mtime": file_stat.st_mtime_ns,
+                "proxy_size": self._size,
+                "fps": self._fps,
+                "keyframe_interval": self._keyframe_interval,
+            },
+            sort_keys=True,
+        )
+        return join(self._directory, f"proxy_{create_hash_content(key)}.mp4")
+
+    def get_proxy(self, filepath: str) -> str | None:
+        """Get the proxy of a clip if it is ready.
+
+        Args:
+            filepath (str): The path of the clip.
+
+        Returns:
+            str | None: The path of the proxy, `None` if not made yet.
+
+        """
+        if not isfile(filepath):
+            return None
+
+        proxy_path = self._get_proxy_path(filepath)
+        return proxy_path if CACHE_MANAGER.lookup(proxy_path) else None
+
+    def request_proxy(self, filepath: str) -> Future[str | None]:
+        """Transcode the proxy of a clip in the background if not made yet.
+
+        Args:
+            filepath (str): The path of the clip.
+
+        Returns:
+            Future[str | None]: The path of the proxy when done, `None`
+                if the transcode failed.
+
+        """
+        proxy_path = self._get_proxy_path(filepath)
+
+        with self._lock:
+            future = self._pending.get(proxy_path)
+            if future is None:
+                future = Future()
+                self._pending[proxy_path] = future
+                self._queue.put((filepath, proxy_path, future))
+
+            if self._worker is None:
+                self._worker = Thread(target=self._run_worker, daemon=True)
+                self._worker.start()
+
+        return future
+
+    def _run_worker(self) -> None:
+        """Transcode the requested proxies one after the other."""
+        while True:
+            filepath, proxy_path, future = self._queue.get()
+            try:
+                future.set_result(self._transcode(filepath, proxy_path))
+            except Exception as error:
+                future.set_exception(error)
+
+    def _transcode(self, filepath: str, proxy_path: str) -> str | None:
+        """Transcode a clip into its proxy, on the worker thread."""
+        if isfile(proxy_path):
+            return proxy_path
+
+        makedirs(self._directory, exist_ok=True)
+        width, height = self._size
+
+        try:
+            with atomic_write(proxy_path) as temporary_path:
+                command = [
+                    FFMPEG_BINARY,
+                    "-y",
+                    "-loglevel",
+                    "error",
+                    "-i",
+                    filepath,
+                    "-an",
+                    "-vf",
+                    (
+                        f"scale={width}:{height}:force_original_aspect_ratio=increase,"
+                        f"crop={width}:{height},fps={self._fps}"
+                    ),
+                    "-c:v",
+                    "libx264",
+                    "-preset",
+                    "veryfast",
+                    "-crf",
+                    "18",
+                    "-g",
+                    str(self._keyframe_interval),
+                    "-keyint_min",
+                    str(self._keyframe_interval),
+                    "-sc_threshold",
+                    "0",
+                    "-pix_fmt",
+                    "yuv420p",
+                    "-movflags",
+                    "+faststart",
+                    temporary_path,
+                ]
+                sp.run(command, stdout=sp.DEVNULL, stderr=sp.DEVNULL, check=True)
+            CACHE_MANAGER.store(proxy_path)
+
+            # the keyframes of the proxy are indexed while still in the
+            # background, randomizing the position does not wait for it
+            KEYFRAME_INDEX.get_keyframes(proxy_path)
+            return proxy_path
+        except sp.CalledProcessError:
+            return None
+        finally:
+            with self._lock:
+                self._pending.pop(proxy_path, None)
+
+
+# shared between all windows of the program
+PROXY_CACHE = ProxyCache()
@@ -0,0 +1,260 @@
+"""Threaded render engine for the final video.
+
+`write_videofile` decodes the background, composites the captions and
+hands the frame to ffmpeg one after the other in a single thread, so
+x264 waits on Python and Python waits on the pipe. Here each of those
+is its own stage in its own thread, connected by bounded queues.
+Decoding reads from the ffmpeg reader pipe, blending is NumPy and
+encoding writes to the ffmpeg writer pipe, all of them release the GIL
+for most of their work, so the stages overlap.
+"""
+
+from dataclasses import dataclass
+from queue import Empty, Full, Queue
+from threading import Event, Thread
+from time import perf_counter
+from typing import Any
+
+import numpy as np
+from moviepy import VideoClip
+from proglog import ProgressBarLogger
+
+from utility.caption_track import CaptionTrack
+from utility.ffmpeg_encoder import EncoderSettings, FfmpegPipeEncoder
+
+
+@dataclass
+class StageStatistics:
+    """The throughput of a render stage.
+
+    Attributes:
+        name (str): The name of the stage.
+        frames (int): The frames that went through the stage.
+        busy_seconds (float): The time spent working on frames,
+            waiting on the queues is not counted.
+
+    """
+
+    name: str
+    frames: int = 0
+    busy_seconds: float = 0
+
+    def get_throughput(self) -> float:
+        """Get the frames per second the stage can handle on its own."""
+        return self.frames / self.busy_seconds if self.busy_seconds else 0
+
+
+@dataclass
+class _FrameItem:
+    """A frame moving through the stages."""
+
+    index: int
+    t: float
+    frame: np.ndarray
+
+
+class ThreadedRenderEngine:
+    """Render a clip with decode, composite and encode stages in parallel.
+
+    Methods:
+        render(filename, logger): Render the clip into a video file.
+
+    Notes:
+        The frames are copied once from the decoder into a pool of
+        buffers, the captions are blended in place on those buffers and
+        the encoder gives them back to the pool once written. The pool is
+        as big as the queues allow, so nothing is allocated per frame.
+
+    """
+
+    # the stage threads check the stop event this often while waiting
+    _POLL_SECONDS: float = 0.1
+
+    def __init__(
+        self,
+        clip: VideoClip,
+        caption_tracks: list[CaptionTrack],
+        audio_filename: str | None,
+        duration: float,
+        fps: float,
+        encoder_settings: EncoderSettings,
+        queue_size: int = 8,
+        frame_range: tuple[int, int] | None = None,
+        audio_start: float = 0,
+    ):
+        """Initialize ThreadedRenderEngine.
+
+        Args:
+            clip (VideoClip): The background clip, without the captions.
+            caption_tracks (list[CaptionTrack]): The captions blended on top.
+            audio_filename (str | None): The audio file of the video,
+                read by ffmpeg directly.
+            duration (float): The duration of the video in seconds.
+            fps (float): The frames per second of the video.
+            encoder_settings (EncoderSettings): The x264 and audio settings.
+            queue_size (int): The maximum frames waiting between two stages.
+            frame_range (tuple[int, int] | None): The first frame and the
+                frame after the last to render, `None` for the whole duration.
+            audio_start (float): The time in seconds the audio is read from,
+                for renders that do not start at the beginning.
+
+        """
+        self._clip: VideoClip = clip
+        self._caption_tracks: list[CaptionTrack] = caption_tracks
+        self._audio_filename: str | None = audio_filename
+        self._audio_start: float = audio_start
+        self._fps: float = fps
+        self._encoder_settings: EncoderSettings = encoder_settings
+        self._frame_range: tuple[int, int] = frame_range or (
+            0,
+            int(duration * fps),
+        )
+
+        # queues between the stages, the free buffers go back from
+        # the encoder to the decoder
+        self._decoded_queue: Queue[_FrameItem | None] = Queue(maxsize=queue_size)
+        self._composited_queue: Queue[_FrameItem | None] = Queue(maxsize=queue_size)
+        self._free_buffers: Queue[np.ndarray] = Queue()
+        self._buffer_count: int = queue_size * 2 + 2
+
+        self._stop_event: Event = Event()
+        self._errors: list[BaseException] = []
+
+        self.stage_statistics: dict[str, StageStatistics] = {
+            name: StageStatistics(name=name)
+            for name in ("decode", "composite", "encode")
+        }
+
+    def render(self, filename: str, logger: ProgressBarLogger) -> None:
+        """Render the clip into a video file.
+
+        Args:
+            filename (str): The output video filename.
+            logger (ProgressBarLogger): The progress logger, it gets the
+                `frame_index` bar like `write_videofile` does.
+
+        Raises:
+            BaseException: The first error raised by a stage.
+
+        """
+        width, height = self._clip.size
+        for _ in range(self._buffer_count):
+            self._free_buffers.put(np.empty((height, width, 3), dtype=np.uint8))
+
+        first_frame, last_frame = self._frame_range
+        with FfmpegPipeEncoder(
+            filename,
+            size=(width, height),
+            fps=self._fps,
+            settings=self._encoder_settings,
+            audio_filename=self._audio_filename,
+            audio_start=self._audio_start,
+            duration=(last_frame - first_frame) / self._fps,
+        ) as encoder:
+            self._run_stages(encoder, logger)
+
+    def _run_stages(self, encoder: FfmpegPipeEncoder, logger: ProgressBarLogger):
+        """Run decode and composite threads, and encode on this thread."""
+        first_frame, last_frame = self._frame_range
+        total_frames = last_frame - first_frame
+        threads = [
+            Thread(
+                target=self._run_stage, args=(self._decode, first_frame, last_frame)
+            ),
+            Thread(target=self._run_stage, args=(self._composite,)),
+        ]
+        for thread in threads:
+            thread.start()
+
+        try:
+            self._run_stage(self._encode, encoder, logger, total_frames)
+        finally:
+            # unblock the other stages if encoding stopped early
+            self._stop_event.set()
+            for thread in threads:
+                thread.join()
+
+        if self._errors:
+            raise self._errors[0]
+
+    def _run_stage(self, stage: Any, *args: Any) -> None:
+        """Run a stage and stop every other stage if it fails."""
+        try:
+            stage(*args)
+        except BaseException as error:
+            self._errors.append(error)
+            self._stop_event.set()
+
+    def _put(self, queue: Queue[Any], item: Any) -> bool:
+        """Put an item on a queue, give up if the render is stopped."""
+        while not self._stop_event.is_set():
+            try:
+                queue.put(item, timeout=self._POLL_SECONDS)
+                return True
+            except Full:
+                continue
+        return False
+
+    def _get(self, queue: Queue[Any]) -> Any:
+        """Get an item from a queue, `None` if the render is stopped."""
+        while not self._stop_event.is_set():
+            try:
+                return queue.get(timeout=self._POLL_SECONDS)
+            except Empty:
+                continue
+        return None
+
+    def _decode(self, first_frame: int, last_frame: int) -> None:
+        """Decode the background frames into the buffers of the pool."""
+        statistics = self.stage_statistics["decode"]
+
+        for index in range(first_frame, last_frame):
+            buffer = self._get(self._free_buffers)
+            if buffer is None:
+                return
+
+            start = perf_counter()
+            t = index / self._fps
+            np.copyto(buffer, self._clip.get_frame(t), casting="unsafe")
+            statistics.busy_seconds += perf_counter() - start
+            statistics.frames += 1
+
+            if not self._put(self._decoded_queue, _FrameItem(index, t, buffer)):
+                return
+
+        self._put(self._decoded_queue, None)
+
+    def _composite(self) -> None:
+        """Blend the captions into the decoded frames."""
+        statistics = self.stage_statistics["composite"]
+
+        while (item := self._get(self._decoded_queue)) is not None:
+            start = perf_counter()
+            for caption_track in self._caption_tracks:
+                caption_track.composite_in_place(item.frame, item.t)
+            statistics.busy_seconds += perf_counter() - start
+            statistics.frames += 1
+
+            if not self._put(self._composited_queue, item):
+                return
+
+        self._put(self._composited_queue, None)
+
+    def _encode(
+        self, encoder: FfmpegPipeEncoder, logger: ProgressBarLogger, total_frames: int
+    ) -> None:
+        """Write the frames to ffmpeg and give the buffers back to the pool."""
+        statistics = self.stage_statistics["encode"]
+
+        # the frames come in order, one per index of the progress bar
+        for _ in logger.iter_bar(frame_index=range(total_frames)):
+            item = self._get(self._composited_queue)
+            if item is None:
+                return
+
+            start = perf_counter()
+            encoder.write_frame(item.frame)
+            statistics.busy_seconds += perf_counter() - start
+            statistics.frames += 1
+
+            self._free_buffers.put(item.frame)
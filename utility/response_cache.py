@@ -0,0 +1,164 @@
+"""Cache of the generated scripts.
+
+Generating again from the same idea, theme and model always paid the
+full latency and cost of the text model. Here the responses are kept
+under `cache/responses/`, keyed by the provider, the model, the whole
+prompt and the request parameters. A few variants are kept per key, so
+clicking generate again first fetches new alternatives, then goes once
+through the ones already fetched without waiting, then fetches a fresh
+one again.
+"""
+
+import json
+from os import makedirs
+from os.path import join
+from threading import Lock
+from time import time
+from typing import Any
+
+from utility.cache_manager import CACHE_MANAGER
+from utility.tools import atomic_write, create_hash_content
+
+
+class ResponseCache:
+    """Keep the text model responses with a few variants per request.
+
+    Methods:
+        get_key(provider, model, prompt, params): Get the key of a request.
+        get(key): Get the next cached variant of a request, if it is not
+            time for a new one.
+        add(key, response): Keep a new variant of a request.
+
+    """
+
+    def __init__(
+        self,
+        directory: str = "cache/responses/",
+        ttl_seconds: float = 7 * 24 * 60 * 60,
+        max_variants: int = 3,
+    ):
+        """Initialize ResponseCache.
+
+        Args:
+            directory (str): The folder of the cached responses.
+            ttl_seconds (float): How long a variant is kept, older ones
+                are fetched again.
+            max_variants (int): How many variants are kept for a request,
+                each of them is given back once before a new one is fetched.
+
+        """
+        self._directory: str = directory
+        self._ttl_seconds: float = ttl_seconds
+        self._max_variants: int = max_variants
+        self._lock: Lock = Lock()
+
+    def get_key(
+        self, provider: str, model: str, prompt: str, params: dict[str, Any]
+    ) -> str:
+        """Get the key of a request.
+
+        Args:
+            provider (str): The text model service, like "Openai".
+            model (str): The model name.
+            prompt (str): The whole prompt with the messages sent.
+            params (dict[str, Any]): The sampling and request parameters.
+
+        Returns:
+            str: The hash key.
+
+        """
+        return create_hash_content(
+            json.dumps(
+                {
+                    "provider": provider,
+                    "model": model,
+                    "prompt": prompt,
+                    "params": params,
+                },
+                sort_keys=True,
+            )
+        )
+
+    def _get_filepath(self, key: str) -> str:
+        """Get the cache filepath of a request."""
+        return join(self._directory, f"response_{key}.json")
+
+    def _load(self, filepath: str) -> dict[str, Any]:
+        """Load the variants of a request, without the expired ones."""
+        entry: dict[str, Any] = {"variants": [], "next": 0}
+        if not CACHE_MANAGER.lookup(filepath):
+            return entry
+
+        try:
+            with open(filepath, "r", encoding="utf-8") as file:
+                entry = json.load(file)
+        except (OSError, ValueError):
+            # broken file, the request is fetched and saved again
+            return entry
+
+        now = time()
+        entry["variants"] = [
+            variant
+            for variant in entry["variants"]
+            if now - variant["created"] <= self._ttl_seconds
+        ]
+        return entry
+
+    def _save(self, filepath: str, entry: dict[str, Any]) -> None:
+        """Save the variants of a request."""
+        makedirs(self._directory, exist_ok=True)
+        with atomic_write(filepath) as temporary_filepath:
+            with open(temporary_filepath, "w", encoding="utf-8") as file:
+                json.dump(entry, file)
+        CACHE_MANAGER.store(filepath)
+
+    def get(self, key: str) -> str | None:
+        """Get the next cached variant of a request.
+
+        Args:
+            key (str): The key from `get_key`.
+
+        Returns:
+            str | None: The next variant in turn, `None` to fetch a new one
+                while there are less than `max_variants` of them or after
+                each of them was given back since the last one was fetched.
+
+        """
+        filepath = self._get_filepath(key)
+        with self._lock:
+            entry = self._load(filepath)
+            variants = entry["variants"]
+            index = entry["next"]
+            if len(variants) < self._max_variants or index >= len(variants):
+                return None
+
+            entry["next"] = index + 1
+            self._save(filepath, entry)
+            return variants[index]["text"]
+
+    def add(self, key: str, response: str) -> None:
+        """Keep a new variant of a request.
+
+        Args:
+            key (str): The key from `get_key`.
+            response (str): The response of the text model, the oldest
+                variant is dropped when there are more than `max_variants`.
+
+        """
+        if not response:
+            return
+
+        filepath = self._get_filepath(key)
+        with self._lock:
+            entry = self._load(filepath)
+            entry["variants"] = (
+                entry["variants"] + [{"text": response, "created": time()}]
+            )[-self._max_variants :]
+
+            # a new round through the kept variants, oldest first
+            entry["next"] = 0
+            self._save(filepath, entry)
+
+
+# shared between all text generations of the program
+RESPONSE_CACHE = ResponseCache()
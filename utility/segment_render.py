@@ -0,0 +1,313 @@
+"""Render the video in segments across a pool of processes.
+
+One render only uses one compositing thread. Here the timeline is split
+into segments, each one rendered by a worker process with its own
+background reader, its own slice of the captions and its own x264.
+Every part starts on a fresh keyframe, so ffmpeg joins them with the
+concat demuxer by copying the video stream, without encoding again.
+"""
+
+import subprocess as sp
+from concurrent.futures import Future, ProcessPoolExecutor
+from dataclasses import dataclass, replace
+from multiprocessing import get_context
+from os import cpu_count, makedirs
+from os.path import abspath, join
+from queue import Empty
+from shutil import rmtree
+from tempfile import mkdtemp
+from typing import Any, override
+
+from moviepy import VideoFileClip
+from moviepy.config import FFMPEG_BINARY
+from proglog import ProgressBarLogger
+
+from utility.caption_track import CaptionTrack
+from utility.ffmpeg_encoder import EncoderSettings
+from utility.render_engine import ThreadedRenderEngine
+
+
+@dataclass
+class SegmentJob:
+    """The work of a worker process, everything in it is picklable.
+
+    Attributes:
+        index (int): The index of the segment on the timeline.
+        background_filename (str): The background video file.
+        background_start (float): The time in seconds the background
+            is subclipped from.
+        frame_range (tuple[int, int]): The first frame and the frame after
+            the last of the segment.
+        fps (float): The frames per second of the video.
+        caption_tracks (list[CaptionTrack]): The captions of the segment only.
+        encoder_settings (EncoderSettings): The x264 settings.
+        filename (str): The output file of the segment.
+
+    """
+
+    index: int
+    background_filename: str
+    background_start: float
+    frame_range: tuple[int, int]
+    fps: float
+    caption_tracks: list[CaptionTrack]
+    encoder_settings: EncoderSettings
+    filename: str
+
+
+class _QueueProgressLogger(ProgressBarLogger):
+    """Send the frame progress of a worker to the main process."""
+
+    def __init__(self, segment_index: int, progress_queue: Any):
+        """Initialize the logger of a segment."""
+        super().__init__()
+        self._segment_index: int = segment_index
+        self._progress_queue: Any = progress_queue
+
+    @override
+    def bars_callback(self, bar: str, attr: str, value: int, old_value: Any = None):
+        """Send the frames done of the segment."""
+        if bar == "frame_index" and attr == "index":
+            self._progress_queue.put((self._segment_index, value))
+
+
+def render_segment(job: SegmentJob, progress_queue: Any) -> str:
+    """Render a segment, this runs on a worker process.
+
+    Args:
+        job (SegmentJob): The segment to render.
+        progress_queue (Any): The managed queue of the progress,
+            it gets `(segment_index, frames_done)`.
+
+    Returns:
+        str: The output file of the segment.
+
+    """
+    # subclipped the same way as the main process did, so the frame
+    # times are computed the same
+    background = VideoFileClip(job.background_filename, audio=False)
+    clip = background.subclipped(job.background_start)
+
+    try:
+        engine = ThreadedRenderEngine(
+            clip=clip,
+            caption_tracks=job.caption_tracks,
+            audio_filename=None,
+            duration=0,
+            fps=job.fps,
+            encoder_settings=job.encoder_settings,
+            frame_range=job.frame_range,
+        )
+        engine.render(
+            job.filename,
+            logger=_QueueProgressLogger(job.index, progress_queue),
+        )
+    finally:
+        background.close()
+
+    return job.filename
+
+
+class SegmentRenderer:
+    """Render a video in segments on a process pool and join them.
+
+    Methods:
+        render(filename, logger): Render the video into a file.
+
+    """
+
+    # the main process reads the progress of the workers this often
+    _POLL_SECONDS: float = 0.2
+
+    def __init__(
+        self,
+        background_filename: str,
+        background_start: float,
+        caption_tracks: list[CaptionTrack],
+        audio_filename: str | None,
+        duration: float,
+        fps: float,
+        encoder_settings: EncoderSettings,
+        workers: int | None = None,
+        directory: str = "cache/segments/",
+    ):
+        """Initialize SegmentRenderer.
+
+        Args:
+            background_filename (str): The background video file.
+            background_start (float): The time in seconds the background
+                is subclipped from.
+            caption_tracks (list[CaptionTrack]): The captions of the video.
+            audio_filename (str | None): The audio file of the video,
+                added when joining the segments.
+            duration (float): The duration of the video in seconds.
+            fps (float): The frames per second of the video.
+            encoder_settings (EncoderSettings): The x264 and audio settings.
+            workers (int | None): The worker processes, `None` for one per core.
+            directory (str): The folder of the temporary segment files.
+
+        """
+        self._background_filename: str = background_filename
+        self._background_start: float = background_start
+        self._caption_tracks: list[CaptionTrack] = caption_tracks
+        self._audio_filename: str | None = audio_filename
+        self._fps: float = fps
+        self._total_frames: int = int(duration * fps)
+        self._encoder_settings: EncoderSettings = encoder_settings
+        self._workers: int = workers or cpu_count() or 1
+        self._directory: str = directory
+
+    def _split_frames(self) -> list[tuple[int, int]]:
+        """Split the frames into segments of whole seconds.
+
+        Each segment is at least a second long, shorter videos get
+        less segments than workers.
+        """
+        seconds = max(1, int(self._total_frames / self._fps))
+        segment_count = max(1, min(self._workers, seconds))
+
+        # the boundaries are the frames at whole seconds, counted from
+        # the real fps so 29.97 does not drift like a rounded 30 would
+        boundaries = [
+            int(round(seconds * index / segment_count) * self._fps + 1e-9)
+            for index in range(segment_count)
+        ] + [self._total_frames]
+
+        return list(zip(boundaries[:-1], boundaries[1:]))
+
+    def _create_jobs(self, directory: str) -> list[SegmentJob]:
+        """Create the job of every segment."""
+        frame_ranges = self._split_frames()
+
+        # x264 threads are shared between the workers
+        encoder_settings = self._encoder_settings
+        if encoder_settings.threads is None:
+            encoder_settings = replace(
+                encoder_settings,
+                threads=max(1, (cpu_count() or 1) // len(frame_ranges)),
+            )
+
+        return [
+            SegmentJob(
+                index=index,
+                background_filename=self._background_filename,
+                background_start=self._background_start,
+                frame_range=(first_frame, last_frame),
+                fps=self._fps,
+                caption_tracks=[
+                    caption_track.get_slice(
+                        first_frame / self._fps, last_frame / self._fps
+                    )
+                    for caption_track in self._caption_tracks
+                ],
+                encoder_settings=encoder_settings,
+                filename=join(directory, f"segment_{index:04d}.mp4"),
+            )
+            for index, (first_frame, last_frame) in enumerate(frame_ranges)
+        ]
+
+    def render(self, filename: str, logger: ProgressBarLogger) -> None:
+        """Render the video into a file.
+
+        Args:
+            filename (str): The output video filename.
+            logger (ProgressBarLogger): The progress logger, it gets the
+                `frame_index` bar with the frames of all workers.
+
+        """
+        makedirs(self._directory, exist_ok=True)
+        directory = mkdtemp(dir=self._directory)
+
+        try:
+            jobs = self._create_jobs(directory)
+            self._render_jobs(jobs, logger)
+            self._concat(
+                directory=directory,
+                segment_filenames=[job.filename for job in jobs],
+                filename=filename,
+            )
+        finally:
+            rmtree(directory, ignore_errors=True)
+
+    def _render_jobs(self, jobs: list[SegmentJob], logger: ProgressBarLogger) -> None:
+        """Render the segments on the pool and combine their progress."""
+        # spawn does not inherit the threads and the window of the app
+        context = get_context("spawn")
+        frames_done = [0] * len(jobs)
+        logger(frame_index__total=self._total_frames)
+
+        with context.Manager() as manager:
+            progress_queue = manager.Queue()
+            with ProcessPoolExecutor(
+                max_workers=len(jobs), mp_context=context
+            ) as executor:
+                futures: list[Future[str]] = [
+                    executor.submit(render_segment, job, progress_queue) for job in jobs
+                ]
+
+                while not all(future.done() for future in futures):
+                    try:
+                        segment_index, value = progress_queue.get(
+                            timeout=self._POLL_SECONDS
+                        )
+                    except Empty:
+                        continue
+                    frames_done[segment_index] = value
+                    logger(frame_index__index=sum(frames_done))
+
+                # raise the first error of the workers
+                for future in futures:
+                    future.result()
+
+        logger(frame_index__index=self._total_frames)
+
+    def _concat(
+        self, directory: str, segment_filenames: list[str], filename: str
+    ) -> None:
+        """Join the segments with the concat demuxer and add the audio.
+
+        Raises:
+            IOError: If ffmpeg failed to join the segments.
+
+        """
+        list_filename = join(directory, "segments.txt")
+        with open(list_filename, "w", encoding="utf-8") as file:
+            for segment_filename in segment_filenames:
+                file.write(f"file '{abspath(segment_filename)}'\n")
+
+        command = [
+            FFMPEG_BINARY,
+            "-y",
+            "-loglevel",
+            "error",
+            "-f",
+            "concat",
+            "-safe",
+            "0",
+            "-i",
+            list_filename,
+        ]
+        if self._audio_filename is not None:
+            command.extend(["-i", self._audio_filename])
+
+        # the video is copied as is, only the audio is encoded
+        command.extend(["-map", "0:v", "-c:v", "copy"])
+        if self._audio_filename is not None:
+            command.extend(
+                [
+                    "-map",
+                    "1:a",
+                    "-c:a",
+                    self._encoder_settings.audio_codec,
+                    "-b:a",
+                    self._encoder_settings.audio_bitrate,
+                ]
+            )
+        command.extend(["-movflags", "+faststart", filename])
+
+        process = sp.run(command, stdout=sp.DEVNULL, stderr=sp.PIPE)
+        if process.returncode != 0:
+            raise IOError(
+                f"ffmpeg failed to join the segments of {filename}: "
+                f"{process.stderr.decode(errors='replace').strip()}"
+            )
@@ -0,0 +1,241 @@
+"""Word sprite cache for caption rendering.
+
+Rasterizing a word with its stroke through Pillow is the slowest part
+of building captions, and the same words come back again and again.
+Sprites are kept in an in-memory LRU and optionally saved on disk
+under `cache/sprites/` so they survive between videos.
+"""
+
+import json
+from collections import OrderedDict
+from dataclasses import asdict, dataclass, field
+from functools import cached_property
+from os import makedirs
+from os.path import join
+from threading import Lock
+
+import numpy as np
+from moviepy import TextClip
+from PIL import Image
+
+from utility.cache_manager import CACHE_MANAGER
+from utility.blend import PreparedSprite, prepare_sprite, tint_image
+from utility.tools import atomic_write, create_hash_content
+
+
+@dataclass(frozen=True)
+class SpriteKey:
+    """The style of a rendered word, used as the cache key."""
+
+    word: str
+    font: str
+    font_size: int
+    color: str
+    stroke_width: int
+    stroke_color: str
+
+    def get_hash(self) -> str:
+        """Get the sha256 hash of the key for the disk filename."""
+        return create_hash_content(json.dumps(asdict(self), sort_keys=True))
+
+
+@dataclass
+class WordSprite:
+    """A rasterized word.
+
+    Attributes:
+        image (np.ndarray): The RGB pixels, shape (height, width, 3) as uint8.
+        alpha (np.ndarray): The alpha pixels, shape (height, width) as uint8.
+
+    """
+
+    image: np.ndarray
+    alpha: np.ndarray
+    _tinted_sprites: dict[str, PreparedSprite] = field(
+        default_factory=dict, init=False, repr=False, compare=False
+    )
+
+    @property
+    def size(self) -> tuple[int, int]:
+        """The width and height of the sprite."""
+        height, width = self.alpha.shape
+        return width, height
+
+    @cached_property
+    def prepared(self) -> PreparedSprite:
+        """The sprite prepared for blending, computed once."""
+        return prepare_sprite(self.image, self.alpha)
+
+    def get_tinted(self, color: str) -> PreparedSprite:
+        """Get the sprite recolored with a tint, prepared for blending.
+
+        Args:
+            color (str): The tint color name or hex, like "yellow".
+
+        Returns:
+            PreparedSprite: The tinted sprite, computed once per color.
+
+        """
+        tinted = self._tinted_sprites.get(color)
+        if tinted is None:
+            tinted = prepare_sprite(tint_image(self.image, color), self.alpha)
+            self._tinted_sprites[color] = tinted
+        return tinted
+
+    def get_scaled(self, scale: float) -> "WordSprite":
+        """Get a resized copy of the sprite, for lower resolution renders.
+
+        Args:
+            scale (float): The scale of the copy, like 0.5 for half size.
+
+        Returns:
+            WordSprite: The resized sprite, at least one pixel wide and high.
+
+        """
+        width, height = self.size
+        size = (max(1, round(width * scale)), max(1, round(height * scale)))
+
+        # pillow resizes RGBA with premultiplied alpha, no dark fringes
+        image = Image.fromarray(np.dstack([self.image, self.alpha]), mode="RGBA")
+        resized = np.asarray(image.resize(size, Image.Resampling.BILINEAR))
+
+        return WordSprite(
+            image=np.ascontiguousarray(resized[..., :3]),
+            alpha=np.ascontiguousarray(resized[..., 3]),
+        )
+
+
+class SpriteCache:
+    """In-memory LRU of word sprites with an optional on-disk tier.
+
+    Methods:
+        get(word, font, font_size, color, stroke_width, stroke_color):
+            Get the sprite of a word, rasterize it only when not cached.
+        clear: Remove all sprites from memory.
+
+    """
+
+    def __init__(
+        self, max_entries: int = 1024, directory: str | None = "cache/sprites/"
+    ):
+        """Initialize SpriteCache.
+
+        Args:
+            max_entries (int): The maximum number of sprites kept in memory.
+            directory (str | None): The folder of the on-disk tier,
+                `None` to keep the sprites in memory only.
+
+        """
+        self._max_entries: int = max_entries
+        self._directory: str | None = directory
+        self._sprites: OrderedDict[SpriteKey, WordSprite] = OrderedDict()
+        self._lock: Lock = Lock()
+
+    def get(
+        self,
+        word: str,
+        font: str,
+        font_size: int,
+        color: str,
+        stroke_width: int,
+        stroke_color: str = "black",
+    ) -> WordSprite:
+        """Get the sprite of a word, rasterize it only when not cached.
+
+        Args:
+            word (str): The text to render.
+            font (str): The font path.
+            font_size (int): The font size.
+            color (str): The fill color of the text.
+            stroke_width (int): The stroke width around the text.
+            stroke_color (str): The stroke color around the text.
+
+        Returns:
+            WordSprite: The rendered word.
+
+        """
+        key = SpriteKey(
+            word=word,
+            font=font,
+            font_size=font_size,
+            color=color,
+            stroke_width=stroke_width,
+            stroke_color=stroke_color,
+        )
+
+        with self._lock:
+            sprite = self._sprites.get(key)
+            if sprite is not None:
+                self._sprites.move_to_end(key)
+                return sprite
+
+        sprite = self._load_from_disk(key)
+        if sprite is None:
+            sprite = self._rasterize(key)
+            self._save_to_disk(key, sprite)
+
+        with self._lock:
+            self._sprites[key] = sprite
+            if len(self._sprites) > self._max_entries:
+                self._sprites.popitem(last=False)
+
+        return sprite
+
+    def clear(self) -> None:
+        """Remove all sprites from memory."""
+        with self._lock:
+            self._sprites.clear()
+
+    def _rasterize(self, key: SpriteKey) -> WordSprite:
+        """Render the word with moviepy, the same way a TextClip does."""
+        text_clip = TextClip(
+            text=key.word,
+            color=key.color,
+            font=key.font,
+            font_size=key.font_size,
+            stroke_width=key.stroke_width,
+            stroke_color=key.stroke_color,
+        )
+        image = np.ascontiguousarray(text_clip.img, dtype=np.uint8)
+        alpha = (
+            np.rint(text_clip.mask.img * 255).astype(np.uint8)
+            if text_clip.mask is not None
+            else np.full(image.shape[:2], 255, dtype=np.uint8)
+        )
+        text_clip.close()
+
+        return WordSprite(image=image, alpha=alpha)
+
+    def _get_disk_path(self, key: SpriteKey) -> str | None:
+        """Get the disk path of the sprite."""
+        if self._directory is None:
+            return None
+        return join(self._directory, f"sprite_{key.get_hash()}.npz")
+
+    def _load_from_disk(self, key: SpriteKey) -> WordSprite | None:
+        """Load the sprite from the disk tier if saved."""
+        path = self._get_disk_path(key)
+        if path is None or not CACHE_MANAGER.lookup(path):
+            return None
+
+        try:
+            with np.load(path) as data:
+                return WordSprite(image=data["image"], alpha=data["alpha"])
+        except (OSError, ValueError, KeyError):
+            # broken file, it will be rasterized and saved again
+            return None
+
+    def _save_to_disk(self, key: SpriteKey, sprite: WordSprite) -> None:
+        """Save the sprite on the disk tier."""
+        path = self._get_disk_path(key)
+        if path is None or self._directory is None:
+            return
+
+        makedirs(self._directory, exist_ok=True)
+        with atomic_write(path) as temporary_path:
+            np.savez(temporary_path, image=sprite.image, alpha=sprite.alpha)
+        CACHE_MANAGER.store(path)
+
+
+# shared between all renders of the program
+SPRITE_CACHE = SpriteCache()
@@ -0,0 +1,368 @@
+"""Thumbnails and contact sheets of the clips and videos.
+
+Showing a preview used to load a font, open the video and decode a
+frame on the Tk thread on every click. Here the thumbnails are made in
+the background by a pool of workers for the rows that are visible on the
+lists, and the contact sheet, a strip of frames across the whole video
+for scrubbing on hover, only for the selected file. They are kept as PNG
+under `cache/thumbnails/`, keyed by the path and modified time of the
+file, and the most recently used ones in memory, so showing one is a
+dictionary lookup.
+"""
+
+import subprocess as sp
+from bisect import bisect_right
+from collections import OrderedDict
+from concurrent.futures import Future, ThreadPoolExecutor
+from os import makedirs, stat
+from os.path import abspath, isfile, join
+from threading import Lock
+from typing import Any, Callable
+
+from moviepy.config import FFMPEG_BINARY
+from PIL import Image
+
+from utility.cache_manager import CACHE_MANAGER
+from utility.keyframe_index import KEYFRAME_INDEX
+from utility.media_index import MEDIA_INDEX
+from utility.proxy import PROXY_CACHE
+from utility.tools import atomic_write, create_hash_content
+
+
+class ThumbnailCache:
+    """Make thumbnails and contact sheets on a background worker pool.
+
+    Methods:
+        get_thumbnail(filepath): Get the thumbnail of a file if it is ready.
+        get_strip(filepath): Get the contact sheet frames of a file if
+            they are ready.
+        request(filepath, on_ready): Make the thumbnail of a file in the
+            background if it is not made yet.
+        request_strip(filepath, on_ready): Make the contact sheet of a
+            file in the background if it is not made yet.
+        prefetch(filepaths): Request the thumbnails of the visible files.
+
+    """
+
+    def __init__(
+        self,
+        directory: str = "cache/thumbnails/",
+        size: tuple[int, int] = (200, 420),
+        strip_frames: int = 12,
+        thumbnail_time: float = 2,
+        workers: int = 2,
+        max_thumbnails: int = 100,
+        max_strips: int = 4,
+    ):
+        """Initialize ThumbnailCache.
+
+        Args:
+            directory (str): The folder of the thumbnail files.
+            size (tuple[int, int]): The width and height of the thumbnails
+                and of each frame of the contact sheets.
+            strip_frames (int): The frames of a contact sheet.
+            thumbnail_time (float): The time in seconds of the thumbnail frame.
+            workers (int): The threads making the thumbnails.
+            max_thumbnails (int): The thumbnails kept in memory, the least
+                recently used are loaded from disk again.
+            max_strips (int): The contact sheets kept in memory, each one
+                is `strip_frames` thumbnails.
+
+        """
+        self._directory: str = directory
+        self._size: tuple[int, int] = size
+        self._strip_frames: int = strip_frames
+        self._thumbnail_time: float = thumbnail_time
+        self._max_thumbnails: int = max_thumbnails
+        self._max_strips: int = max_strips
+
+        # the work is in ffmpeg processes, threads are enough
+        self._executor: ThreadPoolExecutor = ThreadPoolExecutor(max_workers=workers)
+        self._thumbnails: OrderedDict[str, Image.Image] = OrderedDict()
+        self._strips: OrderedDict[str, list[Image.Image]] = OrderedDict()
+        self._pending: dict[str, Future[str]] = {}
+        self._prefetched: set[str] = set()
+        self._lock: Lock = Lock()
+
+    def _get_key(self, filepath: str) -> str:
+        """Get the key of a file from its path and modified time."""
+        return create_hash_content(
+            f"{abspath(filepath)}-{stat(filepath).st_mtime_ns}-"
+            f"{self._size}-{self._strip_frames}-{self._thumbnail_time}"
+        )
+
+    def _get_recent(self, images: OrderedDict[str, Any], key: str) -> Any:
+        """Get an image from memory and mark it recently used, lock held."""
+        image = images.get(key)
+        if image is not None:
+            images.move_to_end(key)
+        return image
+
+    def _remember(
+        self, images: OrderedDict[str, Any], key: str, image: Any, max_count: int
+    ) -> None:
+        """Keep an image in memory, dropping the least recently used."""
+        with self._lock:
+            images[key] = image
+            images.move_to_end(key)
+            while len(images) > max_count:
+                images.popitem(last=False)
+
+    def get_thumbnail(self, filepath: str) -> Image.Image | None:
+        """Get the thumbnail of a file if it is ready.
+
+        Args:
+            filepath (str): The path of the clip or video.
+
+        Returns:
+            Image.Image | None: The thumbnail, `None` if not made yet or
+                no longer in memory.
+
+        """
+        if not isfile(filepath):
+            return None
+
+        with self._lock:
+            return self._get_recent(self._thumbnails, self._get_key(filepath))
+
+    def get_strip(self, filepath: str) -> list[Image.Image] | None:
+        """Get the contact sheet frames of a file if they are ready.
+
+        Args:
+            filepath (str): The path of the clip or video.
+
+        Returns:
+            list[Image.Image] | None: The frames from the start to the
+                end of the file, `None` if not made yet or no longer in
+                memory.
+
+        """
+        if not isfile(filepath):
+            return None
+
+        with self._lock:
+            return self._get_recent(self._strips, self._get_key(filepath))
+
+    def request(
+        self, filepath: str, on_ready: Callable[[str], None] | None = None
+    ) -> Future[str]:
+        """Make the thumbnail of a file in the background if not made yet.
+
+        Args:
+            filepath (str): The path of the clip or video.
+            on_ready (Callable[[str], None] | None): Called with the path
+                when the thumbnail is ready, on the worker thread.
+
+        Returns:
+            Future[str]: The path of the file when the thumbnail is ready.
+
+        """
+        key = f"thumbnail_{self._get_key(filepath)}"
+
+        # asked for, a prefetch of other rows must not cancel it
+        with self._lock:
+            self._prefetched.discard(key)
+        return self._submit(key, self._make_thumbnail, filepath, on_ready)
+
+    def request_strip(
+        self, filepath: str, on_ready: Callable[[str], None] | None = None
+    ) -> Future[str]:
+        """Make the contact sheet of a file in the background if not made yet.
+
+        Args:
+            filepath (str): The path of the clip or video.
+            on_ready (Callable[[str], None] | None): Called with the path
+                when the contact sheet is ready, on the worker thread.
+
+        Returns:
+            Future[str]: The path of the file when the contact sheet is ready.
+
+        """
+        key = f"strip_{self._get_key(filepath)}"
+        return self._submit(key, self._make_strip, filepath, on_ready)
+
+    def _submit(
+        self,
+        key: str,
+        make: Callable[[str, str], str],
+        filepath: str,
+        on_ready: Callable[[str], None] | None,
+    ) -> Future[str]:
+        """Run `make` on a worker unless it is already pending for the key."""
+        with self._lock:
+            future = self._pending.get(key)
+            if future is None or future.cancelled():
+                future = self._executor.submit(make, filepath, key)
+                self._pending[key] = future
+
+        if on_ready is not None:
+            future.add_done_callback(
+                lambda done: (
+                    on_ready(filepath)
+                    if not done.cancelled() and done.exception() is None
+                    else None
+                )
+            )
+
+        return future
+
+    def prefetch(self, filepaths: list[str]) -> None:
+        """Request the thumbnails of the visible files.
+
+        Args:
+            filepaths (list[str]): The paths of the clips or videos on the
+                visible rows, the prefetches of rows scrolled away that did
+                not start yet are dropped.
+
+        """
+        keys = set()
+        for filepath in filepaths:
+            if isfile(filepath) and self.get_thumbnail(filepath) is None:
+                key = f"thumbnail_{self._get_key(filepath)}"
+                keys.add(key)
+                self._submit(key, self._make_thumbnail, filepath, None)
+
+        with self._lock:
+            for key in self._prefetched - keys:
+                future = self._pending.get(key)
+                if future is not None and future.cancel():
+                    del self._pending[key]
+            self._prefetched = keys
+
+    def _make_thumbnail(self, filepath: str, key: str) -> str:
+        """Load or make the thumbnail, on a worker."""
+        try:
+            # the windows show the metadata of the file next to its
+            # thumbnail, it is indexed here and not on the Tk thread
+            MEDIA_INDEX.get_metadata(filepath)
+
+            thumbnail_path = join(self._directory, f"{key}.png")
+            if not CACHE_MANAGER.lookup(thumbnail_path):
+                self._render_thumbnail(filepath, thumbnail_path)
+                CACHE_MANAGER.store(thumbnail_path)
+
+            thumbnail = Image.open(thumbnail_path)
+            thumbnail.load()
+
+            self._remember(
+                self._thumbnails,
+                key.removeprefix("thumbnail_"),
+                thumbnail,
+                self._max_thumbnails,
+            )
+            return filepath
+        finally:
+            with self._lock:
+                self._pending.pop(key, None)
+                self._prefetched.discard(key)
+
+    def _make_strip(self, filepath: str, key: str) -> str:
+        """Load or make the contact sheet, on a worker."""
+        try:
+            strip_path = join(self._directory, f"{key}.png")
+            if not CACHE_MANAGER.lookup(strip_path):
+                self._render_strip(filepath, strip_path)
+                CACHE_MANAGER.store(strip_path)
+
+            strip = Image.open(strip_path)
+            strip.load()
+
+            # the contact sheet is one image, frames side by side
+            width, height = self._size
+            frames = [
+                strip.crop((index * width, 0, (index + 1) * width, height))
+                for index in range(strip.width // width)
+            ]
+
+            self._remember(
+                self._strips, key.removeprefix("strip_"), frames, self._max_strips
+            )
+            return filepath
+        finally:
+            with self._lock:
+                self._pending.pop(key, None)
+
+    def _render_thumbnail(self, filepath: str, thumbnail_path: str) -> None:
+        """Decode the frame of the thumbnail with ffmpeg."""
+        # the same file a preview of the clip would decode
+        source = PROXY_CACHE.get_proxy(filepath) or filepath
+        duration = MEDIA_INDEX.get_metadata(source).duration
+
+        thumbnail = self._read_frame(source, min(self._thumbnail_time, duration / 2))
+        self._save(thumbnail, thumbnail_path)
+
+    def _render_strip(self, filepath: str, strip_path: str) -> None:
+        """Decode the frames of the contact sheet with ffmpeg."""
+        source = PROXY_CACHE.get_proxy(filepath) or filepath
+        duration = MEDIA_INDEX.get_metadata(source).duration
+
+        # the keyframe before the middle of each equal part of the video,
+        # only keyframes are decoded for the contact sheet
+        keyframes = KEYFRAME_INDEX.get_keyframes(source) or [0]
+        width, height = self._size
+        strip = Image.new("RGB", (width * self._strip_frames, height))
+        for index in range(self._strip_frames):
+            middle = duration * (index + 0.5) / self._strip_frames
+            t = keyframes[max(0, bisect_right(keyframes, middle) - 1)]
+            strip.paste(self._read_frame(source, t, accurate=False), (index * width, 0))
+
+        self._save(strip, strip_path)
+
+    def _save(self, image: Image.Image, path: str) -> None:
+        """Save an image as PNG in the thumbnail folder."""
+        makedirs(self._directory, exist_ok=True)
+        with atomic_write(path) as temporary_path:
+            image.save(temporary_path, format="PNG")
+
+    def _read_frame(
+        self, filepath: str, t: float, accurate: bool = True
+    ) -> Image.Image:
+        """Read a frame scaled to the thumbnail size.
+
+        Not accurate frames only decode keyframes, `t` must be the time
+        of a keyframe.
+
+        Raises:
+            IOError: If ffmpeg could not decode the frame.
+
+        """
+        width, height = self._size
+        command = [FFMPEG_BINARY, "-loglevel", "error"]
+        if not accurate:
+            command += ["-skip_frame", "nokey"]
+
+            # a little before, so a rounded keyframe time never lands
+            # after the keyframe
+            t = max(0, t - 0.001)
+
+        # seeking before the input jumps to the keyframe instead of
+        # decoding everything before it
+        command += [
+            "-ss",
+            f"{t}",
+            "-i",
+            filepath,
+            "-frames:v",
+            "1",
+            "-vf",
+            f"scale={width}:{height}",
+            "-f",
+            "rawvideo",
+            "-pix_fmt",
+            "rgb24",
+            "-",
+        ]
+        process = sp.run(command, stdout=sp.PIPE, stderr=sp.PIPE)
+        if process.returncode != 0 or len(process.stdout) < width * height * 3:
+            raise IOError(
+                f"Failed to read the frame at {t} of {filepath}: "
+                f"{process.stderr.decode(errors='replace').strip()}"
+            )
+
+        return Image.frombytes(
+            "RGB", (width, height), process.stdout[: width * height * 3]
+        )
+
+
+# shared between all windows of the program
+THUMBNAIL_CACHE = ThumbnailCache()
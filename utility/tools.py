@@ -1,17 +1,17 @@
 """All Utility tools for this project."""
 
 import hashlib
-from os import listdir
-from typing import Any, Callable, Literal
+from contextlib import contextmanager
+from os import getpid, listdir, remove, replace
+from os.path import isfile, splitext
+from threading import get_ident
+from typing import Any, Callable, Iterator, Literal
 from datetime import datetime
 
 from customtkinter import CTkFont
 from pygame import mixer
 from yt_dlp import YoutubeDL
 
-# initialize mixer for method play_voiceover
-mixer.init()
-
 
 def download_youtube_video(url: str, progress_hook: Callable[[dict[str, Any]], None]):
     """Download a youtube video.
@@ -73,6 +73,33 @@ def create_hash_content(string: str):
     return content_hash
 
 
+@contextmanager
+def atomic_write(filepath: str) -> Iterator[str]:
+    """Write a file on a temporary filepath, moved over the filepath when done.
+
+    A crash or an error while writing never leaves a half written file
+    behind, the temporary file is removed instead. The temporary filepath
+    is unique to the process and thread, two writers of the same file
+    never share it and the last one to finish wins.
+
+    Args:
+        filepath (str): The filepath of the file.
+
+    Yields:
+        str: The temporary filepath to write on, it keeps the extension
+            for writers like ffmpeg that pick the format from it.
+
+    """
+    root, extension = splitext(filepath)
+    temporary_filepath = f"{root}.{getpid()}-{get_ident()}.tmp{extension}"
+    try:
+        yield temporary_filepath
+        replace(temporary_filepath, filepath)
+    finally:
+        if isfile(temporary_filepath):
+            remove(temporary_filepath)
+
+
 def create_audio_filename(script: str, voice_model_name: str) -> str:
     """Create an audio filename with hash sha256.
 
@@ -122,5 +149,35 @@ def play_voiceover(filepath: str) -> None:
         one works.
 
     """
+    # stop a preview that is still playing its sentences
+    mixer.Channel(0).stop()
+
     mixer.music.load(filepath)
     mixer.music.play()
+
+
+def queue_voiceover_chunk(filepath: str) -> bool:
+    """Play a sentence chunk of the voiceover after the one playing.
+
+    Args:
+        filepath (str): The WAV file of the chunk.
+
+    Returns:
+        bool: `False` if a chunk is already waiting, try again later.
+
+    Notes:
+        The chunks play on their own channel, one right after the other,
+        so the preview starts before the whole voiceover is made.
+
+    """
+    channel = mixer.Channel(0)
+    if channel.get_busy() and channel.get_queue() is not None:
+        return False
+
+    mixer.music.stop()
+    sound = mixer.Sound(filepath)
+    if channel.get_busy():
+        channel.queue(sound)
+    else:
+        channel.play(sound)
+    return True
@@ -26,11 +26,10 @@ from typing import Callable
 from customtkinter import CTkLabel
 from models.config_data import ConfigData
 
-import requests
-
 from os.path import getsize
 
 from models.upload_model import UploadData
+from utility.api_clients import API_CLIENTS
 
 
 def upload_to_facebook(
@@ -53,6 +52,9 @@ def upload_to_facebook(
     # Initialize label state
     label_state.configure(text="Uploading...", text_color="#FFC107")
 
+    # shared session, the upload steps reuse the same connection
+    session = API_CLIENTS.get_http_session()
+
     # unpack important variables
     facebook_token = config_data.api_settings.facebook_token
     facebook_page_id = config_data.api_settings.facebook_page
@@ -63,7 +65,7 @@ def upload_to_facebook(
     url = f"https://graph.facebook.com/v22.0/{facebook_page_id}/video_reels"
     data = {"upload_phase": "START", "access_token": facebook_token}
     headers = {"Content-Type": "application/json"}
-    response = requests.post(url, json=data, headers=headers)
+    response = session.post(url, json=data, headers=headers)
 
     if response.status_code != 200:
         done_callback(
@@ -93,7 +95,7 @@ def upload_to_facebook(
         "file_size": str(file_size),
     }
 
-    response = requests.post(url=upload_url, headers=headers, data=binary_data)
+    response = session.post(url=upload_url, headers=headers, data=binary_data)
 
     if response.status_code != 200:
         done_callback(
@@ -115,7 +117,7 @@ def upload_to_facebook(
         url = f"https://graph.facebook.com/v22.0/{video_id}"
         params = {"access_token": facebook_token, "fields": "status"}
 
-        response = requests.get(url, params=params)
+        response = session.get(url, params=params)
 
         if response.status_code != 200:
             done_callback(
@@ -156,7 +158,7 @@ def upload_to_facebook(
                 "publish": "true",
                 "description": upload_data.description + "\n" + upload_data.hashtags,
             }
-            response = requests.post(url, params=parameters)
+            response = session.post(url, params=parameters)
 
             if response.status_code != 200:
                 done_callback(
@@ -1,8 +1,12 @@
 """All API for generating the video."""
 
+import logging
+from dataclasses import dataclass, replace
+from math import ceil
 from os import listdir
-from os.path import isfile, join
-from random import uniform
+from os.path import join
+from random import choice
+from typing import Literal
 from PIL import ImageFont, Image
 from moviepy import (
     AudioClip,
@@ -10,15 +14,47 @@ from moviepy import (
     CompositeVideoClip,
     ImageClip,
     TextClip,
+    VideoClip,
     VideoFileClip,
 )
 
 from exceptions.vid_gen_exceptions import NoAudioFileClip, NoVideoFileClip
 from models.config_data import ConfigData
+from utility.cache_manager import CACHE_MANAGER
+from utility.caption_track import CaptionTrack
 from utility.custom_render_logger import CustomMoviepyLogger
+from utility.ffmpeg_encoder import EncoderSettings
 from utility.generate_voice import GenerateVoice
+from utility.keyframe_index import KEYFRAME_INDEX
+from utility.media_index import MEDIA_INDEX
+from utility.proxy import PROXY_CACHE
+from utility.render_engine import StageStatistics, ThreadedRenderEngine
+from utility.segment_render import SegmentRenderer
 from utility.tools import create_audio_filename, create_video_filename
 
+LOGGER = logging.getLogger(__name__)
+
+
+@dataclass
+class DraftSettings:
+    """The quality of a draft render, for quick previews.
+
+    Attributes:
+        scale (float): The scale of the resolution, 0.5 is half.
+        fps (float): The frames per second of the draft.
+        preset (str): The x264 preset of the draft.
+        start (float): The time in seconds the draft starts.
+        end (float | None): The time in seconds the draft ends,
+            `None` for the end of the video.
+
+    """
+
+    scale: float = 0.5
+    fps: float = 15
+    preset: Literal["ultrafast", "superfast", "veryfast"] = "ultrafast"
+    start: float = 0
+    end: float | None = None
+
 
 class VidGen:
     """The object to reuse and edit the video before rendering.
@@ -26,11 +62,20 @@ class VidGen:
     Attributes:
         video_width (int): The width of the video.
         video_height (int): The height of the video.
+        fps (int): The frames per second of the rendered video.
+        encoder_settings (EncoderSettings): The x264 threads, preset, crf
+            and tune of the threaded and segments render engines.
+        render_workers (int | None): The worker processes of the segments
+            render engine, `None` for one per core.
+        stream_copy_background (bool): Copy the randomized part of the
+            background into its own file instead of seeking in the clip.
         center_position_x (float): The x position of the text.
         center_position_y (float): The y position of the text.
         font_size (int): The font size of the text.
         font (str): The font path of the text.
         font_object (ImageFont.FreeTypeFont): The font object of the text.
+        render_statistics (list[StageStatistics]): The throughput of each
+            stage of the last threaded render.
 
     Methods:
         load_background_video(filepath: str): Lazily load the video into moviepy.
@@ -43,11 +88,14 @@ class VidGen:
             Add text clip to Vidgen.
         add_image_clip(image_clip: ImageClip | list[ImageClip]):
             Add image clip to Vidgen.
+        add_caption_track(caption_track: CaptionTrack):
+            Add caption track to Vidgen.
         add_audio(audio_clip: AudioFileClip | list[AudioFileClip]):
             Add audio clip to Vidgen.
         add_solo_voiceover(audio_clip: AudioClip): Add audio clip to Vidgen.
         get_video_filepath: Get video filepath.
-        render(custom_callback: CustomMoviepyLogger): Render the the clips into video.
+        render(custom_callback: CustomMoviepyLogger, render_engine: str,
+            draft: DraftSettings | None): Render the the clips into video.
         reset: Reset the Vidgen.
         close: Free self from memory.
 
@@ -61,10 +109,19 @@ class VidGen:
 
         """
         # video properties
-        self._video_file_clip: VideoFileClip | None = None
-        self._original_video_file_clip: VideoFileClip | None = None
+        self._video_file_clip: VideoClip | None = None
+        self._original_video_file_clip: VideoClip | None = None
+        self._background_start: float = 0
+        self._source_filepath: str = ""
+        # the workers and the draft reopen a proxy by its filename, a clip
+        # that is not one is fitted in moviepy instead
+        self._is_proxy_loaded: bool = False
         self.video_height: int = 1920
         self.video_width: int = 1080
+        self.fps: int = 30
+        self.encoder_settings: EncoderSettings = EncoderSettings(preset="fast")
+        self.render_workers: int | None = None
+        self.stream_copy_background: bool = False
 
         # text positioning
         self.center_position_x: float = self.video_width // 2
@@ -81,8 +138,12 @@ class VidGen:
         # clips
         self._text_clips: list[TextClip] = []
         self._audio_clips: list[AudioClip] = []
-        self._solo_voiceover: AudioClip
+        self._solo_voiceover: AudioClip | None = None
         self._image_clips: list[ImageClip] = []
+        self._caption_tracks: list[CaptionTrack] = []
+
+        # throughput of each stage of the last threaded render
+        self.render_statistics: list[StageStatistics] = []
 
     def load_background_video(self, filepath: str):
         """Lazily Load the video into moviepy.
@@ -90,12 +151,52 @@ class VidGen:
         Args:
             filepath (str): The filepath of the video.
 
+        Notes:
+            The render-ready proxy of the video is loaded instead
+            when it was already transcoded. Otherwise the video is scaled
+            and cropped the same way its proxy is, so the render looks the
+            same whether the proxy was ready or not.
+
         """
-        self._video_file_clip = VideoFileClip(filepath)
+        self._source_filepath = filepath
+        proxy_filepath = PROXY_CACHE.get_proxy(filepath)
+        self._is_proxy_loaded = proxy_filepath is not None
+        self._video_file_clip = (
+            VideoFileClip(proxy_filepath)
+            if proxy_filepath is not None
+            else self._open_fitted(filepath)
+        )
+        self._background_start = 0
 
         # create a copy of the original
         self._original_video_file_clip = self._video_file_clip.copy()
 
+    def _open_fitted(self, filepath: str, audio: bool = True) -> VideoClip:
+        """Open a video scaled to cover the video size and cropped at the center.
+
+        It is the framing of the proxies, ffmpeg scales the frames while
+        decoding and only the crop is done in moviepy.
+        """
+        metadata = MEDIA_INDEX.get_metadata(filepath)
+        scale = max(
+            self.video_width / metadata.width, self.video_height / metadata.height
+        )
+        width = max(self.video_width, round(metadata.width * scale))
+        height = max(self.video_height, round(metadata.height * scale))
+
+        fitted = VideoFileClip(
+            filepath, audio=audio, target_resolution=(width, height)
+        ).cropped(
+            x_center=width // 2,
+            y_center=height // 2,
+            width=self.video_width,
+            height=self.video_height,
+        )
+
+        # cropped returns a copy of the clip, typed as any clip
+        assert isinstance(fitted, VideoClip)
+        return fitted
+
     def randomize_clip_position(self, script: str, config_data: ConfigData):
         """Randomize the position of the clip.
 
@@ -107,7 +208,8 @@ class VidGen:
 
         Raises:
             NoVideoFileClip: If the video is not loaded.
-            NoAudioFileClip: If the audio is not generated yet.
+            NoAudioFileClip: If the audio is not generated yet and failed
+                to generate.
 
         """
         # check if video is loaded
@@ -115,8 +217,11 @@ class VidGen:
             raise NoVideoFileClip
 
         # calculate the random position
-        # get the duration of the background video
-        clip_duration = self._original_video_file_clip.duration
+        # get the duration of the background video from the index,
+        # no new ffmpeg reader is opened for it
+        clip_duration = MEDIA_INDEX.get_metadata(
+            self._original_video_file_clip.filename
+        ).duration
 
         # check if audio clip is generated
         if not self._audio_clips:
@@ -125,12 +230,15 @@ class VidGen:
             )
 
             # check if exists
-            if not isfile(filename):
+            if not CACHE_MANAGER.lookup(filename):
                 # generate voiceover if no generated yet
                 generate_voice = GenerateVoice(script=script, config_data=config_data)
-                generated = generate_voice.generate()
-                if not generated:
-                    raise NoAudioFileClip
+                try:
+                    generate_voice.generate()
+                except Exception as exc:
+                    raise NoAudioFileClip(
+                        f"Failed to generate the voiceover: {exc}"
+                    ) from exc
 
             audio_clip = AudioFileClip(filename)
             self._audio_clips.append(audio_clip)
@@ -144,13 +252,36 @@ class VidGen:
 
         max_start_time = clip_duration - audio_duration
 
-        # get the random clip position
-        random_clip_start_time = uniform(0, max_start_time)
+        # get the random clip position, only on keyframes so seeking
+        # there does not decode frames that are thrown away
+        keyframes = KEYFRAME_INDEX.get_keyframes(
+            self._original_video_file_clip.filename
+        )
+        random_clip_start_time = choice(
+            [keyframe for keyframe in keyframes if keyframe <= max_start_time] or [0]
+        )
+
+        if self.stream_copy_background:
+            # the part is copied without encoding, the render reads it
+            # from its start
+            extract_filepath = KEYFRAME_INDEX.extract_segment(
+                self._original_video_file_clip.filename,
+                start=random_clip_start_time,
+                duration=audio_duration + 1,
+            )
+            self._video_file_clip = (
+                VideoFileClip(extract_filepath, audio=False)
+                if self._is_proxy_loaded
+                else self._open_fitted(extract_filepath, audio=False)
+            )
+            self._background_start = 0
+            return
 
         # apply to the video file clip
         self._video_file_clip = self._original_video_file_clip.subclipped(
             random_clip_start_time, random_clip_start_time + audio_duration
         )
+        self._background_start = random_clip_start_time
 
     def is_background_video_loaded(self) -> bool:
         """Check if the video is loaded."""
@@ -232,50 +363,209 @@ class VidGen:
             else self._image_clips.extend(image_clip)
         )
 
+    def add_caption_track(self, caption_track: CaptionTrack) -> None:
+        """Add caption track to Vidgen.
+
+        Notes:
+            Caption tracks are layered on top of the text clips.
+
+        """
+        self._caption_tracks.append(caption_track)
+
     def get_video_filepath(self) -> str:
         """Get video filepath."""
+        # named after the original clip, not the proxy
         return (
-            create_video_filename(self._video_file_clip.filename)
+            create_video_filename(self._source_filepath)
             if self._video_file_clip
             else ""
         )
 
-    def render(self, custom_callback: CustomMoviepyLogger) -> None:
+    def render(
+        self,
+        custom_callback: CustomMoviepyLogger,
+        render_engine: Literal["threaded", "segments", "moviepy"] = "threaded",
+        draft: DraftSettings | None = None,
+    ) -> None:
         """Render the the clips into video.
 
         Args:
             custom_callback (Callable[[str, str], None]): A callable function
                 for rendering process.
+            render_engine (Literal["threaded", "segments", "moviepy"]): The
+                threaded engine decodes, composites and pipes the frames to
+                ffmpeg on separate threads with `encoder_settings`, segments
+                runs the threaded engine on `render_workers` processes, each
+                on a part of the timeline, moviepy does everything on
+                `write_videofile`. Segments needs the proxy of the clip
+                and no image or text clips, otherwise a warning is logged
+                and the threaded engine renders instead.
+            draft (DraftSettings | None): Render a quick low quality preview
+                instead, always with the threaded engine.
+
+        Raises:
+            NoVideoFileClip: If the background video is not loaded.
+            NoAudioFileClip: If the voiceover was not added.
 
         Notes:
             `custom_callback` takes 2 integer parameters,
             `current_frame` and `total_frame`
 
         """
+        if self._video_file_clip is None:
+            raise NoVideoFileClip("Load a background video before rendering.")
+        if self._solo_voiceover is None:
+            raise NoAudioFileClip("Add the voiceover before rendering.")
+        background = self._video_file_clip
+        voiceover = self._solo_voiceover
+
         # add clips
         # Notes:
         #    Clips must be added as layered on top of each other when
         #    bottom_clip + bottom_clip + bottom_clip + top_level_clip
-        final_clip = CompositeVideoClip(
-            clips=[self._video_file_clip] + self._image_clips + self._text_clips
-        )
+        final_clip: VideoClip = background
+        if self._image_clips or self._text_clips:
+            final_clip = CompositeVideoClip(
+                clips=[final_clip] + self._image_clips + self._text_clips
+            )
 
-        video_duration = self._solo_voiceover.duration + 1
+        video_duration = voiceover.duration + 1
+        filename = self.get_video_filepath()
+
+        if draft is not None:
+            self._render_draft(
+                draft=draft,
+                clip=final_clip,
+                audio_filename=voiceover.filename,
+                duration=video_duration,
+                filename=filename.replace(".mp4", "-draft.mp4"),
+                custom_callback=custom_callback,
+            )
+            return
+
+        # the workers read the background file on their own, image and
+        # text clips can not be sent to them
+        if render_engine == "segments":
+            if final_clip is not background:
+                LOGGER.warning(
+                    "The segments engine can not render image or text clips, "
+                    "rendering on the threaded engine instead."
+                )
+                render_engine = "threaded"
+            elif not self._is_proxy_loaded:
+                LOGGER.warning(
+                    "The proxy of %s is not ready for the segments engine, "
+                    "rendering on the threaded engine instead.",
+                    self._source_filepath,
+                )
+                render_engine = "threaded"
+
+        if render_engine == "segments":
+            segment_renderer = SegmentRenderer(
+                background_filename=background.filename,
+                background_start=self._background_start,
+                caption_tracks=self._caption_tracks,
+                audio_filename=voiceover.filename,
+                duration=video_duration,
+                fps=self.fps,
+                encoder_settings=self.encoder_settings,
+                workers=self.render_workers,
+            )
+            segment_renderer.render(filename, logger=custom_callback)
+            return
+
+        # the threaded engine blends the captions on its own stage
+        if render_engine == "threaded":
+            # ffmpeg reads the voiceover file directly, no temporary audio
+            engine = ThreadedRenderEngine(
+                clip=final_clip,
+                caption_tracks=self._caption_tracks,
+                audio_filename=voiceover.filename,
+                duration=video_duration,
+                fps=self.fps,
+                encoder_settings=self.encoder_settings,
+            )
+            engine.render(filename, logger=custom_callback)
+            self.render_statistics = list(engine.stage_statistics.values())
+            return
+
+        # captions are blended directly into the frame, only on the
+        # bounding boxes of the active captions
+        for caption_track in self._caption_tracks:
+            final_clip = caption_track.apply_to(final_clip)
 
         # set audio
         final_clip = final_clip.with_duration(video_duration)
-        final_clip = final_clip.with_audio(self._solo_voiceover)
+        final_clip = final_clip.with_audio(voiceover)
 
         # render
-        filename = self.get_video_filepath()
         final_clip.write_videofile(
             filename,
-            fps=30,
+            fps=self.fps,
             audio_codec="aac",
             preset="fast",
             logger=custom_callback,
         )
 
+    def _render_draft(
+        self,
+        draft: DraftSettings,
+        clip: VideoClip,
+        audio_filename: str,
+        duration: float,
+        filename: str,
+        custom_callback: CustomMoviepyLogger,
+    ) -> None:
+        """Render a low quality preview of a time window of the video.
+
+        The captions are the same caption tracks of the final render,
+        scaled down, so the draft shows the exact same layout.
+        """
+        start = draft.start
+        end = min(draft.end, duration) if draft.end is not None else duration
+
+        # even sizes, x264 needs them for yuv420p
+        width, height = clip.size
+        size = (
+            round(width * draft.scale / 2) * 2,
+            round(height * draft.scale / 2) * 2,
+        )
+        scale = size[0] / width
+
+        # let ffmpeg decode the background directly at the draft size
+        if (
+            clip is self._video_file_clip
+            and isinstance(clip, VideoFileClip)
+            and self._is_proxy_loaded
+        ):
+            background = VideoFileClip(
+                clip.filename, audio=False, target_resolution=size
+            ).subclipped(self._background_start)
+        else:
+            background = clip.resized(new_size=size)
+
+        # both return a copy of the clip, typed as any clip
+        assert isinstance(background, VideoClip)
+        clip = background
+
+        caption_tracks = [
+            caption_track.get_slice(start, end).get_scaled(scale)
+            for caption_track in self._caption_tracks
+        ]
+
+        engine = ThreadedRenderEngine(
+            clip=clip,
+            caption_tracks=caption_tracks,
+            audio_filename=audio_filename,
+            duration=duration,
+            fps=draft.fps,
+            encoder_settings=replace(self.encoder_settings, preset=draft.preset),
+            frame_range=(ceil(start * draft.fps), ceil(end * draft.fps)),
+            audio_start=start,
+        )
+        engine.render(filename, logger=custom_callback)
+        self.render_statistics = list(engine.stage_statistics.values())
+
     def reset(self) -> None:
         """Reset Vidgen.
 
@@ -284,6 +574,7 @@ class VidGen:
         self._text_clips.clear()
         self._audio_clips.clear()
         self._image_clips.clear()
+        self._caption_tracks.clear()
 
     def close(self) -> None:
         """Free self from memory."""
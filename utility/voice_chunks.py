@@ -0,0 +1,234 @@
+"""Sentence chunks of the voiceover.
+
+The voiceover used to be one text to speech request for the whole
+script, so a longer script waited longer and editing a single sentence
+made everything again. Here the script is split into sentences that are
+made on their own and cached by sentence and voice model. The chunks are
+raw PCM, so they are stitched with sample-accurate offsets, and where
+each sentence starts and ends is kept next to the voiceover for the
+word timings.
+"""
+
+import json
+import re
+import subprocess as sp
+import wave
+from dataclasses import dataclass, field
+from os.path import join
+from typing import Any
+
+import numpy as np
+from moviepy.config import FFMPEG_BINARY
+
+from utility.cache_manager import CACHE_MANAGER
+from utility.tools import atomic_write, create_hash_content
+from utility.word_aligner import read_samples
+
+# the sample rate the chunks are requested and stitched at
+CHUNK_SAMPLE_RATE = 24000
+
+CHUNK_DIRECTORY = "cache/voice_chunks/"
+
+_SENTENCE_BREAK = re.compile(r"(?<=[.!?])[\"')\]]*\s+")
+
+
+@dataclass
+class VoiceChunk:
+    """A sentence chunk of the voiceover that is ready.
+
+    Attributes:
+        index (int): The position of the sentence in the script.
+        text (str): The sentence.
+        filename (str): The WAV file of the sentence.
+        words (list[dict[str, Any]]): The timings of its words in the
+            voiceover, empty unless they are aligned locally.
+
+    """
+
+    index: int
+    text: str
+    filename: str
+    words: list[dict[str, Any]] = field(default_factory=list)
+
+
+def split_sentences(script: str) -> list[str]:
+    """Split a script into its sentences.
+
+    Args:
+        script (str): The script of the voiceover.
+
+    Returns:
+        list[str]: The sentences, their words are the words of the script.
+
+    """
+    sentences = []
+    position = 0
+    for match in _SENTENCE_BREAK.finditer(script):
+        sentences.append(script[position : match.end()].strip())
+        position = match.end()
+    sentences.append(script[position:].strip())
+    return [sentence for sentence in sentences if sentence]
+
+
+def create_chunk_filename(sentence: str, voice_model_name: str) -> str:
+    """Get the cache filepath of a sentence chunk.
+
+    Args:
+        sentence (str): The sentence.
+        voice_model_name (str): The deepgram voice model name.
+
+    Returns:
+        str: The generated filepath.
+
+    """
+    key = json.dumps({"sentence": sentence, "voice_model": voice_model_name})
+    return join(CHUNK_DIRECTORY, f"chunk_{create_hash_content(key)}.wav")
+
+
+def get_chunk_duration(chunk_filename: str) -> float:
+    """Get the length of a sentence chunk in seconds, exact to the sample."""
+    with wave.open(chunk_filename, "rb") as file:
+        return file.getnframes() / file.getframerate()
+
+
+def get_boundaries_filename(audio_filename: str) -> str:
+    """Get the filepath of the sentence boundaries of a voiceover."""
+    return audio_filename.rsplit(".", 1)[0] + ".json"
+
+
+def get_words_filename(audio_filename: str) -> str:
+    """Get the filepath of the word timings of a voiceover."""
+    return audio_filename.rsplit(".", 1)[0] + ".words.json"
+
+
+def stitch_chunks(
+    sentences: list[str],
+    chunk_filenames: list[str],
+    audio_filename: str,
+    words: list[dict[str, Any]] | None = None,
+) -> list[dict[str, Any]]:
+    """Stitch the sentence chunks into the voiceover.
+
+    Args:
+        sentences (list[str]): The sentences, in order.
+        chunk_filenames (list[str]): The chunk of each sentence.
+        audio_filename (str): The voiceover file to write, as mp3.
+        words (list[dict[str, Any]] | None): The word timings aligned on
+            the chunks, saved next to the voiceover when given.
+
+    Returns:
+        list[dict[str, Any]]: The `text`, `start` and `end` of each
+            sentence in the voiceover, also saved next to it.
+
+    Raises:
+        IOError: If ffmpeg failed to decode a chunk or encode the voiceover.
+
+    """
+    chunks = [
+        read_samples(chunk_filename, CHUNK_SAMPLE_RATE)
+        for chunk_filename in chunk_filenames
+    ]
+
+    # the offsets are counted in samples, not rounded seconds
+    offsets = np.concatenate(([0], np.cumsum([len(chunk) for chunk in chunks])))
+    boundaries = [
+        {
+            "text": sentence,
+            "start": int(start) / CHUNK_SAMPLE_RATE,
+            "end": int(end) / CHUNK_SAMPLE_RATE,
+        }
+        for sentence, start, end in zip(sentences, offsets[:-1], offsets[1:])
+    ]
+
+    samples = np.concatenate(chunks) if chunks else np.zeros(0, dtype=np.float32)
+    pcm = (np.clip(samples, -1, 1) * 32767).astype(np.int16)
+
+    # the voiceover is moved last, it is only found with its boundaries
+    boundaries_filename = get_boundaries_filename(audio_filename)
+    with atomic_write(audio_filename) as temporary_filename:
+        command = [
+            FFMPEG_BINARY,
+            "-y",
+            "-loglevel",
+            "error",
+            "-f",
+            "s16le",
+            "-ar",
+            str(CHUNK_SAMPLE_RATE),
+            "-ac",
+            "1",
+            "-i",
+            "-",
+            "-c:a",
+            "libmp3lame",
+            "-b:a",
+            "128k",
+            temporary_filename,
+        ]
+        process = sp.run(
+            command, input=pcm.tobytes(), stdout=sp.DEVNULL, stderr=sp.PIPE
+        )
+        if process.returncode != 0:
+            raise IOError(
+                f"ffmpeg failed to encode {audio_filename}: "
+                f"{process.stderr.decode(errors='replace').strip()}"
+            )
+
+        with atomic_write(boundaries_filename) as temporary_boundaries_filename:
+            with open(temporary_boundaries_filename, "w", encoding="utf-8") as file:
+                json.dump(boundaries, file)
+
+        if words is not None:
+            with atomic_write(get_words_filename(audio_filename)) as temporary_words:
+                with open(temporary_words, "w", encoding="utf-8") as file:
+                    json.dump(words, file)
+
+    CACHE_MANAGER.store(boundaries_filename)
+    if words is not None:
+        CACHE_MANAGER.store(get_words_filename(audio_filename))
+    return boundaries
+
+
+def load_boundaries(audio_filename: str) -> list[dict[str, Any]] | None:
+    """Load the sentence boundaries of a voiceover.
+
+    Args:
+        audio_filename (str): The voiceover file.
+
+    Returns:
+        list[dict[str, Any]] | None: The `text`, `start` and `end` of each
+            sentence, `None` if the voiceover was not made from chunks.
+
+    """
+    boundaries_filename = get_boundaries_filename(audio_filename)
+    if not CACHE_MANAGER.lookup(boundaries_filename):
+        return None
+
+    try:
+        with open(boundaries_filename, "r", encoding="utf-8") as file:
+            return json.load(file)
+    except (OSError, ValueError):
+        return None
+
+
+def load_words(audio_filename: str) -> list[dict[str, Any]] | None:
+    """Load the word timings aligned while the voiceover was made.
+
+    Args:
+        audio_filename (str): The voiceover file.
+
+    Returns:
+        list[dict[str, Any]] | None: The words with their `word`,
+            `punctuated_word`, `start` and `end`, `None` if they were not
+            aligned on the chunks.
+
+    """
+    words_filename = get_words_filename(audio_filename)
+    if not CACHE_MANAGER.lookup(words_filename):
+        return None
+
+    try:
+        with open(words_filename, "r", encoding="utf-8") as file:
+            return json.load(file)
+    except (OSError, ValueError):
+        return None
@@ -0,0 +1,356 @@
+"""Local word timings from the known script and the voiceover audio.
+
+The script sent to text to speech is already known, only the timings of
+its words are missing. Uploading the voiceover to a speech to text model
+to get them back is a network round trip per render. Here the audio is
+decoded once and its energy envelope gives where the voice is active.
+The pauses found in it are matched to the word boundaries, preferring
+the ones after punctuation, and the words between two pauses share the
+spoken time by their syllable count.
+"""
+
+import re
+import subprocess as sp
+from typing import Any
+
+import numpy as np
+from moviepy.config import FFMPEG_BINARY
+
+# the audio is analyzed at this rate, enough for the voice envelope
+SAMPLE_RATE = 16000
+
+# length of an energy frame in seconds, it is the timing resolution
+FRAME_SECONDS = 0.01
+
+# silences shorter than this are gaps inside or between words
+MIN_PAUSE_SECONDS = 0.12
+
+# where the voice threshold is between the noise floor and the voice level
+VOICE_THRESHOLD = 0.3
+
+# every word takes some time besides its syllables
+WORD_BASE_WEIGHT = 0.4
+
+# matching a pause after punctuation costs less than after a plain word
+PAUSE_COST_FACTORS = {".": 0.25, "!": 0.25, "?": 0.25, ",": 0.5, ";": 0.5, ":": 0.5}
+
+# cost of a pause not matched to any word boundary, a hesitation
+SKIPPED_PAUSE_COST = 0.04
+
+_VOWEL_GROUPS = re.compile(r"[aeiouy]+")
+
+
+def read_samples(filepath: str, sample_rate: int = SAMPLE_RATE) -> np.ndarray:
+    """Decode an audio file as mono float samples.
+
+    Args:
+        filepath (str): The audio file.
+        sample_rate (int): The sample rate to decode at.
+
+    Returns:
+        np.ndarray: The samples as float32, range -1 to 1.
+
+    Raises:
+        IOError: If ffmpeg failed to decode the file.
+
+    """
+    command = [
+        FFMPEG_BINARY,
+        "-loglevel",
+        "error",
+        "-i",
+        filepath,
+        "-ac",
+        "1",
+        "-ar",
+        str(sample_rate),
+        "-f",
+        "s16le",
+        "-",
+    ]
+    process = sp.run(command, stdout=sp.PIPE, stderr=sp.PIPE)
+    if process.returncode != 0:
+        raise IOError(
+            f"ffmpeg failed to decode {filepath}: "
+            f"{process.stderr.decode(errors='replace').strip()}"
+        )
+
+    return np.frombuffer(process.stdout, dtype=np.int16).astype(np.float32) / 32768
+
+
+def get_voice_activity(samples: np.ndarray, sample_rate: int) -> np.ndarray:
+    """Get which energy frames have voice in them.
+
+    Args:
+        samples (np.ndarray): The mono samples.
+        sample_rate (int): The sample rate of the samples.
+
+    Returns:
+        np.ndarray: A bool per frame of `FRAME_SECONDS`.
+
+    """
+    hop = max(1, int(sample_rate * FRAME_SECONDS))
+    frame_count = len(samples) // hop
+    if frame_count == 0:
+        return np.zeros(0, dtype=bool)
+
+    frames = samples[: frame_count * hop].reshape(frame_count, hop)
+    energy = 10 * np.log10(np.mean(np.square(frames), axis=1) + 1e-10)
+
+    # smooth over 50 ms so the dips between syllables are not pauses,
+    # padded with the edges since zeros would be loud in decibels
+    energy = np.convolve(np.pad(energy, 2, mode="edge"), np.ones(5) / 5, mode="valid")
+
+    noise_floor, voice_level = np.percentile(energy, [10, 95])
+    if voice_level - noise_floor < 6:
+        # no clear voice over the noise, like a silent file
+        return np.ones(frame_count, dtype=bool)
+
+    return energy > noise_floor + (voice_level - noise_floor) * VOICE_THRESHOLD
+
+
+def get_pauses(voice_activity: np.ndarray) -> list[tuple[int, int]]:
+    """Get the pauses between the first and the last voice frames.
+
+    Args:
+        voice_activity (np.ndarray): A bool per frame.
+
+    Returns:
+        list[tuple[int, int]]: The first and after last frame of each pause.
+
+    """
+    edges = np.diff(np.concatenate(([1], voice_activity.astype(np.int8), [1])))
+    starts = np.flatnonzero(edges == -1)
+    ends = np.flatnonzero(edges == 1)
+
+    min_frames = round(MIN_PAUSE_SECONDS / FRAME_SECONDS)
+    return [
+        (int(start), int(end))
+        for start, end in zip(starts, ends)
+        # the silence before and after the voice is not a pause
+        if start > 0 and end < len(voice_activity) and end - start >= min_frames
+    ]
+
+
+def split_script(script: str) -> list[tuple[str, str]]:
+    """Split the script into words like the speech to text model does.
+
+    Args:
+        script (str): The script of the voiceover.
+
+    Returns:
+        list[tuple[str, str]]: The lowercase word without punctuation and
+            the word as written.
+
+    """
+    words = []
+    for punctuated_word in script.split():
+        word = re.sub(r"[^\w']", "", punctuated_word.lower()).strip("'")
+        if word:
+            words.append((word, punctuated_word))
+    return words
+
+
+def count_syllables(word: str) -> int:
+    """Guess the syllables of a word from its vowel groups.
+
+    Args:
+        word (str): The lowercase word.
+
+    Returns:
+        int: The syllable count, at least one.
+
+    """
+    # numbers are read digit group by digit group, about one each
+    digits = sum(character.isdigit() for character in word)
+    syllables = len(_VOWEL_GROUPS.findall(word)) + digits
+
+    # silent e, like "time" but not "little"
+    if syllables > 1 and word.endswith("e") and not word.endswith("le"):
+        syllables -= 1
+    return max(1, syllables)
+
+
+def _match_pauses(
+    boundary_positions: np.ndarray,
+    boundary_factors: np.ndarray,
+    pause_positions: np.ndarray,
+) -> list[int]:
+    """Match the pauses to word boundaries, in order.
+
+    Args:
+        boundary_positions (np.ndarray): The expected voiced time of each
+            word boundary, as a fraction of the whole.
+        boundary_factors (np.ndarray): The cost factor of each boundary
+            from the punctuation before it.
+        pause_positions (np.ndarray): The voiced time before each pause,
+            as a fraction of the whole.
+
+    Returns:
+        list[int]: The boundary of each pause, -1 if it is skipped.
+
+    """
+    boundary_count = len(boundary_positions)
+
+    # costs[k] is the lowest cost of the pauses so far with every matched
+    # boundary before k, the choices are kept to walk back the best path
+    costs = np.zeros(boundary_count + 1)
+    choices = []
+    for pause_position in pause_positions:
+        match_costs = costs[:-1] + (
+            np.abs(boundary_positions - pause_position) * boundary_factors
+        )
+        # best boundary before k for every k
+        best_indexes = np.zeros(boundary_count + 1, dtype=np.int64)
+        best_costs = np.full(boundary_count + 1, np.inf)
+        if boundary_count:
+            running_indexes = np.arange(boundary_count)
+            running_costs = np.minimum.accumulate(match_costs)
+            is_new_best = match_costs <= running_costs
+            running_indexes = np.maximum.accumulate(
+                np.where(is_new_best, running_indexes, 0)
+            )
+            best_costs[1:] = running_costs
+            best_indexes[1:] = running_indexes
+
+        skip_costs = costs + SKIPPED_PAUSE_COST
+        is_matched = best_costs < skip_costs
+        costs = np.where(is_matched, best_costs, skip_costs)
+        choices.append(np.where(is_matched, best_indexes, -1))
+
+    # walk back from the end
+    matches = []
+    limit = boundary_count
+    for choice in reversed(choices):
+        boundary = int(choice[limit])
+        matches.append(boundary)
+        if boundary >= 0:
+            limit = boundary
+    return matches[::-1]
+
+
+def align_samples(
+    words: list[tuple[str, str]],
+    samples: np.ndarray,
+    sample_rate: int = SAMPLE_RATE,
+    offset: float = 0,
+) -> list[dict[str, Any]]:
+    """Get the timings of known words in decoded audio.
+
+    Args:
+        words (list[tuple[str, str]]): The words from `split_script`.
+        samples (np.ndarray): The mono samples of the voiceover.
+        sample_rate (int): The sample rate of the samples.
+        offset (float): Seconds added to every timing, for audio that
+            starts later in the voiceover.
+
+    Returns:
+        list[dict[str, Any]]: The words with their `word`, `punctuated_word`,
+            `start` and `end`, like the words of a transcript.
+
+    """
+    if not words:
+        return []
+
+    voice_activity = get_voice_activity(samples, sample_rate)
+    if not voice_activity.any():
+        voice_activity = np.ones(max(1, len(voice_activity)), dtype=bool)
+
+    voiced_frames = np.flatnonzero(voice_activity)
+    first_frame, last_frame = int(voiced_frames[0]), int(voiced_frames[-1]) + 1
+
+    # the words are spread on voiced time, so they skip the silences
+    cumulative_voiced = np.concatenate(([0], np.cumsum(voice_activity)))
+    total_voiced = float(cumulative_voiced[-1])
+
+    weights = np.array(
+        [count_syllables(word) + WORD_BASE_WEIGHT for word, _ in words], dtype=float
+    )
+    boundary_positions = np.cumsum(weights)[:-1] / weights.sum()
+    boundary_factors = np.array(
+        [
+            PAUSE_COST_FACTORS.get(punctuated_word.rstrip("\"')]")[-1:], 1.0)
+            for _, punctuated_word in words[:-1]
+        ]
+    )
+
+    pauses = get_pauses(voice_activity)
+    pause_positions = np.array(
+        [cumulative_voiced[start] / total_voiced for start, _ in pauses]
+    )
+    matches = _match_pauses(boundary_positions, boundary_factors, pause_positions)
+
+    # the groups of words between the matched pauses, with their frames
+    groups = []
+    group_start_word, group_start_frame = 0, first_frame
+    for (pause_start, pause_end), boundary in zip(pauses, matches):
+        if boundary < 0:
+            continue
+        groups.append((group_start_word, boundary + 1, group_start_frame, pause_start))
+        group_start_word, group_start_frame = boundary + 1, pause_end
+    groups.append((group_start_word, len(words), group_start_frame, last_frame))
+
+    starts = np.zeros(len(words))
+    ends = np.zeros(len(words))
+    for first_word, after_last_word, start_frame, end_frame in groups:
+        group_weights = weights[first_word:after_last_word]
+        fractions = np.concatenate(([0], np.cumsum(group_weights))) / (
+            group_weights.sum()
+        )
+
+        # voiced time of each word edge, back to frames
+        voiced_start = cumulative_voiced[start_frame]
+        voiced_end = cumulative_voiced[end_frame]
+        edge_frames = np.searchsorted(
+            cumulative_voiced, voiced_start + fractions * (voiced_end - voiced_start)
+        )
+        edge_frames = np.clip(edge_frames, start_frame, end_frame)
+        edge_frames[0], edge_frames[-1] = start_frame, end_frame
+
+        starts[first_word:after_last_word] = edge_frames[:-1] * FRAME_SECONDS
+        ends[first_word:after_last_word] = edge_frames[1:] * FRAME_SECONDS
+
+    return [
+        {
+            "word": word,
+            "punctuated_word": punctuated_word,
+            "start": round(float(start) + offset, 3),
+            "end": round(float(end) + offset, 3),
+        }
+        for (word, punctuated_word), start, end in zip(words, starts, ends)
+    ]
+
+
+def align_words(
+    script: str,
+    filepath: str,
+    boundaries: list[dict[str, Any]] | None = None,
+) -> list[dict[str, Any]]:
+    """Get the timings of the words of a script in its voiceover.
+
+    Args:
+        script (str): The script the voiceover was made from.
+        filepath (str): The voiceover audio file.
+        boundaries (list[dict[str, Any]] | None): The `text`, `start` and
+            `end` of each sentence when the voiceover was stitched from
+            sentence chunks, `None` to align the whole audio at once.
+
+    Returns:
+        list[dict[str, Any]]: The words with their `word`, `punctuated_word`,
+            `start` and `end`, like the words of a transcript.
+
+    """
+    samples = read_samples(filepath)
+    if not boundaries:
+        return align_samples(split_script(script), samples)
+
+    words = []
+    for boundary in boundaries:
+        start_sample = round(boundary["start"] * SAMPLE_RATE)
+        end_sample = round(boundary["end"] * SAMPLE_RATE)
+        words += align_samples(
+            split_script(boundary["text"]),
+            samples[start_sample:end_sample],
+            offset=start_sample / SAMPLE_RATE,
+        )
+    return words